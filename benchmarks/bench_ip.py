@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+# End to end benchmark of the IP path against the simulated device in
+# lpsim.py: discovery time, status poll rate and latency, and upgrade
+# throughput, for a few network conditions.  Needs the ports 5667 and 4069
+# on 127.0.0.1 to be free.
+#
+# Usage: python3 benchmarks/bench_ip.py [--seconds S] [--upgrade-size BYTES]
+
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lpmidimon"))
+
+from discovery import discoverDevices
+from lpdevice import LPDevice
+from upgradestate import UpgradeImage
+from lpsim import UDPSimulator, SimDevice, Impairment
+
+# (label, loss, latency s, jitter s, reorder)
+CONDITIONS = (
+    ("loopback", 0.0, 0.0, 0.0, 0.0),
+    ("5 ms", 0.0, 0.005, 0.001, 0.0),
+    ("1% loss", 0.01, 0.002, 0.0, 0.0),
+    ("5% loss", 0.05, 0.002, 0.0, 0.0),
+    ("10% reorder", 0.0, 0.002, 0.001, 0.1),
+)
+
+def measurePolling(d, seconds):
+    # Returns (status packets per second, poll rate the scheduler measured).
+    d.start()
+    first = d.statusCount
+    started = time.monotonic()
+    time.sleep(seconds)
+    n = d.statusCount - first
+    elapsed = time.monotonic() - started
+    return n / elapsed, d.pollScheduler.getMeasuredRate()
+
+def measureUpgrade(sim, d, size, timeout):
+    # Returns (bytes per second, attempts) or (None, attempts) on failure.
+    image = UpgradeImage("bench.bin", os.urandom(size), (0, 0))
+    before = len(sim.upgrades)
+    started = time.monotonic()
+    d.transport.upgrade(image)
+    while time.monotonic() - started < timeout:
+        ups = sim.upgrades[before:]
+        if len(ups) > 0 and ups[-1].finished != None:
+            return size / (ups[-1].finished - started), len(ups)
+        time.sleep(0.01)
+    return None, len(sim.upgrades) - before
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3.0, help="polling time per condition")
+    parser.add_argument("--upgrade-size", type=int, default=2 * 1024 * 1024)
+    parser.add_argument("--timeout", type=float, default=60.0, help="upgrade timeout")
+    args = parser.parse_args()
+
+    print("{:12s} {:>9s} {:>10s} {:>12s} {:>9s} {:>9s}".format(
+        "condition", "discover", "status/s", "poll rate", "upgrade", "attempts"))
+    for label, loss, latency, jitter, reorder in CONDITIONS:
+        sim = UDPSimulator(SimDevice("LPSIM"),
+                           impairment=Impairment(loss, latency, jitter, reorder, seed=1))
+        sim.start()
+        try:
+            t = time.monotonic()
+            found = discoverDevices(known=["127.0.0.1"], timeout=2.0)
+            discover = time.monotonic() - t
+            if "127.0.0.1 LPSIM" not in found:
+                discover = None
+
+            d = LPDevice("127.0.0.1 LPSIM", "127.0.0.1 LPSIM")
+            rate, pollRate = measurePolling(d, args.seconds)
+            upRate, attempts = measureUpgrade(sim, d, args.upgrade_size, args.timeout)
+            d.stop()
+        finally:
+            sim.stop()
+
+        print("{:12s} {:>9s} {:>10.1f} {:>9.1f} Hz {:>9s} {:>9d}".format(
+            label,
+            "lost" if discover == None else "{:.0f} ms".format(discover * 1000.0),
+            rate, pollRate,
+            "failed" if upRate == None else "{:.0f} KiB/s".format(upRate / 1024.0),
+            attempts))
+
+if __name__ == "__main__":
+    main()
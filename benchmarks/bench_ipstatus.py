@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+# Micro-benchmark of the compact IP status decoder against the original
+# int.from_bytes based parser.
+#
+# Usage: python3 benchmarks/bench_ipstatus.py [iterations]
+
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lpmidimon"))
+
+from lpstatus import LPStatusRecord, LPStatusSnapshot
+
+def makePacket(tracks=8, srate=48000):
+    v = [srate, tracks]
+    v += [4] * tracks                                   # statuses
+    v += [srate * (i + 1) for i in range(tracks)]       # lengths
+    v += [srate // 2 * i for i in range(tracks)]        # positions
+    v += [90 - i for i in range(tracks)]                # levels
+    v += [50] * tracks                                  # pans
+    v += [100] * tracks                                 # feedbacks
+    v += [1 if i == 2 else 0 for i in range(tracks)]    # selected
+    return struct.pack(">" + "I" * len(v), *v)
+
+def legacyParseIPStatus(self, b):
+    srate = int.from_bytes(b[0:4], "big")
+    self.tracks = int.from_bytes(b[4:8], "big")
+
+    bi = 8
+    for i in range(self.tracks):
+        self.statuses.append(int.from_bytes(b[bi:bi+4], "big"))
+        bi += 4
+    for i in range(self.tracks):
+        self.lengths.append(float(int.from_bytes(b[bi:bi+4], "big")) / float(srate))
+        bi += 4
+    for i in range(self.tracks):
+        self.positions.append(float(int.from_bytes(b[bi:bi+4], "big")) / float(srate))
+        bi += 4
+    for i in range(self.tracks):
+        self.levels.append(int.from_bytes(b[bi:bi+4], "big"))
+        bi += 4
+    for i in range(self.tracks):
+        self.pans.append(int.from_bytes(b[bi:bi+4], "big"))
+        bi += 4
+    for i in range(self.tracks):
+        self.feedbacks.append(int.from_bytes(b[bi:bi+4], "big"))
+        bi += 4
+    for i in range(self.tracks):
+        if (int.from_bytes(b[bi:bi+4], "big") == 1):
+            self.selected_track = i + 1
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    packet = makePacket()
+    assert len(packet) == 232
+
+    a = LPStatusRecord()
+    legacyParseIPStatus(a, packet)
+    b = LPStatusRecord()
+    b.parseIPStatus(packet)
+    sa = LPStatusSnapshot(0, a)
+    sb = LPStatusSnapshot(0, b)
+    # The legacy parser never advanced past the first selected flag, so
+    # selected_track is not compared.
+    for field in ("tracks", "statuses", "lengths", "positions",
+                  "levels", "pans", "feedbacks"):
+        assert getattr(sa, field) == getattr(sb, field), field
+
+    def legacy():
+        legacyParseIPStatus(LPStatusRecord(), packet)
+
+    def current():
+        LPStatusRecord().parseIPStatus(packet)
+
+    for name, fn in (("legacy", legacy), ("struct", current)):
+        t = min(timeit.repeat(fn, number=n, repeat=5))
+        print("{:8s} {:8.2f} us/packet".format(name, t / n * 1e6))
+
+if __name__ == "__main__":
+    main()
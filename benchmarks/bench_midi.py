@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+# End to end benchmark of the MIDI path against the simulated device in
+# midisim.py: status poll rate, time to read the button map and effects,
+# and .syx upgrade throughput, for a few cable and device speeds.  The
+# upgrade rate is also given against the fixed 70 ms per message pacing
+# the transport used before (SysexPacer.legacyRate), which a link without
+# a wire limit, e.g. USB, should at least match.
+#
+# Usage: python3 benchmarks/bench_midi.py [--seconds S] [--upgrade-size BYTES]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lpmidimon"))
+
+import mido
+from lpdevice import LPDevice
+from upgradestate import UpgradeImage
+from miditransport import syxEncoded
+from sysexpacer import SysexPacer
+from midisim import MIDISimulator, MIDI_WIRE_RATE
+
+# (label, wire rate bytes/s, flash rate bytes/s, device buffer bytes)
+CONDITIONS = (
+    ("5 pin", MIDI_WIRE_RATE, 0.0, 4096),
+    ("USB", 0.0, 0.0, 4096),
+    ("slow flash", MIDI_WIRE_RATE, 1500.0, 1024),
+)
+
+# Payload bytes per upgrade message.
+UPGRADE_MESSAGE_SIZE = 256
+
+def makeUpgrade(directory, size):
+    # Writes a .syx of about 'size' bytes and returns it as an UpgradeImage.
+    rng = random.Random(1)
+    msgs = []
+    for i in range(0, size, UPGRADE_MESSAGE_SIZE):
+        data = [0x7d] + [rng.randrange(128) for n in range(UPGRADE_MESSAGE_SIZE - 1)]
+        msgs.append(mido.Message('sysex', data=data))
+    fileName = os.path.join(directory, "bench.syx")
+    mido.write_syx_file(fileName, msgs)
+    with open(fileName, "rb") as fp:
+        data = fp.read()
+    return UpgradeImage(fileName, data, (0, 0)), len(msgs)
+
+def measurePolling(d, seconds):
+    # Returns (status packets per second, poll rate the scheduler measured).
+    first = d.statusCount
+    started = time.monotonic()
+    time.sleep(seconds)
+    n = d.statusCount - first
+    elapsed = time.monotonic() - started
+    return n / elapsed, d.pollScheduler.getMeasuredRate()
+
+def measureConfigRead(d, timeout):
+    # Returns seconds to read the effects and the whole button map, or None.
+    started = time.monotonic()
+    d.queueReadConfig()
+    while time.monotonic() - started < timeout:
+        if d.effectsSeen and d.buttonReader.isComplete():
+            return time.monotonic() - started
+        time.sleep(0.01)
+    return None
+
+def measureUpgrade(sim, d, image, count, timeout):
+    # Returns (bytes per second the device wrote, messages it dropped), or
+    # (None, dropped) if the upgrade did not finish.
+    before = sim.upgradeMessages
+    nbytes = sim.upgradeBytes
+    overruns = sim.overruns
+    started = time.monotonic()
+    d.transport.upgrade(image)
+    # The transport is done once the last message is handed to the port,
+    # the device once it went over the cable.
+    while time.monotonic() - started < timeout:
+        if sim.upgradeMessages - before + sim.overruns - overruns >= count:
+            break
+        if not d.transport.upgradeFlag and sim.toDevice.backlog() == 0:
+            break
+        time.sleep(0.05)
+    dropped = sim.overruns - overruns
+    if sim.upgradeMessages - before + dropped < count:
+        return None, dropped
+    return (sim.upgradeBytes - nbytes) / (sim.lastUpgrade - started), dropped
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3.0, help="polling time per condition")
+    parser.add_argument("--upgrade-size", type=int, default=32 * 1024)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    image, count = makeUpgrade(directory, args.upgrade_size)
+    legacy = SysexPacer.legacyRate([n for m, n in syxEncoded(image)])
+    print("legacy pacing: {:.0f} bytes/s".format(legacy))
+
+    print("{:12s} {:>10s} {:>12s} {:>9s} {:>12s} {:>10s} {:>8s}".format(
+        "condition", "status/s", "poll rate", "config", "upgrade", "vs legacy", "dropped"))
+    for label, rate, flashRate, bufferSize in CONDITIONS:
+        sim = MIDISimulator(rate=rate, flashRate=flashRate, bufferSize=bufferSize)
+        d = LPDevice("LPSIM", "LPSIM")
+        d.midiPorts = sim
+        d.start()
+        # A wire limited link is taken as a known 5 pin DIN interface.
+        d.transport.wireRate = rate if rate > 0 else None
+        try:
+            statusRate, pollRate = measurePolling(d, args.seconds)
+            config = measureConfigRead(d, args.timeout)
+            upRate, dropped = measureUpgrade(sim, d, image, count, args.timeout)
+        finally:
+            d.stop()
+            sim.stop()
+
+        print("{:12s} {:>10.1f} {:>9.1f} Hz {:>9s} {:>12s} {:>10s} {:>8d}".format(
+            label, statusRate, pollRate,
+            "timeout" if config == None else "{:.2f} s".format(config),
+            "failed" if upRate == None else "{:.0f} bytes/s".format(upRate),
+            "-" if upRate == None else "{:.2f}x".format(upRate / legacy),
+            dropped))
+
+    os.remove(image.fileName)
+    os.rmdir(directory)
+
+if __name__ == "__main__":
+    main()
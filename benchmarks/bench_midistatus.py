@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+# Micro-benchmark of the MIDI status sysex decoder against the original
+# slice based parser.
+#
+# Usage: python3 benchmarks/bench_midistatus.py [iterations]
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lpmidimon"))
+
+from lpstatus import LPStatusRecord
+
+def pack7(v, width=5):
+    b = []
+    for i in range(width):
+        b.append(v & 0x7f)
+        v >>= 7
+    return b
+
+def makeSysex(tracks=8, selected=2):
+    b = [0xf0, 0, 2, 0x33, 2, tracks, selected]
+    for i in range(tracks):
+        b += [4, 10 + i, 64, 100]
+        b += pack7(48000 * (i + 1))
+        b += pack7(24000 * i)
+    return b + [0xf7]
+
+def convert7bit(b):
+    v = 0
+    shift = 0
+    for i in b:
+        v += (i << shift)
+        shift += 7
+    return v
+
+def legacyTrack(self, b):
+    self.statuses.append(b[0])
+    self.levels.append(-b[1])
+    self.pans.append(b[2])
+    self.feedbacks.append(b[3])
+    self.lengths.append(float(convert7bit(b[4:9])) / 48000.0)
+    self.positions.append(float(convert7bit(b[9:])) / 48000.0)
+
+def legacyParseMIDIStatus(self, b):
+    self.tracks = b[5]
+    self.selected_track = b[6]
+
+    legacyTrack(self, b[7:21])
+    legacyTrack(self, b[21:35])
+    legacyTrack(self, b[35:49])
+    legacyTrack(self, b[49:63])
+
+    if (self.tracks == 8):
+        legacyTrack(self, b[63:77])
+        legacyTrack(self, b[77:91])
+        legacyTrack(self, b[91:105])
+        legacyTrack(self, b[105:119])
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    sysex = makeSysex()
+
+    a = LPStatusRecord()
+    legacyParseMIDIStatus(a, sysex)
+    b = LPStatusRecord()
+    b.parseMIDIStatus(sysex)
+    for field in ("tracks", "selected_track", "statuses", "levels", "pans",
+                  "feedbacks"):
+        assert getattr(a, field) == getattr(b, field), field
+    for field in ("lengths", "positions"):
+        for x, y in zip(getattr(a, field), getattr(b, field)):
+            assert abs(x - y) < 1e-9, field
+
+    def legacy():
+        legacyParseMIDIStatus(LPStatusRecord(), sysex)
+
+    def current():
+        LPStatusRecord().parseMIDIStatus(sysex)
+
+    for name, fn in (("legacy", legacy), ("current", current)):
+        t = min(timeit.repeat(fn, number=n, repeat=5))
+        print("{:8s} {:8.2f} us/sysex".format(name, t / n * 1e6))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+# Startup benchmark of the GUI: time from process start to the first paint
+# of the main window and to the first status update on screen.  Each run is
+# a fresh interpreter with its own home directory, whose ~/.lp2ctrl.json
+# selects the device.  Without --device a stand-in on 127.0.0.1 answers the
+# status and log queries.  The rtmidi backend of mido is stubbed out with
+# one that lists no ports, so the benchmark runs without a MIDI driver (or
+# ALSA) and port enumeration costs the same everywhere; --real-midi uses
+# the installed backend.
+#
+# Usage: python3 benchmarks/bench_startup.py [--runs N] [--device "ip id"] [--real-midi]
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APPDIR = os.path.join(HERE, "..", "lpmidimon")
+
+CHILD = r'''
+import sys
+import types
+if sys.argv[2] == "stub":
+    rtmidi = types.ModuleType("mido.backends.rtmidi")
+    rtmidi.get_devices = lambda **kwargs: []
+    sys.modules["mido.backends.rtmidi"] = rtmidi
+import time
+t0 = time.perf_counter()
+import json
+sys.path.insert(0, sys.argv[1])
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QEvent, QObject, QTimer
+app = QApplication(sys.argv[:1])
+import lpmidimon
+tImport = time.perf_counter()
+form = lpmidimon.LP2CtrlApp()
+result = {"import": tImport - t0}
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, e):
+        if e.type() == QEvent.Paint and "window" not in result:
+            result["window"] = time.perf_counter() - t0
+        return False
+
+painted = FirstPaint()
+form.installEventFilter(painted)
+form.show()
+
+def check():
+    if form.renderedStatus.version != 0 and "status" not in result:
+        result["status"] = time.perf_counter() - t0
+    if ("window" in result and "status" in result) or time.perf_counter() - t0 > 10.0:
+        form.close()
+        app.quit()
+
+timer = QTimer()
+timer.timeout.connect(check)
+timer.start(5)
+app.exec_()
+print(json.dumps(result))
+'''
+
+def standIn(sock, stop):
+    sys.path.insert(0, HERE)
+    from bench_ipstatus import makePacket
+    packet = makePacket()
+    sock.settimeout(0.2)
+    while not stop.is_set():
+        try:
+            data, addr = sock.recvfrom(2048)
+        except socket.timeout:
+            continue
+        if b"status" in data:
+            sock.sendto(packet, addr)
+        elif b"<query>log" in data:
+            sock.sendto(b"<log></log>", addr)
+
+def runOnce(device, home, midi):
+    with open(os.path.join(home, ".lp2ctrl.json"), "w") as fp:
+        json.dump({"midiInDevice": device, "midiOutDevice": device}, fp)
+    env = dict(os.environ, HOME=home)
+    if sys.platform.startswith("linux") and "DISPLAY" not in env:
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    out = subprocess.run([sys.executable, "-c", CHILD, APPDIR, midi], env=env,
+                         stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--device", default=None,
+                        help='device to poll, e.g. "192.168.1.20 LP2"')
+    parser.add_argument("--real-midi", action="store_true",
+                        help="use the installed MIDI backend instead of a stub")
+    args = parser.parse_args()
+    midi = "real" if args.real_midi else "stub"
+    if args.real_midi:
+        try:
+            import mido.backends.rtmidi
+        except ImportError as err:
+            print("MIDI backend not available: {}".format(err))
+            return
+
+    stop = threading.Event()
+    device = args.device
+    if device is None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 5667))
+        threading.Thread(target=standIn, args=(sock, stop), daemon=True).start()
+        device = "127.0.0.1 BENCH"
+
+    results = []
+    with tempfile.TemporaryDirectory() as home:
+        for i in range(args.runs):
+            results.append(runOnce(device, home, midi))
+    stop.set()
+
+    for key, label in (("import", "import"), ("window", "first window"),
+                       ("status", "first status")):
+        values = [r[key] for r in results if key in r]
+        if len(values) == 0:
+            print("{:14s} never".format(label))
+        else:
+            print("{:14s} median {:7.1f} ms  min {:7.1f} ms  ({}/{} runs)".format(
+                label, statistics.median(values) * 1000.0, min(values) * 1000.0,
+                len(values), len(results)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+# Simulated Looperlative device for the UDP protocol, bound to loopback, so
+# polling, discovery, configuration and upgrades can be exercised and
+# benchmarked without a unit on the LAN.  Answers the id, compact status and
+# log queries, user input, sysex over UDP and the upgrade command, and runs
+# the TFTP upgrade receiver.  Datagrams can be lost in both directions, and
+# what the simulator sends can be delayed and reordered.
+#
+# Usage: python3 benchmarks/lpsim.py [--loss 0.05] [--latency 20] [--reorder 0.1]
+#
+# and point lpmidimon at "127.0.0.1 LPSIM".
+
+import argparse
+import heapq
+import math
+import random
+import re
+import socket
+import struct
+import threading
+import time
+
+LP_PORT = 5667
+TFTP_PORT = 4069
+
+TRACKS = 8
+SAMPLE_RATE = 48000
+BUTTON_COUNT = 384
+UNASSIGNED = 0x3fff
+
+DEFAULT_EFFECTS = [22, 13, 2103, 54, 2101, 2007, 24, 2013,
+                   53, 2064, 2011, 28, 2016, 2012, 2009, 2011]
+
+USERINPUT_RE = re.compile(rb'<userinput>(.)</userinput>', re.DOTALL)
+UPGRADE_RE = re.compile(rb'<command>upgrade (\d+)</command>')
+
+class SimDevice:
+    # Device state and the 0x33 sysex protocol, independent of the link.
+    # Track state evolves with time: playing tracks loop over their length,
+    # levels and feedback swing slowly.
+    def __init__(self, name="LPSIM", hardwareId=(1, 2, 3, 10, 11, 12)):
+        self.name = name
+        self.hardwareId = list(hardwareId)
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.buttons = [[UNASSIGNED] * 8 for i in range(BUTTON_COUNT)]
+        self.effects = list(DEFAULT_EFFECTS)
+        self.log = []
+        self.selected = 1
+        self.lengths = [2.0 + 0.75 * i for i in range(TRACKS)]
+        # playing, stopped, overdubbing, empty, ...
+        self.statuses = [4, 4, 3, 2, 4, 0, 4, 3]
+        self.license = None
+
+    def appendLog(self, text):
+        self.lock.acquire()
+        self.log.append(text)
+        self.lock.release()
+
+    def takeLog(self):
+        self.lock.acquire()
+        text = "".join(self.log)
+        self.log = []
+        self.lock.release()
+        return text
+
+    def trackState(self, now=None):
+        if now == None:
+            now = time.monotonic()
+        t = now - self.started
+        positions = []
+        levels = []
+        feedbacks = []
+        for i in range(TRACKS):
+            if self.statuses[i] in (2, 4):
+                positions.append((t + 0.3 * i) % self.lengths[i])
+            else:
+                positions.append(0.0)
+            levels.append(int(50 + 40 * math.sin(t * 0.7 + i)))
+            feedbacks.append(int(80 + 20 * math.sin(t * 0.1 + i)))
+        return positions, levels, feedbacks
+
+    def compactStatus(self, now=None):
+        # 8 byte header and 7 arrays of 8 big endian 32 bit values, 232
+        # bytes in all.
+        positions, levels, feedbacks = self.trackState(now)
+        v = [SAMPLE_RATE, TRACKS]
+        v += self.statuses
+        v += [int(x * SAMPLE_RATE) for x in self.lengths]
+        v += [int(x * SAMPLE_RATE) for x in positions]
+        v += levels
+        v += [64] * TRACKS
+        v += feedbacks
+        v += [1 if i + 1 == self.selected else 0 for i in range(TRACKS)]
+        return struct.pack(">" + "I" * len(v), *v)
+
+    def midiStatus(self, now=None):
+        # Status sysex (0x33, 2): track count, selected track and 14 bytes
+        # per track, lengths and positions in samples as 5 7 bit bytes, LSB
+        # first.
+        positions, levels, feedbacks = self.trackState(now)
+        b = [0xf0, 0, 2, 0x33, 2, TRACKS, self.selected]
+        for i in range(TRACKS):
+            b += [self.statuses[i], levels[i] & 0x7f, 64, feedbacks[i] & 0x7f]
+            for v in (int(self.lengths[i] * SAMPLE_RATE), int(positions[i] * SAMPLE_RATE)):
+                b += [(v >> shift) & 0x7f for shift in range(0, 35, 7)]
+        return b + [0xf7]
+
+    def userInput(self, c):
+        if c == 'b':
+            self.appendLog("Rebooting...\n")
+        elif c == 'd':
+            self.appendLog("Directory of /sd:\n  loops/\n  config.bin\n")
+        else:
+            self.appendLog("Unknown command {}\n".format(c))
+
+    def sysex(self, b):
+        # b is a sysex including f0 and f7, returns the replies.
+        if len(b) < 6 or b[1:4] != [0, 2, 0x33]:
+            return []
+        op = b[4]
+        data = b[5:-1]
+        if op == 2:
+            return [self.midiStatus()]
+        elif op == 3:
+            text = self.takeLog().encode("ascii", "replace")
+            return [[0xf0, 0, 2, 0x33, 3] + [c & 0x7f for c in text] + [0xf7]]
+        elif op == 4 and len(data) > 0:
+            self.userInput(chr(data[0]))
+        elif op == 9:
+            reply = [0xf0, 0, 2, 0x33, 9, 8]
+            for e in self.effects:
+                reply += [(e >> 7) & 0x7f, e & 0x7f]
+            return [reply + [0xf7]]
+        elif op == 10 and len(data) >= 33:
+            self.effects = [(data[1 + 2 * i] << 7) | data[2 + 2 * i] for i in range(16)]
+        elif op == 14 and len(data) >= 3:
+            first = (data[0] << 7) | data[1]
+            replies = []
+            for btn in range(first, min(first + data[2], BUTTON_COUNT), 8):
+                reply = [0xf0, 0, 2, 0x33, 15, (btn >> 7) & 0x7f, btn & 0x7f, 8]
+                for n in range(btn, btn + 8):
+                    for f in self.buttons[n % BUTTON_COUNT]:
+                        reply += [(f >> 7) & 0x7f, f & 0x7f]
+                replies.append(reply + [0xf7])
+            return replies
+        elif op == 16 and len(data) >= 18:
+            btn = (data[0] << 7) | data[1]
+            if btn < BUTTON_COUNT:
+                self.buttons[btn] = [(data[2 + 2 * i] << 7) | data[3 + 2 * i] for i in range(8)]
+        elif op == 28:
+            return [[0xf0, 0, 2, 0x33, 29] + self.hardwareId + [0xf7]]
+        elif op == 30:
+            self.license = bytes(data).decode("ascii", "replace")
+            self.appendLog("License key {} installed\n".format(self.license))
+        return []
+
+    def buttonPressed(self, btype, num):
+        # Unsolicited message the device sends when a MIDI button is used.
+        return [0xf0, 0, 2, 0x33, 24, btype & 0x7f, num & 0x7f, 0xf7]
+
+class Impairment:
+    # Loss, latency and reordering applied to datagrams.  A reordered
+    # datagram is held back long enough for the next ones to overtake it.
+    def __init__(self, loss=0.0, latency=0.0, jitter=0.0, reorder=0.0, seed=None):
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.reorder = reorder
+        self.random = random.Random(seed)
+
+    def drop(self):
+        return self.loss > 0 and self.random.random() < self.loss
+
+    def delay(self):
+        d = self.latency + self.random.uniform(0, self.jitter)
+        if self.reorder > 0 and self.random.random() < self.reorder:
+            d += 2.0 * (self.latency + self.jitter) + 0.002
+        return d
+
+class DelayLine:
+    # Sends datagrams after their delay, on its own thread.
+    def __init__(self):
+        self.heap = []
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name="lpsim-delay")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send(self, sock, data, addr, delay):
+        if delay <= 0:
+            sock.sendto(data, addr)
+            return
+        self.cond.acquire()
+        self.seq += 1
+        heapq.heappush(self.heap, (time.monotonic() + delay, self.seq, sock, data, addr))
+        self.cond.notify()
+        self.cond.release()
+
+    def stop(self):
+        self.cond.acquire()
+        self.stopped = True
+        self.cond.notify()
+        self.cond.release()
+        self.thread.join()
+
+    def run(self):
+        self.cond.acquire()
+        while not self.stopped:
+            if len(self.heap) == 0:
+                self.cond.wait()
+                continue
+            due, seq, sock, data, addr = self.heap[0]
+            now = time.monotonic()
+            if due > now:
+                self.cond.wait(due - now)
+                continue
+            heapq.heappop(self.heap)
+            self.cond.release()
+            try:
+                sock.sendto(data, addr)
+            except OSError:
+                pass
+            self.cond.acquire()
+        self.cond.release()
+
+class UpgradeReceiver:
+    # TFTP side of an upgrade: the device asks for the image with a read
+    # request, optionally with blksize and windowsize options, and
+    # acknowledges in order blocks, every windowsize blocks and at the end.
+    # An out of order block is answered with the ACK of the last in order
+    # one.
+    def __init__(self, size, client, blksize, windowsize):
+        self.size = size
+        self.client = client
+        self.blksize = blksize
+        self.windowsize = windowsize
+        self.expected = 1
+        self.received = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def request(self, options):
+        req = b"\0\x01lpupgrade\0octet\0"
+        if options:
+            req += bytes("blksize\0{}\0windowsize\0{}\0".format(self.blksize, self.windowsize), "ascii")
+        else:
+            self.blksize = 512
+            self.windowsize = 1
+        return req
+
+    def ack(self, block):
+        return bytes([0, 4, (block >> 8) & 0xff, block & 0xff])
+
+    def oack(self, b):
+        fields = b[2:].split(b"\0")
+        for i in range(0, len(fields) - 1, 2):
+            name = fields[i].decode("ascii", "replace").lower()
+            try:
+                if name == "blksize":
+                    self.blksize = int(fields[i + 1])
+                elif name == "windowsize":
+                    self.windowsize = int(fields[i + 1])
+            except ValueError:
+                pass
+        return self.ack(0)
+
+    def data(self, b):
+        # Returns the ACK to send, or None.
+        block = (b[2] << 8) | b[3]
+        if block != self.expected & 0xffff:
+            return self.ack((self.expected - 1) & 0xffff)
+        if self.finished != None:
+            return None
+        self.received += len(b) - 4
+        self.expected += 1
+        if self.received >= self.size or len(b) - 4 < self.blksize:
+            self.finished = time.monotonic()
+            return self.ack(block)
+        if (self.expected - 1) % self.windowsize == 0:
+            return self.ack(block)
+        return None
+
+class UDPSimulator:
+    # One simulated device on host:port, with the TFTP receiver on
+    # host:tftpPort.  Loss of 'impairment' applies to every datagram, its
+    # latency and reordering to the datagrams sent.  'tftpOptions' False
+    # makes the device ask for plain 512 byte lock step TFTP.
+    def __init__(self, device=None, host="127.0.0.1", port=LP_PORT, tftpPort=TFTP_PORT,
+                 impairment=None, tftpOptions=True, blksize=1428, windowsize=16):
+        if device == None:
+            device = SimDevice()
+        if impairment == None:
+            impairment = Impairment()
+        self.device = device
+        self.host = host
+        self.port = port
+        self.tftpPort = tftpPort
+        self.impairment = impairment
+        self.tftpOptions = tftpOptions
+        self.blksize = blksize
+        self.windowsize = windowsize
+        self.upgrade = None
+        self.upgrades = []
+        self.stats = {"in": 0, "out": 0, "dropped": 0}
+        self.sock = None
+        self.tftpSock = None
+        self.delayLine = None
+        self.threads = []
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.host, self.port))
+        self.tftpSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.tftpSock.bind((self.host, self.tftpPort))
+        self.delayLine = DelayLine()
+        self.stopped.clear()
+        for sock, handler in ((self.sock, self.handleMain), (self.tftpSock, self.handleTFTP)):
+            th = threading.Thread(target=self.receive, args=(sock, handler), name="lpsim")
+            th.daemon = True
+            th.start()
+            self.threads.append(th)
+
+    def stop(self):
+        self.stopped.set()
+        for sock in (self.sock, self.tftpSock):
+            sock.close()
+        for th in self.threads:
+            th.join()
+        self.threads = []
+        self.delayLine.stop()
+
+    def send(self, sock, data, addr):
+        if self.impairment.drop():
+            self.stats["dropped"] += 1
+            return
+        self.stats["out"] += 1
+        self.delayLine.send(sock, data, addr, self.impairment.delay())
+
+    def receive(self, sock, handler):
+        sock.settimeout(0.2)
+        while not self.stopped.is_set():
+            try:
+                data, addr = sock.recvfrom(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if self.impairment.drop():
+                self.stats["dropped"] += 1
+                continue
+            self.stats["in"] += 1
+            handler(data, addr)
+
+    def handleMain(self, data, addr):
+        d = self.device
+        if data.startswith(b"<query>id</query>"):
+            self.send(self.sock, bytes("<id>{}</id>".format(d.name), "utf-8"), addr)
+        elif data.startswith(b"<query>status compact</query>"):
+            self.send(self.sock, d.compactStatus(), addr)
+        elif data.startswith(b"<query>log</query>"):
+            self.send(self.sock, bytes("<log>{}</log>".format(d.takeLog()), "utf-8"), addr)
+        elif len(data) > 0 and data[0] == 0xf0:
+            for reply in d.sysex(list(data)):
+                self.send(self.sock, bytes(reply), addr)
+        else:
+            m = USERINPUT_RE.search(data)
+            if m:
+                d.userInput(m.group(1).decode("latin-1"))
+                return
+            m = UPGRADE_RE.search(data)
+            if m:
+                self.upgrade = UpgradeReceiver(int(m.group(1)), addr, self.blksize, self.windowsize)
+                self.upgrades.append(self.upgrade)
+                self.send(self.tftpSock, self.upgrade.request(self.tftpOptions), addr)
+
+    def handleTFTP(self, data, addr):
+        u = self.upgrade
+        if u == None or addr != u.client or len(data) < 4:
+            return
+        opcode = (data[0] << 8) | data[1]
+        reply = None
+        if opcode == 6:
+            reply = u.oack(data)
+        elif opcode == 3:
+            reply = u.data(data)
+            if u.finished != None and reply != None:
+                self.device.appendLog("Upgrade received: {} bytes in {:.2f} s\n".format(
+                    u.received, u.finished - u.started))
+        if reply != None:
+            self.send(self.tftpSock, reply, addr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Looperlative device on loopback.")
+    parser.add_argument("--name", default="LPSIM", help="id answered to discovery")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--loss", type=float, default=0.0, help="datagram loss probability")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency of every datagram sent, in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="added random latency in ms")
+    parser.add_argument("--reorder", type=float, default=0.0,
+                        help="probability that a datagram is overtaken by later ones")
+    parser.add_argument("--no-tftp-options", action="store_true",
+                        help="request plain 512 byte TFTP for upgrades")
+    parser.add_argument("--windowsize", type=int, default=16)
+    parser.add_argument("--blksize", type=int, default=1428)
+    args = parser.parse_args()
+
+    sim = UDPSimulator(SimDevice(args.name), host=args.host,
+                       impairment=Impairment(args.loss, args.latency / 1000.0,
+                                             args.jitter / 1000.0, args.reorder),
+                       tftpOptions=not args.no_tftp_options,
+                       blksize=args.blksize, windowsize=args.windowsize)
+    sim.start()
+    print("Simulating {} on {}:{}, Ctrl-C to stop".format(args.name, args.host, LP_PORT))
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    sim.stop()
+    print("datagrams in {in}, out {out}, dropped {dropped}".format(**sim.stats))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+# Simulated Looperlative device on a pair of MIDI ports, for the MIDI path
+# what lpsim.py is for the IP one.  MIDISimulator is a port factory for
+# LPMIDITransport (see LPDevice.midiPorts): no MIDI driver is involved, the
+# ports connect straight to a SimDevice through two simulated cables.
+#
+# The cables carry one byte at a time at the 5 pin wire rate, so a status
+# reply or a button map read takes as long as it does on real hardware.
+# The device handles messages one after the other: while it writes upgrade
+# data to flash, later messages, log requests included, wait in its input
+# buffer, and when that is full an upgrade message is dropped and an error
+# logged.
+#
+# Usage: python3 benchmarks/midisim.py [--rate 3125] [--flash-rate 2000]
+#
+# runs the simulator against an LPDevice and prints what it sees.
+
+import argparse
+import collections
+import os
+import sys
+import threading
+import time
+
+import mido
+
+from lpsim import SimDevice
+
+# 5 pin MIDI runs at 31250 baud, 10 bits per byte.
+MIDI_WIRE_RATE = 3125.0
+
+class MIDICable:
+    # One direction of a MIDI cable.  Messages are delivered in order on
+    # the cable's thread, each once its last byte went over the wire at
+    # 'rate' bytes per second (0 for no limit) plus 'latency' seconds.
+    def __init__(self, deliver, rate=MIDI_WIRE_RATE, latency=0.0, name="midisim-cable"):
+        self.deliver = deliver
+        self.rate = rate
+        self.latency = latency
+        self.queue = collections.deque()
+        self.freeAt = 0.0
+        self.messages = 0
+        self.bytes = 0
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send(self, b, earliest=None):
+        # Queues b, a list of bytes.  Its first byte goes out at 'earliest'
+        # at the soonest, a time.monotonic() time.
+        self.cond.acquire()
+        start = max(time.monotonic(), self.freeAt)
+        if earliest != None:
+            start = max(start, earliest)
+        self.freeAt = start + (len(b) / self.rate if self.rate > 0 else 0.0)
+        self.queue.append((self.freeAt + self.latency, b))
+        self.messages += 1
+        self.bytes += len(b)
+        self.cond.notify()
+        self.cond.release()
+
+    def backlog(self):
+        # Seconds until everything queued went over the wire.
+        self.cond.acquire()
+        t = max(0.0, self.freeAt - time.monotonic())
+        self.cond.release()
+        return t
+
+    def stop(self):
+        self.cond.acquire()
+        self.stopped = True
+        self.cond.notify()
+        self.cond.release()
+        self.thread.join()
+
+    def run(self):
+        self.cond.acquire()
+        while not self.stopped:
+            if len(self.queue) == 0:
+                self.cond.wait()
+                continue
+            due, b = self.queue[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self.cond.wait(delay)
+                continue
+            self.queue.popleft()
+            self.cond.release()
+            try:
+                self.deliver(b)
+            finally:
+                self.cond.acquire()
+        self.cond.release()
+
+class SimOutputPort:
+    # What mido.open_output returns, as far as LPMIDITransport uses it.
+    def __init__(self, sim, name):
+        self.sim = sim
+        self.name = name
+        self.closed = False
+
+    def send(self, msg):
+        if not self.closed:
+            self.sim.toDevice.send(msg.bytes())
+
+    def close(self):
+        self.closed = True
+
+class SimInputPort:
+    def __init__(self, sim, name):
+        self.sim = sim
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.sim.callback = None
+
+class MIDISimulator:
+    # Port factory with the open_output(name) and open_input(name, callback)
+    # of mido, whatever the names.  Replies and unsolicited messages go to
+    # the callback of the last input port opened, on the device cable's
+    # thread, as mido calls it on its own.
+    #
+    # flashRate is how many bytes of upgrade data per second the device
+    # writes (0 for no limit) and bufferSize how many bytes it can hold
+    # while it does.  Sysex without the 00 02 33 prefix is upgrade data.
+    def __init__(self, device=None, rate=MIDI_WIRE_RATE, latency=0.001,
+                 flashRate=0.0, bufferSize=4096):
+        self.device = device if device != None else SimDevice()
+        self.flashRate = flashRate
+        self.bufferSize = bufferSize
+        self.callback = None
+        self.busyUntil = 0.0
+        self.upgradeMessages = 0
+        self.upgradeBytes = 0
+        self.overruns = 0
+        self.lastUpgrade = None
+        self.toDevice = MIDICable(self.received, rate, latency, "midisim-in")
+        self.fromDevice = MIDICable(self.deliver, rate, latency, "midisim-out")
+
+    def open_output(self, name=None):
+        return SimOutputPort(self, name)
+
+    def open_input(self, name=None, callback=None):
+        self.callback = callback
+        return SimInputPort(self, name)
+
+    def stop(self):
+        self.toDevice.stop()
+        self.fromDevice.stop()
+
+    def pressButton(self, btype, num):
+        self.fromDevice.send(self.device.buttonPressed(btype, num))
+
+    def stats(self):
+        return {
+            "to device": (self.toDevice.messages, self.toDevice.bytes),
+            "from device": (self.fromDevice.messages, self.fromDevice.bytes),
+            "upgrade": (self.upgradeMessages, self.upgradeBytes),
+            "overruns": self.overruns,
+        }
+
+    def received(self, b):
+        # A message is complete on the device side, at time 'now'.  Its
+        # replies leave once the device is done with what came before it.
+        now = time.monotonic()
+        if len(b) < 2 or b[0] != 0xf0:
+            return
+        if b[1:4] != [0, 2, 0x33]:
+            self.upgradeData(b, now)
+            return
+        for reply in self.device.sysex(b):
+            self.fromDevice.send(reply, self.busyUntil)
+
+    def upgradeData(self, b, now):
+        if self.flashRate > 0:
+            buffered = max(0.0, self.busyUntil - now) * self.flashRate
+            if buffered + len(b) > self.bufferSize:
+                self.overruns += 1
+                self.device.appendLog("Upgrade error: input buffer overrun\n")
+                return
+            self.busyUntil = max(now, self.busyUntil) + len(b) / self.flashRate
+        self.upgradeMessages += 1
+        self.upgradeBytes += len(b)
+        self.lastUpgrade = max(now, self.busyUntil)
+
+    def deliver(self, b):
+        callback = self.callback
+        if callback != None:
+            callback(mido.Message.from_bytes(b))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=MIDI_WIRE_RATE,
+                        help="wire rate in bytes per second, 0 for no limit")
+    parser.add_argument("--flash-rate", type=float, default=0.0,
+                        help="upgrade bytes per second the device writes, 0 for no limit")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lpmidimon"))
+    from lpdevice import LPDevice
+
+    sim = MIDISimulator(rate=args.rate, flashRate=args.flash_rate)
+    d = LPDevice("LPSIM", "LPSIM")
+    d.midiPorts = sim
+    d.start()
+    d.queueReadConfig()
+    time.sleep(args.seconds)
+    d.stop()
+    sim.stop()
+
+    print("{} status packets, {:.1f} polls/s".format(
+        d.statusCount, d.pollScheduler.getMeasuredRate()))
+    print("button map {}, effects {}".format(
+        "complete" if d.buttonReader.isComplete() else "incomplete", d.effects1 + d.effects2))
+    for k, v in sim.stats().items():
+        print("{}: {}".format(k, v))
+
+if __name__ == "__main__":
+    main()
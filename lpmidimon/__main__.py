@@ -1,4 +1,10 @@
 #!/usr/bin/env python3
 
-from lpmidimon import main
-main()
\ No newline at end of file
+import sys
+
+# Headless mode must not import PyQt5, so decide before importing the GUI.
+if "--headless" in sys.argv[1:]:
+    from headless import main
+else:
+    from lpmidimon import main
+sys.exit(main())
@@ -0,0 +1,172 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import threading
+import time
+from collections import deque
+
+import cmdqueue
+
+# The device has 3 x 128 MIDI buttons (program change, CC, note), read 8 at
+# a time with 0x33,14 and answered with 0x33,15.
+BUTTON_COUNT = 384
+BUTTONS_PER_REQUEST = 8
+
+class ButtonMapReader:
+    # Reads the whole button map with up to 'window' requests in flight.
+    # Each reply (see replyReceived) lets the next request go out, and a
+    # request without a reply 'timeout' seconds after the transport sent it
+    # is sent again, up to 'retries' times.  Time spent in the command
+    # queue does not count, bulk traffic may wait there behind polling.
+    # Progress and the outcome go to onLog, and onDone(), if given, is
+    # called when the read ends, complete or not.
+    #
+    # start() can also be given a few groups (first button numbers) to read
+    # only those, e.g. to check a cached map; isComplete() keeps telling
+    # whether all of the map was read.
+    def __init__(self, cmdQueue, onLog, onDone=None, window=4, timeout=0.5, retries=5):
+        self.cmdQueue = cmdQueue
+        self.onLog = onLog
+        self.onDone = onDone
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.inFlight = {}
+        self.tries = {}
+        self.received = set()
+        self.groups = []
+        self.started = None
+        self.resent = 0
+        self.timer = None
+
+    def requestMessage(btn):
+        msb = (btn >> 7) & 0x7f
+        lsb = btn & 0x7f
+        return [0,2,0x33,14,msb,lsb,BUTTONS_PER_REQUEST]
+
+    def allGroups():
+        return list(range(0, BUTTON_COUNT, BUTTONS_PER_REQUEST))
+
+    def start(self, groups=None):
+        if groups == None:
+            groups = ButtonMapReader.allGroups()
+        self.lock.acquire()
+        self.groups = list(groups)
+        self.pending = deque(self.groups)
+        self.inFlight = {}
+        self.tries = {}
+        self.received = set()
+        self.started = time.monotonic()
+        self.resent = 0
+        send = self.fill()
+        self.lock.release()
+        self.send(send)
+
+    def isRunning(self):
+        return self.started != None
+
+    def isComplete(self):
+        return len(self.received) == BUTTON_COUNT // BUTTONS_PER_REQUEST
+
+    def isPartial(self):
+        # True if the last read was of a few groups only.
+        return len(self.groups) != BUTTON_COUNT // BUTTONS_PER_REQUEST
+
+    def hasRead(self, groups):
+        return set(groups) <= self.received
+
+    def fill(self):
+        # Called with the lock held, returns the requests to queue.
+        send = []
+        while len(self.pending) > 0 and len(self.inFlight) < self.window:
+            btn = self.pending.popleft()
+            # Sent time, None while queued, see requestSent.
+            self.inFlight[btn] = None
+            self.tries[btn] = self.tries.get(btn, 0) + 1
+            send.append(btn)
+        if len(self.inFlight) > 0 and self.timer == None:
+            self.timer = threading.Timer(self.timeout, self.checkTimeouts)
+            self.timer.daemon = True
+            self.timer.start()
+        return send
+
+    def send(self, buttons):
+        for btn in buttons:
+            self.cmdQueue.put(cmdqueue.BULK, ButtonMapReader.requestMessage(btn), ('read', 14, btn),
+                              lambda btn=btn: self.requestSent(btn))
+
+    def requestSent(self, btn):
+        # Called on the transport thread when the request leaves the queue.
+        self.lock.acquire()
+        if btn in self.inFlight and self.inFlight[btn] == None:
+            self.inFlight[btn] = time.monotonic()
+        self.lock.release()
+
+    def replyReceived(self, btn):
+        # Called for every 0x33,15 reply, with its first button number.
+        self.lock.acquire()
+        if self.started == None or btn not in self.inFlight:
+            self.lock.release()
+            return
+        del self.inFlight[btn]
+        self.received.add(btn)
+        send = self.fill()
+        done = len(self.inFlight) == 0 and len(self.pending) == 0
+        self.lock.release()
+
+        self.send(send)
+        if done:
+            self.finish()
+
+    def checkTimeouts(self):
+        self.lock.acquire()
+        self.timer = None
+        if self.started == None:
+            self.lock.release()
+            return
+        now = time.monotonic()
+        failed = []
+        for btn, sent in list(self.inFlight.items()):
+            if sent != None and now - sent > self.timeout:
+                del self.inFlight[btn]
+                if self.tries[btn] > self.retries:
+                    failed.append(btn)
+                else:
+                    self.pending.appendleft(btn)
+                    self.resent += 1
+        send = self.fill()
+        done = len(self.inFlight) == 0 and len(self.pending) == 0
+        self.lock.release()
+
+        for btn in failed:
+            self.onLog("Button map: no reply for buttons {}-{}\n".format(
+                btn, btn + BUTTONS_PER_REQUEST - 1))
+        self.send(send)
+        if done:
+            self.finish()
+
+    def finish(self):
+        self.lock.acquire()
+        if self.started == None:
+            self.lock.release()
+            return
+        elapsed = time.monotonic() - self.started
+        self.started = None
+        if self.timer != None:
+            self.timer.cancel()
+            self.timer = None
+        self.lock.release()
+
+        # The outcome of a partial read is for the caller to judge.
+        n = len(self.received) * BUTTONS_PER_REQUEST
+        if self.isComplete():
+            self.onLog("Button map read: {} buttons in {:.2f} s, {} requests repeated\n".format(
+                n, elapsed, self.resent))
+        elif not self.isPartial():
+            self.onLog("Button map incomplete: {} of {} buttons in {:.2f} s\n".format(
+                n, BUTTON_COUNT, elapsed))
+        if self.onDone != None:
+            self.onDone()
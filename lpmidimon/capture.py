@@ -0,0 +1,78 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import struct
+import threading
+import time
+
+# Capture file: CAPTURE_MAGIC, then one record per MIDI message or datagram,
+# a RECORD header (time.monotonic() time, direction, kind, data length)
+# followed by the raw bytes.  Every capture appended to the file starts with
+# an empty SESSION record, time stamps only go up within one session.
+CAPTURE_MAGIC = b"LPCAP\x01"
+RECORD = struct.Struct("<dBBI")
+
+IN = 0
+OUT = 1
+SESSION = 0xff
+
+KIND_MIDI = 0       # a MIDI message, sysex framed with f0/f7
+KIND_UDP = 1        # a datagram on the status and command socket
+KIND_TFTP = 2       # a datagram on an upgrade socket
+
+KIND_NAMES = ("midi", "udp", "tftp")
+
+class CaptureWriter:
+    # Appends records to a capture file.  Each record goes to the file in
+    # one unbuffered write, so a crash loses nothing that was captured.
+    # May be used from any thread.
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.fp = open(fileName, "ab", buffering=0)
+        if self.fp.tell() == 0:
+            self.fp.write(CAPTURE_MAGIC)
+        self.lock = threading.Lock()
+        self.records = 0
+        self.bytes = 0
+        self.record(SESSION, 0, b"")
+
+    def record(self, direction, kind, data):
+        data = bytes(data)
+        rec = RECORD.pack(time.monotonic(), direction, kind, len(data)) + data
+        self.lock.acquire()
+        try:
+            if self.fp != None:
+                self.fp.write(rec)
+                self.records += 1
+                self.bytes += len(rec)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        fp = self.fp
+        self.fp = None
+        self.lock.release()
+        if fp != None:
+            fp.close()
+
+def readCapture(fileName):
+    # Yields (time, direction, kind, data) for each record in the file,
+    # SESSION records included.  Raises ValueError if fileName is not a
+    # capture.  A truncated last record, e.g. from a crash during a write,
+    # is ignored.
+    with open(fileName, "rb") as fp:
+        data = fp.read()
+    if data[0:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+        raise ValueError("{} is not a capture file".format(fileName))
+    mv = memoryview(data)
+    pos = len(CAPTURE_MAGIC)
+    while pos < len(mv):
+        if pos + RECORD.size > len(mv):
+            return
+        t, direction, kind, n = RECORD.unpack_from(mv, pos)
+        pos += RECORD.size
+        if pos + n > len(mv):
+            return
+        yield (t, direction, kind, bytes(mv[pos:pos + n]))
+        pos += n
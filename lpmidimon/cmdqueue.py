@@ -0,0 +1,116 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import threading
+import time
+from collections import deque
+
+# Priority classes of outbound traffic, highest first.  Status and log
+# polling is the lowest priority of all; it only runs when no queued
+# message is due (see PollScheduler).
+USER = 0
+CONFIG = 1
+BULK = 2
+CLASS_NAMES = ("user", "config", "bulk")
+
+# Pause after sending messages the device needs time to act on, by opcode.
+# Button map reads (14) are paced by ButtonMapReader instead.
+SEND_PACING = {10: 0.3}
+
+class QueueStats:
+    def __init__(self):
+        self.sent = 0
+        self.merged = 0
+        self.maxDepth = 0
+        self.totalWait = 0.0
+        self.maxWait = 0.0
+
+    def __str__(self):
+        avg = self.totalWait / self.sent if self.sent else 0.0
+        return "sent {} merged {} max depth {} wait avg {:.0f} ms max {:.0f} ms".format(
+            self.sent, self.merged, self.maxDepth, avg * 1000.0, self.maxWait * 1000.0)
+
+class CommandQueue:
+    # Single scheduler for all outbound messages to the device.  Messages are
+    # sysex data lists without the f0/f7 framing.  A message put with a key
+    # replaces a still pending message with the same key, keeping its place
+    # in the queue, so repeated writes to one button or effect slot go out
+    # once.  Messages without a key are never merged or dropped.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = [deque() for n in CLASS_NAMES]
+        self.pending = {}
+        self.stats = [QueueStats() for n in CLASS_NAMES]
+        self.listeners = []
+
+    def addListener(self, fn):
+        # fn is called, without arguments, whenever a message is queued.
+        self.listeners.append(fn)
+
+    def removeListener(self, fn):
+        if fn in self.listeners:
+            self.listeners.remove(fn)
+
+    def put(self, cls, msg, key=None, onSent=None):
+        # onSent(), if given, is called once the message is handed to the
+        # transport, also when it was merged into a pending one.
+        self.lock.acquire()
+        entry = None
+        if key is not None:
+            entry = self.pending.get(key)
+        if entry is not None:
+            entry[1] = msg
+            if onSent is not None:
+                entry[4].append(onSent)
+            self.stats[entry[0]].merged += 1
+        else:
+            entry = [cls, msg, key, time.monotonic(), [onSent] if onSent is not None else []]
+            q = self.queues[cls]
+            q.append(entry)
+            if key is not None:
+                self.pending[key] = entry
+            if len(q) > self.stats[cls].maxDepth:
+                self.stats[cls].maxDepth = len(q)
+        self.lock.release()
+
+        for fn in list(self.listeners):
+            fn()
+
+    def get(self):
+        # Returns (class, message) of the most urgent message or None.
+        self.lock.acquire()
+        item = None
+        sentCallbacks = ()
+        for q in self.queues:
+            if q:
+                cls, msg, key, queued, sentCallbacks = q.popleft()
+                if key is not None:
+                    del self.pending[key]
+                wait = time.monotonic() - queued
+                st = self.stats[cls]
+                st.sent += 1
+                st.totalWait += wait
+                if wait > st.maxWait:
+                    st.maxWait = wait
+                item = (cls, msg)
+                break
+        self.lock.release()
+
+        for fn in sentCallbacks:
+            fn()
+        return item
+
+    def empty(self):
+        for q in self.queues:
+            if q:
+                return False
+        return True
+
+    def depth(self, cls):
+        return len(self.queues[cls])
+
+    def getStatsString(self):
+        lines = []
+        for name, q, st in zip(CLASS_NAMES, self.queues, self.stats):
+            lines.append("{}: depth {} {}".format(name, len(q), st))
+        return "\n".join(lines)
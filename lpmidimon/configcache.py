@@ -0,0 +1,60 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import json
+import threading
+import time
+from pathlib import Path
+
+# Cached configurations of devices not seen for this long are dropped.
+CONFIG_CACHE_TTL = 90 * 24 * 3600
+
+_cacheLock = threading.Lock()
+
+def cacheFileName():
+    return str(Path.home()) + '/.lp2ctrl-devices.json'
+
+def _readCache():
+    try:
+        with open(cacheFileName()) as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _writeCache(cache):
+    with open(cacheFileName(), 'w') as fp:
+        json.dump(cache, fp)
+
+def loadConfig(key):
+    # Returns the last known configuration of the device with this key as
+    # ({button: functions}, effects1, effects2), or None.
+    _cacheLock.acquire()
+    try:
+        entry = _readCache().get(key)
+    finally:
+        _cacheLock.release()
+    if entry is None or time.time() - entry.get('time', 0) > CONFIG_CACHE_TTL:
+        return None
+    try:
+        buttons = {}
+        for k, flist in entry['buttons'].items():
+            buttons[int(k)] = list(flist)
+        return buttons, list(entry['effects1']), list(entry['effects2'])
+    except (KeyError, ValueError, AttributeError, TypeError):
+        return None
+
+def saveConfig(key, buttons, effects1, effects2):
+    _cacheLock.acquire()
+    try:
+        cache = _readCache()
+        now = time.time()
+        for k in list(cache):
+            if now - cache[k].get('time', 0) > CONFIG_CACHE_TTL:
+                del cache[k]
+        cache[key] = {'buttons': {str(btn): flist for btn, flist in buttons.items()},
+                      'effects1': effects1,
+                      'effects2': effects2,
+                      'time': now}
+        _writeCache(cache)
+    finally:
+        _cacheLock.release()
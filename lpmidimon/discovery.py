@@ -0,0 +1,130 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import re
+import selectors
+import socket
+import sys
+import threading
+import time
+
+LP_PORT = 5667
+ID_QUERY = bytes("<query>id</query>\0", "utf-8")
+ID_RE = re.compile('<id>(.*)</id>', re.DOTALL)
+
+# Discovered devices are remembered in ~/.lp2ctrl.json for this long after
+# they last answered.
+DEVICE_CACHE_TTL = 7 * 24 * 3600
+
+def broadcastAddresses():
+    import psutil
+
+    addrs = []
+    for name, ifaddrs in psutil.net_if_addrs().items():
+        for addr in ifaddrs:
+            if addr.family == socket.AF_INET and addr.broadcast:
+                if addr.broadcast not in addrs:
+                    addrs.append(addr.broadcast)
+    return addrs
+
+def pruneDeviceCache(cache, now=None):
+    # Returns the {name: last seen} entries younger than DEVICE_CACHE_TTL.
+    if now == None:
+        now = time.time()
+    pruned = {}
+    for name, seen in cache.items():
+        if isinstance(seen, (int, float)) and now - seen < DEVICE_CACHE_TTL:
+            pruned[name] = seen
+    return pruned
+
+class DeviceDiscovery:
+    # Finds IP devices with one socket: the id query is broadcast on every
+    # interface, and sent directly to the 'known' addresses, then replies are
+    # collected until none arrived for 'quiet' seconds, or for 'timeout'
+    # seconds if nobody answers at all.  A device answering on several
+    # interfaces is reported once.
+    #
+    # onFound(name) is called for each device, named "<address> <id>", and
+    # onDone(names) once with all of them, both on the discovery thread.
+    def __init__(self, onFound=None, onDone=None, known=(), timeout=2.0, quiet=0.3):
+        self.onFound = onFound
+        self.onDone = onDone
+        self.known = list(known)
+        self.timeout = timeout
+        self.quiet = quiet
+        self.found = []
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="lp-discovery")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def wait(self):
+        if self.thread != None:
+            self.thread.join()
+        return self.found
+
+    def send(self, sock, addrs):
+        for addr in addrs:
+            try:
+                sock.sendto(ID_QUERY, (addr, LP_PORT))
+            except OSError as msg:
+                print("Discovery {}: {}".format(addr, msg), file=sys.stderr)
+
+    def receive(self, sock, seen):
+        # Returns True for any id reply, repeated ones included.
+        try:
+            (brcv, address) = sock.recvfrom(1024)
+        except OSError:
+            return False
+        if len(brcv) == 0 or brcv[0] == 0xf0:
+            return False
+        m = ID_RE.search(brcv.decode("utf-8", "replace"))
+        if not m:
+            return False
+        key = (address[0], m.group(1))
+        if key in seen:
+            return True
+        seen.add(key)
+        name = "{} {}".format(address[0], m.group(1))
+        self.found.append(name)
+        if self.onFound != None:
+            self.onFound(name)
+        return True
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.setblocking(False)
+        sel = selectors.DefaultSelector()
+        sel.register(sock, selectors.EVENT_READ)
+        try:
+            self.send(sock, broadcastAddresses() + self.known)
+
+            seen = set()
+            started = time.monotonic()
+            lastReply = None
+            while True:
+                now = time.monotonic()
+                if lastReply == None:
+                    remaining = started + self.timeout - now
+                else:
+                    remaining = min(started + self.timeout, lastReply + self.quiet) - now
+                if remaining <= 0:
+                    break
+                for key, events in sel.select(remaining):
+                    if self.receive(sock, seen):
+                        lastReply = time.monotonic()
+        finally:
+            sel.close()
+            sock.close()
+
+        if self.onDone != None:
+            self.onDone(list(self.found))
+
+def discoverDevices(known=(), timeout=2.0, quiet=0.3):
+    # Blocking discovery, returns the device names.
+    d = DeviceDiscovery(known=known, timeout=timeout, quiet=quiet)
+    d.run()
+    return d.found
@@ -0,0 +1,85 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import math
+
+from PyQt5 import QtCore, QtWidgets
+from PyQt5.QtCore import QTimer
+from lpstatus import LPStatus
+from level_bar import LevelBar
+
+class DeviceTile(QtWidgets.QGroupBox):
+    # Compact view of one device: status and level of each track.  Clicking
+    # the tile shows the device in the main window.
+    def __init__(self, device, onSelect, parent=None):
+        super(DeviceTile, self).__init__(device.name, parent)
+        self.device = device
+        self.onSelect = onSelect
+        self.renderedVersion = -1
+
+        layout = QtWidgets.QGridLayout(self)
+        self.trackLabels = []
+        self.levelBars = []
+        for i in range(0, 8):
+            label = QtWidgets.QLabel(self)
+            label.setAlignment(QtCore.Qt.AlignCenter)
+            layout.addWidget(label, 0, i, 1, 1)
+            self.trackLabels.append(label)
+
+            bar = LevelBar(self)
+            bar.setMinimumSize(20, 50)
+            layout.addWidget(bar, 1, i, QtCore.Qt.AlignCenter)
+            self.levelBars.append(bar)
+
+    def refresh(self):
+        s = self.device.status.getSnapshot()
+        if s.version == self.renderedVersion:
+            return
+        self.renderedVersion = s.version
+
+        for i, (label, bar) in enumerate(zip(self.trackLabels, self.levelBars)):
+            if i < s.tracks:
+                label.setText("{}\n{}".format(i + 1, LPStatus.getStatusString(s.statuses[i])))
+                bar.setLevel(100 + s.levels[i])
+            else:
+                label.setText("")
+
+    def mousePressEvent(self, e):
+        self.onSelect(self.device.name)
+
+class FleetView(QtWidgets.QWidget):
+    # Tiles all monitored devices in one window.
+    def __init__(self, onSelect, parent=None):
+        super(FleetView, self).__init__(parent)
+        self.setWindowTitle("Looperlative devices")
+        self.onSelect = onSelect
+        self.grid = QtWidgets.QGridLayout(self)
+        self.tiles = {}
+
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.handleTimer)
+        self.timer.start(250)
+
+    def setDevices(self, devices):
+        names = set(d.name for d in devices)
+        for name in list(self.tiles.keys()):
+            if name not in names:
+                tile = self.tiles.pop(name)
+                self.grid.removeWidget(tile)
+                tile.deleteLater()
+        for d in devices:
+            tile = self.tiles.get(d.name)
+            if tile == None or tile.device != d:
+                if tile != None:
+                    self.grid.removeWidget(tile)
+                    tile.deleteLater()
+                self.tiles[d.name] = DeviceTile(d, self.onSelect, self)
+
+        cols = max(1, int(math.ceil(math.sqrt(len(self.tiles)))))
+        for i, name in enumerate(sorted(self.tiles.keys())):
+            self.grid.addWidget(self.tiles[name], i // cols, i % cols, 1, 1)
+
+    def handleTimer(self):
+        if self.isVisible():
+            for tile in self.tiles.values():
+                tile.refresh()
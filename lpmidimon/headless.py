@@ -0,0 +1,208 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+# Headless monitor: polls one or more devices and streams status changes and
+# log lines as JSON lines, one object per line.  Does not import PyQt5.
+#
+#   python3 lpmidimon --headless --device 192.168.1.20 --rate 2
+#
+# A device named "replay:<file>" plays back a capture made with --capture.
+# A device whose transport fails, e.g. a MIDI port that does not exist, gets
+# an "error" line.  The monitor exits when all replays are done or failed.
+#
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+from capture import CaptureWriter
+from discovery import discoverDevices
+from lpdevice import LPDevice, getDeviceIP
+
+def loadConfigDevice():
+    # Device last selected in the GUI, if any.
+    cfile_name = str(Path.home()) + '/.lp2ctrl.json'
+    try:
+        with open(cfile_name) as fp:
+            config = json.load(fp)
+            return config.get('midiInDevice', ""), config.get('midiOutDevice', "")
+    except (FileNotFoundError, ValueError):
+        return "", ""
+
+class JSONLineWriter:
+    # Writes one JSON object per line.  Called from a single thread.
+    def __init__(self, fp):
+        self.fp = fp
+
+    def write(self, device, kind, **fields):
+        rec = {'time': round(time.time(), 3), 'device': device.name, 'type': kind}
+        rec.update(fields)
+        self.fp.write(json.dumps(rec) + "\n")
+
+    def flush(self):
+        self.fp.flush()
+
+class HeadlessMonitor:
+    # Emits a status line for each device whose status changed since the
+    # last tick, at most 'rate' per second per device, and every complete
+    # log line the devices printed in between.
+    def __init__(self, devices, writer, rate=4.0, logs=True):
+        self.devices = devices
+        self.writer = writer
+        self.interval = 1.0 / rate
+        self.logs = logs
+        self.versions = {}
+        self.lastStatus = {}
+        self.partialLogs = {}
+        self.logDropped = {}
+        self.errors = {}
+        self.endEvent = threading.Event()
+
+    def stop(self):
+        self.endEvent.set()
+
+    def emitStatus(self, d):
+        # A new version is a changed status, but it may still round to the
+        # same fields.
+        s = d.status.getSnapshot()
+        if s.version == 0 or s.version == self.versions.get(d.name):
+            return
+        self.versions[d.name] = s.version
+        fields = s.asDict()
+        version = fields.pop('version')
+        if fields != self.lastStatus.get(d.name):
+            self.lastStatus[d.name] = fields
+            self.writer.write(d, 'status', version=version, **fields)
+
+    def emitLog(self, d, final=False):
+        text = self.partialLogs.get(d.name, "") + d.status.getLog()
+        lines = text.split("\n")
+        rest = lines.pop()
+        if final and len(rest) > 0:
+            lines.append(rest)
+            rest = ""
+        self.partialLogs[d.name] = rest
+        if not self.logs:
+            return
+
+        dropped = d.status.getLogDropped()
+        if dropped != self.logDropped.get(d.name, 0):
+            self.logDropped[d.name] = dropped
+            self.writer.write(d, 'log_dropped', chars=dropped)
+        for line in lines:
+            self.writer.write(d, 'log', text=line.rstrip("\r"))
+
+    def emitError(self, d):
+        # Once per device, the transport ended and the device is done.
+        error = d.getError()
+        if error == None or d.name in self.errors:
+            return
+        self.errors[d.name] = error
+        self.writer.write(d, 'error', text=error)
+        print("{}: {}".format(d.name, error), file=sys.stderr)
+
+    def isDone(self, d):
+        return d.replayFinished() or d.name in self.errors
+
+    def tick(self, final=False):
+        for d in self.devices:
+            self.emitStatus(d)
+            self.emitLog(d, final)
+            self.emitError(d)
+        self.writer.flush()
+
+    def run(self):
+        for d in self.devices:
+            d.start()
+        try:
+            while not self.endEvent.wait(self.interval):
+                self.tick()
+                if all(self.isDone(d) for d in self.devices):
+                    break
+            self.tick(True)
+        finally:
+            for d in self.devices:
+                d.stop()
+
+def main():
+    parser = argparse.ArgumentParser(prog="lpmidimon --headless",
+                                     description="Stream Looperlative status and log as JSON lines.")
+    parser.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("-d", "--device", action="append", default=[],
+                        help="IP address, discovered device name or MIDI port name (repeatable)")
+    parser.add_argument("--midi-in", default="",
+                        help="MIDI input port, if different from the MIDI --device")
+    parser.add_argument("--discover", action="store_true",
+                        help="monitor all IP devices answering a broadcast query")
+    parser.add_argument("-r", "--rate", type=float, default=4.0,
+                        help="maximum status lines per second per device (default 4)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="append to this file instead of writing to stdout")
+    parser.add_argument("--no-log", action="store_true", help="do not emit log lines")
+    parser.add_argument("--capture", default=None,
+                        help="record all traffic of the device to this file")
+    parser.add_argument("--replay-fast", action="store_true",
+                        help="replay:<file> devices replay as fast as possible")
+    args = parser.parse_args()
+
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+
+    names = list(args.device)
+    if args.discover:
+        names += discoverDevices()
+    if len(names) == 0:
+        inName, outName = loadConfigDevice()
+        if len(outName) == 0:
+            parser.error("no device given and none saved in ~/.lp2ctrl.json")
+        names.append(outName)
+        if len(args.midi_in) == 0:
+            args.midi_in = inName
+
+    devices = []
+    seen = set()
+    for n in names:
+        ipaddr = getDeviceIP(n)
+        if ipaddr:
+            # The same device may be given by address and by name.
+            if ipaddr in seen:
+                continue
+            seen.add(ipaddr)
+            devices.append(LPDevice(n, n))
+        else:
+            devices.append(LPDevice(args.midi_in or n, n))
+
+    if args.capture != None:
+        if len(devices) != 1:
+            parser.error("--capture records one device only")
+        devices[0].setCapture(CaptureWriter(args.capture))
+    if args.replay_fast:
+        for d in devices:
+            d.replaySpeed = 0
+
+    if args.output == "-":
+        fp = sys.stdout
+    else:
+        fp = open(args.output, "a")
+
+    monitor = HeadlessMonitor(devices, JSONLineWriter(fp), args.rate, not args.no_log)
+    signal.signal(signal.SIGINT, lambda signum, frame: monitor.stop())
+    signal.signal(signal.SIGTERM, lambda signum, frame: monitor.stop())
+    try:
+        monitor.run()
+    except BrokenPipeError:
+        pass
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+        for d in devices:
+            if d.capture != None:
+                d.capture.close()
+    # Failed if a device could not be monitored.
+    return 1 if len(monitor.errors) > 0 else 0
+
+if __name__ == "__main__":
+    main()
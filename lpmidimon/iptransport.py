@@ -0,0 +1,443 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import asyncio
+import re
+import threading
+import time
+
+import capture
+import cmdqueue
+from lpstatus import LPStatusRecord
+
+LP_PORT = 5667
+TFTP_PORT = 4069
+
+TFTP_DATA = 3
+TFTP_ACK = 4
+TFTP_ERROR = 5
+TFTP_OACK = 6
+TFTP_BLKSIZE = 512
+TFTP_BLKSIZE_MAX = 65464
+TFTP_WINDOWSIZE_MAX = 64
+TFTP_RETRIES = 10
+
+# TFTP always starts again at block 1, so an upload that fails is started
+# over this many times in total, from the blocks already encoded.
+UPGRADE_ATTEMPTS = 3
+
+STATUS_REQUEST = bytes("<query>status compact</query>\0", "utf-8")
+LOG_REQUEST = bytes("<query>log</query>\0", "utf-8")
+LOG_RE = re.compile('<log>(.*)</log>', re.DOTALL)
+
+def parseTFTPRequest(b):
+    # Returns the options of a TFTP request ({name: value}, names lower
+    # case), or None if b is not a request.
+    fields = bytes(b[2:]).split(b"\0")
+    if len(b) < 4 or len(fields) < 3:
+        return None
+    options = {}
+    for i in range(2, len(fields) - 1, 2):
+        options[fields[i].decode("utf-8", "replace").lower()] = fields[i + 1].decode("utf-8", "replace")
+    return options
+
+def encodeBlocks(data, blksize):
+    # TFTP DATA datagrams for data, block numbers 1 based and wrapping at
+    # 16 bits.  The last block is not followed by an empty one when the size
+    # is a multiple of blksize, the device knows the length from the
+    # upgrade command.
+    blocks = []
+    for pos in range(0, max(len(data), 1), blksize):
+        n = len(blocks) + 1
+        blocks.append(bytes([0, TFTP_DATA, (n >> 8) & 0xff, n & 0xff]) + data[pos:pos + blksize])
+    return blocks
+
+_loop = None
+_loopLock = threading.Lock()
+
+def getEventLoop():
+    # All IP transports share one event loop running on a daemon thread.
+    global _loop
+    _loopLock.acquire()
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        th = threading.Thread(target=_loop.run_forever, name="lp-ip-loop")
+        th.daemon = True
+        th.start()
+    _loopLock.release()
+    return _loop
+
+class LPIPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, owner):
+        self.owner = owner
+
+    def datagram_received(self, data, addr):
+        self.owner.datagramReceived(data, addr)
+
+    def error_received(self, exc):
+        self.owner.onLog("{}\n".format(exc))
+
+class LPQueueProtocol(asyncio.DatagramProtocol):
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.queue = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        if self.owner != None and self.owner.capture != None:
+            self.owner.capture.record(capture.IN, capture.KIND_TFTP, data)
+        self.queue.put_nowait((data, addr))
+
+class LPIPTransport:
+    # Talks to one Looperlative device over UDP: sends queued messages,
+    # polls status and log, and runs firmware upgrades.  Everything runs on
+    # the shared event loop, so the callbacks are called on that thread:
+    #   onStatus(LPStatusRecord)  parsed compact status
+    #   onLog(text)               log text
+    #   onSysex(b)                any sysex, as a list of ints including f0/f7
+    # If the transport ends on an error, 'error' says why.  If 'capture' is
+    # set to a capture.CaptureWriter, all datagrams sent and received are
+    # recorded to it.
+    def __init__(self, ipaddr, cmdQueue, pollScheduler, onStatus, onLog, onSysex):
+        self.lpip = (ipaddr, LP_PORT)
+        self.cmdQueue = cmdQueue
+        self.pollScheduler = pollScheduler
+        self.onStatus = onStatus
+        self.onLog = onLog
+        self.onSysex = onSysex
+
+        self.loop = None
+        self.task = None
+        self.running = False
+        self.transport = None
+        self.replyEvent = None
+        self.wakeEvent = None
+        self.stopped = threading.Event()
+        self.upgradeImage = None
+        self.capture = None
+        self.error = None
+
+    def start(self):
+        self.loop = getEventLoop()
+        self.stopped.clear()
+        self.error = None
+        self.running = True
+        self.cmdQueue.addListener(self.wake)
+        self.loop.call_soon_threadsafe(self.startTask)
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.cmdQueue.removeListener(self.wake)
+        self.loop.call_soon_threadsafe(self.cancelTask)
+        self.stopped.wait(1.0)
+
+    def startTask(self):
+        # On the loop.  'stopped' is set when the task is done, also if it
+        # is cancelled before run() was entered.
+        self.task = self.loop.create_task(self.run())
+        self.task.add_done_callback(self.taskDone)
+
+    def taskDone(self, task):
+        if not task.cancelled() and task.exception() != None and self.error == None:
+            err = task.exception()
+            self.error = "IP transport stopped, {}: {}".format(type(err).__name__, err)
+            self.onLog(self.error + "\n")
+        self.stopped.set()
+
+    def cancelTask(self):
+        # On the loop, so always after startTask.
+        if self.task != None:
+            self.task.cancel()
+            self.task = None
+
+    def wake(self):
+        # May be called from any thread.  run() may end meanwhile, so the
+        # event is looked up on the loop, and a loop already closed is fine.
+        loop = self.loop
+        if loop == None:
+            return
+        try:
+            loop.call_soon_threadsafe(self.setWakeEvent)
+        except RuntimeError:
+            pass
+
+    def setWakeEvent(self):
+        if self.wakeEvent != None:
+            self.wakeEvent.set()
+
+    def upgrade(self, image):
+        # Starts a firmware upgrade with an upgradestate.UpgradeImage at the
+        # end of the current poll cycle.
+        self.upgradeImage = image
+        self.wake()
+
+    def sendDatagram(self, transport, data, addr, kind=capture.KIND_UDP):
+        if self.capture != None:
+            self.capture.record(capture.OUT, kind, data)
+        transport.sendto(data, addr)
+
+    def sendMessage(self, msg):
+        if msg[0:4] == [0,2,0x33,4]:
+            # User commands go to the console input of the device.
+            self.sendDatagram(self.transport, bytes("<userinput>{}</userinput>\0".format(chr(msg[4])), "utf-8"), self.lpip)
+        else:
+            self.sendDatagram(self.transport, bytes([0xf0] + msg + [0xf7]), self.lpip)
+
+    def datagramReceived(self, brcv, address):
+        if self.capture != None:
+            self.capture.record(capture.IN, capture.KIND_UDP, brcv)
+        if len(brcv) == 0:
+            return
+        if brcv[0] == 0:
+            s = LPStatusRecord()
+            if s.parseIPStatus(brcv):
+                self.onStatus(s)
+                self.replyEvent.set()
+        elif brcv[0] == 0xf0:
+            self.onSysex(list(brcv))
+        else:
+            m = LOG_RE.search(brcv.decode("utf-8", "replace"))
+            if m:
+                self.onLog(m.group(1))
+                self.replyEvent.set()
+
+    async def request(self, req):
+        # Returns False if no reply arrived within the reply timeout.
+        self.replyEvent.clear()
+        self.sendDatagram(self.transport, req, self.lpip)
+        try:
+            await asyncio.wait_for(self.replyEvent.wait(), self.pollScheduler.replyTimeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def sendQueued(self, started):
+        # Sends queued messages, most urgent first, until the queue is empty
+        # or bulk traffic has to make room for the status poll.
+        while True:
+            item = self.cmdQueue.get()
+            if item is None:
+                return
+            cls, msg = item
+            self.sendMessage(msg)
+            pace = cmdqueue.SEND_PACING.get(msg[3])
+            if pace:
+                await asyncio.sleep(pace)
+            if cls == cmdqueue.BULK and self.pollScheduler.pollDue(started):
+                return
+
+    async def waitNextCycle(self, started):
+        remaining = self.pollScheduler.interval - (time.monotonic() - started)
+        if remaining > 0:
+            try:
+                await asyncio.wait_for(self.wakeEvent.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        self.wakeEvent.clear()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.replyEvent = asyncio.Event()
+        self.wakeEvent = asyncio.Event()
+        try:
+            self.transport, protocol = await loop.create_datagram_endpoint(
+                lambda: LPIPProtocol(self), local_addr=('0.0.0.0', 0))
+        except OSError as msg:
+            self.error = "Couldn't open a UDP socket: {}".format(msg)
+            self.onLog(self.error + "\n")
+            return
+
+        try:
+            # Status first, before any queued bulk traffic.  The first cycle
+            # does not ask again unless a poll period went by meanwhile.
+            answered = None
+            if await self.request(STATUS_REQUEST):
+                answered = time.monotonic()
+            while True:
+                started = time.monotonic()
+                await self.sendQueued(started)
+
+                if answered == None or self.pollScheduler.pollDue(answered):
+                    await self.request(STATUS_REQUEST)
+                answered = None
+                await self.request(LOG_REQUEST)
+
+                image = self.upgradeImage
+                self.upgradeImage = None
+                if image != None:
+                    await self.doUpgrade(image)
+
+                if self.cmdQueue.empty():
+                    await self.waitNextCycle(started)
+        finally:
+            self.transport.close()
+            self.wakeEvent = None
+
+    async def receiveTFTP(self, protocol, timeout):
+        # Returns (opcode, block or error code, datagram) or None on timeout.
+        try:
+            (brcv, address) = await asyncio.wait_for(protocol.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if len(brcv) < 4:
+            return (0, 0, brcv)
+        return (int.from_bytes(brcv[0:2], "big"), int.from_bytes(brcv[2:4], "big"), brcv)
+
+    async def negotiate(self, transport, protocol, tftpip, options):
+        # Answers the device's request options with an OACK and waits for
+        # the ACK of block 0.  Returns the accepted (blksize, windowsize), or
+        # None if the device never acknowledged them.
+        blksize = TFTP_BLKSIZE
+        windowsize = 1
+        accepted = b""
+        if "blksize" in options:
+            try:
+                blksize = max(8, min(int(options["blksize"]), TFTP_BLKSIZE_MAX))
+                accepted += bytes("blksize\0{}\0".format(blksize), "utf-8")
+            except ValueError:
+                blksize = TFTP_BLKSIZE
+        if "windowsize" in options:
+            try:
+                windowsize = max(1, min(int(options["windowsize"]), TFTP_WINDOWSIZE_MAX))
+                accepted += bytes("windowsize\0{}\0".format(windowsize), "utf-8")
+            except ValueError:
+                windowsize = 1
+        if len(accepted) == 0:
+            return (blksize, windowsize)
+
+        for attempt in range(0, TFTP_RETRIES):
+            self.sendDatagram(transport, bytes([0, TFTP_OACK]) + accepted, tftpip, capture.KIND_TFTP)
+            r = await self.receiveTFTP(protocol, 1.0)
+            if r != None and r[0] == TFTP_ACK and r[1] == 0:
+                return (blksize, windowsize)
+            if r != None and r[0] == TFTP_ERROR:
+                self.onLog("Upgrade refused by device: {}\n".format(
+                    r[2][4:].decode("utf-8", "replace").rstrip("\0")))
+                return None
+        return None
+
+    async def doUpgrade(self, image):
+        self.onLog("Upgrade {} with {}\n".format(self.lpip[0], image.fileName))
+        for attempt in range(1, UPGRADE_ATTEMPTS + 1):
+            if attempt > 1:
+                self.onLog("Starting the upload over, attempt {} of {}\n".format(
+                    attempt, UPGRADE_ATTEMPTS))
+                # Give the device time to drop the failed transfer.
+                await asyncio.sleep(2.0)
+            if await self.uploadImage(image):
+                return
+        self.onLog("Upgrade failed\n")
+
+    async def uploadImage(self, image):
+        # One upgrade command and TFTP transfer.  Returns True once the
+        # device acknowledged the last block.
+        upgradeData = image.data
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: LPQueueProtocol(self), local_addr=('0.0.0.0', 0))
+        try:
+            upgradereq = bytes("<command>upgrade {}</command>".format(len(upgradeData)), "utf-8")
+            self.sendDatagram(transport, upgradereq, self.lpip, capture.KIND_TFTP)
+            try:
+                (brcv, address) = await asyncio.wait_for(protocol.queue.get(), 2)
+            except asyncio.TimeoutError:
+                self.onLog("Upgrade response timeout\n")
+                return False
+
+            # The device answers with a TFTP read request, possibly carrying
+            # blksize and windowsize options (RFC 2347, 2348, 7440).
+            options = parseTFTPRequest(brcv)
+            if options == None:
+                self.onLog("Bad response to upgrade\n")
+                return False
+
+            tftpip = (self.lpip[0], TFTP_PORT)
+            negotiated = await self.negotiate(transport, protocol, tftpip, options)
+            if negotiated == None:
+                self.onLog("Upgrade option negotiation failed\n")
+                return False
+            blksize, windowsize = negotiated
+            self.onLog("Upgrade: {} bytes, {} byte blocks, window {}\n".format(
+                len(upgradeData), blksize, windowsize))
+            blocks = image.encoded(('tftp', blksize), lambda: encodeBlocks(upgradeData, blksize))
+            if await self.sendBlocks(transport, protocol, tftpip, blocks, len(upgradeData), windowsize):
+                self.onLog("Upload complete\n")
+                return True
+            return False
+        finally:
+            transport.close()
+
+    async def sendBlocks(self, transport, protocol, tftpip, blocks, size, windowsize):
+        # Keeps up to windowsize blocks in flight.  ACKs are cumulative, so
+        # on an ACK the window slides past the acknowledged block, and on a
+        # timeout everything after the last acknowledged block is resent
+        # (go back N).  Block numbers are absolute here, 1 based, and wrap
+        # at 16 bits on the wire.
+        nBlocks = len(blocks)
+        blksize = len(blocks[0]) - 4
+        acked = 0           # highest block acknowledged
+        nextBlock = 1       # next block not sent yet
+        sentAt = {}         # block -> send time
+        resentUpTo = 0      # no RTT samples from resent blocks (Karn)
+        goneBackAt = -1     # acked when we last went back on a duplicate ACK
+        rtt = None
+        timeouts = 0
+        started = time.monotonic()
+        nextReport = 5
+
+        while acked < nBlocks:
+            while nextBlock <= nBlocks and nextBlock <= acked + windowsize:
+                self.sendDatagram(transport, blocks[nextBlock - 1], tftpip, capture.KIND_TFTP)
+                sentAt[nextBlock] = time.monotonic()
+                nextBlock += 1
+
+            if rtt == None:
+                rto = 1.0
+            else:
+                rto = min(1.0, max(0.05, 4.0 * rtt))
+            r = await self.receiveTFTP(protocol, rto)
+            if r == None:
+                timeouts += 1
+                if timeouts > TFTP_RETRIES:
+                    self.onLog("Upgrade too many tries at block {}\n".format(acked + 1))
+                    return False
+                resentUpTo = nextBlock - 1
+                nextBlock = acked + 1
+                continue
+            opcode, wireBlock, brcv = r
+            if opcode == TFTP_ERROR:
+                self.onLog("Upgrade error from device: {}\n".format(
+                    brcv[4:].decode("utf-8", "replace").rstrip("\0")))
+                return False
+            if opcode != TFTP_ACK:
+                continue
+
+            # Map the 16 bit block number into the blocks in flight.
+            ackBlock = acked + ((wireBlock - acked) & 0xffff)
+            if ackBlock <= acked or ackBlock >= nextBlock:
+                # Duplicate or stale ACK.  A duplicate means the receiver
+                # lost the block after it, resend from there, once.
+                if ackBlock == acked and goneBackAt != acked:
+                    goneBackAt = acked
+                    resentUpTo = nextBlock - 1
+                    nextBlock = acked + 1
+                continue
+
+            t = sentAt.get(ackBlock)
+            if t != None and ackBlock > resentUpTo:
+                sample = time.monotonic() - t
+                rtt = sample if rtt == None else 0.875 * rtt + 0.125 * sample
+            for b in range(acked + 1, ackBlock + 1):
+                sentAt.pop(b, None)
+            acked = ackBlock
+            timeouts = 0
+
+            percent = acked * 100 // nBlocks
+            if percent >= nextReport or acked == nBlocks:
+                elapsed = time.monotonic() - started
+                done = min(acked * blksize, size)
+                rate = done / elapsed / 1024.0 if elapsed > 0 else 0.0
+                self.onLog("{}% complete, {:.0f} KB/s\n".format(percent, rate))
+                nextReport = percent - percent % 5 + 5
+        return True
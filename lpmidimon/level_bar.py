@@ -4,6 +4,49 @@
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import Qt
 
+# Pre-rendered bars keyed on (width, height, steps), shared by all LevelBars
+# of the same size.  Each entry holds one pixmap per quantized level.
+_pixmapCache = {}
+
+def renderLevelPixmaps(w, h, steps):
+    key = (w, h, steps)
+    pixmaps = _pixmapCache.get(key)
+    if pixmaps is not None:
+        return pixmaps
+
+    if len(_pixmapCache) > 16:
+        _pixmapCache.clear()
+
+    black = QtGui.QBrush(QtGui.QColor('black'), Qt.SolidPattern)
+    red = QtGui.QBrush(QtGui.QColor('red'), Qt.SolidPattern)
+
+    # x and y with origin at lower left.  Paint canvas has different origin
+    # but we will adjust later.
+    x = 5
+    hh = h - 2 * 5
+    ww = w - 2 * x
+    hstep = float(hh) / steps
+    hbar = float(hstep) * 0.8
+
+    pixmaps = []
+    for steplevel in range(steps + 1):
+        pm = QtGui.QPixmap(max(w, 1), max(h, 1))
+        painter = QtGui.QPainter(pm)
+        painter.fillRect(QtCore.QRect(0, 0, int(w), int(h)), black)
+
+        y = 5 + hbar
+        for i in range(steplevel):
+            xd = (steps - i)/2
+            r = QtCore.QRect(int(x), int(h - y), int(ww - xd * 2), int(hbar))
+            y += hstep
+            painter.fillRect(r, red)
+
+        painter.end()
+        pixmaps.append(pm)
+
+    _pixmapCache[key] = pixmaps
+    return pixmaps
+
 class LevelBar(QtWidgets.QWidget):
 
     def __init__(self, *args, **kwargs):
@@ -15,47 +58,36 @@ class LevelBar(QtWidgets.QWidget):
         )
         self.steps = 20
         self.level = 0
+        self.steplevel = 0
         self.level_valid = False
+        self.pixmaps = None
 
     def setLevel(self, new_level):
+        # Returns True if the widget repaints.
         self.level = new_level
+
+        stepsize = 100.0 / self.steps
+        steplevel = int((new_level + (stepsize / 2.0)) / stepsize)
+        steplevel = max(0, min(self.steps, steplevel))
+
+        # Nothing to repaint unless the bar actually moves a step.
+        if self.level_valid and steplevel == self.steplevel:
+            return False
+
+        self.steplevel = steplevel
         self.level_valid = True
         self.update()
+        return True
+
+    def resizeEvent(self, e):
+        self.pixmaps = renderLevelPixmaps(self.width(), self.height(), self.steps)
 
     def paintEvent(self, e):
         if self.level_valid:
+            if self.pixmaps is None:
+                self.pixmaps = renderLevelPixmaps(self.width(), self.height(), self.steps)
             painter = QtGui.QPainter(self)
-            h = painter.device().height()
-            w = painter.device().width()
-
-            brush = QtGui.QBrush()
-            brush.setColor(QtGui.QColor('black'))
-            brush.setStyle(Qt.SolidPattern)
-            rect = QtCore.QRect(0, 0, int(w), int(h))
-            painter.fillRect(rect, brush)
-
-            stepsize = 100.0 / self.steps
-            steplevel = int((self.level + (stepsize / 2.0)) / stepsize)
-
-            # x and y with origin at lower left.  Paint canvas has different origin
-            # but we will adjust later.
-            x = 5
-            y = 5
-            hh = h - 2 * y
-            ww = w - 2 * x
-            hstep = float(hh) / self.steps
-            hbar = float(hstep) * 0.8
-            y += hbar
-
-            # print("h {}, hh {}, hstep {}, hbar {}".format(h, hh, hstep, hbar))
-
-            brush.setColor(QtGui.QColor('red'))
-            for i in range(steplevel):
-                xd = (self.steps - i)/2
-                r = QtCore.QRect(int(x), int(h - y), int(ww - xd * 2), int(hbar))
-                y += hstep
-                painter.fillRect(r, brush)
-
+            painter.drawPixmap(0, 0, self.pixmaps[self.steplevel])
             painter.end()
 
     def sizeHint(self):
@@ -0,0 +1,44 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import threading
+from collections import deque
+
+class LogBuffer:
+    # Bounded log text buffer between the receive threads and the UI.  Text
+    # is kept as a deque of chunks, and once more than maxChars are pending
+    # the oldest chunks are dropped and counted in droppedChars.
+    def __init__(self, maxChars=64 * 1024):
+        self.maxChars = maxChars
+        self.chunks = deque()
+        self.size = 0
+        self.droppedChars = 0
+        self.lock = threading.Lock()
+
+    def append(self, text):
+        if len(text) == 0:
+            return
+
+        self.lock.acquire()
+        if len(text) > self.maxChars:
+            self.droppedChars += len(text) - self.maxChars
+            text = text[-self.maxChars:]
+        self.chunks.append(text)
+        self.size += len(text)
+        while self.size > self.maxChars:
+            old = self.chunks.popleft()
+            self.size -= len(old)
+            self.droppedChars += len(old)
+        self.lock.release()
+
+    def drain(self):
+        # Returns all pending text as one batch.
+        self.lock.acquire()
+        chunks = self.chunks
+        self.chunks = deque()
+        self.size = 0
+        self.lock.release()
+        return ''.join(chunks)
+
+    def getDropped(self):
+        return self.droppedChars
@@ -0,0 +1,466 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import random
+import re
+import threading
+import time
+
+import cmdqueue
+import configcache
+from buttonmap import ButtonMapReader
+from cmdqueue import CommandQueue
+from lpstatus import LPStatus
+from pollscheduler import PollScheduler
+from statushistory import StatusHistory
+
+def getDeviceIP(name):
+    # IP devices are named "<address> <id>" or just "<address>", anything
+    # else is a MIDI port.
+    ip = re.search(r'^(\d+\.\d+\.\d+\.\d+)( |$)', name)
+    if ip:
+        return ip.group(1)
+    return None
+
+def getReplayFile(name):
+    # Devices named "replay:<capture file>" play back a capture.
+    if name.startswith("replay:"):
+        return name[len("replay:"):]
+    return None
+
+def getDiscoveryID(name):
+    # The id an IP device answered discovery with, if it is in the name.
+    m = re.search(r'^\d+\.\d+\.\d+\.\d+ (.+)$', name)
+    if m:
+        return m.group(1)
+    return None
+
+# A cached configuration is used if these many button groups, picked at
+# random, and the effects read back the same as cached.
+CONFIG_CHECK_GROUPS = 4
+
+# Without a discovery id the cache is keyed by the hardware id (0x33,28).
+HARDWARE_ID_TIMEOUT = 1.0
+
+# Changes to the configuration are written to the cache this many seconds
+# after the first one, all at once.
+CONFIG_SAVE_DELAY = 2.0
+
+class LPDevice:
+    # One monitored Looperlative device: its status, known configuration,
+    # outbound queue, poll pacing and transport.  Does not depend on Qt, so
+    # several devices can be polled from one process, with or without a UI.
+    #
+    # onSysex(device, b) receives all sysex other than status and log, after
+    # effect and button map replies were parsed into effects1/2 and
+    # midiButtonDict, and onMIDI(device, msg) all non sysex MIDI messages.
+    def __init__(self, inName, outName, onSysex=None, onMIDI=None):
+        self.inName = inName
+        self.outName = outName
+        self.name = outName
+        self.onSysex = onSysex
+        self.onMIDI = onMIDI
+
+        self.status = LPStatus()
+        self.history = StatusHistory()
+        # Status packets received, changed or not.
+        self.statusCount = 0
+        self.pollScheduler = PollScheduler()
+        self.cmdQueue = CommandQueue()
+        self.cmdQueue.addListener(self.pollScheduler.wake)
+        self.transport = None
+        self.capture = None
+        # Replay speed of a replay device, 0 for as fast as possible.
+        self.replaySpeed = 1.0
+        # Opens the ports of a MIDI device, see LPMIDITransport.
+        self.midiPorts = None
+
+        self.buttonReader = ButtonMapReader(self.cmdQueue, self.status.appendLog,
+                                            self.buttonMapRead)
+        self.midiButtonDict = {}
+        self.effects1 = []
+        self.effects2 = []
+        self.configRequested = False
+        # Bumped whenever the known configuration changes other than by a
+        # reply from the device, so that a UI can show it again.
+        self.configVersion = 0
+        self.pendingProfile = None
+        self.configLock = threading.Lock()
+
+        # Configuration cache state, see restoreConfig.
+        self.hardwareId = None
+        self.cacheKey = None
+        self.cached = None
+        self.checkGroups = []
+        self.effectsSeen = False
+        self.mapKnown = False
+        self.idTimer = None
+        self.saveTimer = None
+
+    def getIP(self):
+        for name in (self.outName, self.inName):
+            ipaddr = getDeviceIP(name)
+            if ipaddr:
+                return ipaddr
+        return None
+
+    def isIP(self):
+        return self.getIP() != None
+
+    def isRunning(self):
+        return self.transport != None
+
+    def getError(self):
+        # Why the transport ended, None while it runs or was stopped.
+        if self.transport == None:
+            return None
+        return self.transport.error
+
+    def isReplay(self):
+        return getReplayFile(self.outName) != None
+
+    def replayFinished(self):
+        return self.isReplay() and self.transport != None and self.transport.isFinished()
+
+    def setCapture(self, writer):
+        # Records the traffic of the device to a capture.CaptureWriter, or
+        # stops recording if writer is None.
+        self.capture = writer
+        if self.transport != None:
+            self.transport.capture = writer
+
+    def start(self):
+        if self.transport != None:
+            return
+        ipaddr = self.getIP()
+        replayFile = getReplayFile(self.outName)
+        if replayFile != None:
+            from replaytransport import LPReplayTransport
+            self.transport = LPReplayTransport(replayFile, self.cmdQueue, self.pollScheduler,
+                                               self.statusReceived, self.status.appendLog,
+                                               self.sysexReceived, self.midiReceived,
+                                               self.replaySpeed)
+        elif ipaddr:
+            from iptransport import LPIPTransport
+            self.transport = LPIPTransport(ipaddr, self.cmdQueue, self.pollScheduler,
+                                           self.statusReceived, self.status.appendLog,
+                                           self.sysexReceived)
+        else:
+            from miditransport import LPMIDITransport
+            self.transport = LPMIDITransport(self.inName, self.outName, self.cmdQueue,
+                                             self.pollScheduler, self.statusReceived,
+                                             self.status.appendLog, self.sysexReceived,
+                                             self.midiReceived, self.midiPorts)
+        self.transport.capture = self.capture
+        self.transport.start()
+
+    def stop(self):
+        if self.idTimer != None:
+            self.idTimer.cancel()
+            self.idTimer = None
+        if self.transport != None:
+            self.transport.stop()
+            self.transport = None
+        self.saveConfigCache()
+
+    def statusReceived(self, s):
+        self.statusCount += 1
+        self.status.setStatus(s)
+        self.history.append(s)
+        self.pollScheduler.statusReceived(s.statuses)
+
+    def sysexReceived(self, b):
+        if b[1:5] == [0, 2, 0x33, 9]:
+            self.parseEffectConfig(b[5:])
+        elif b[1:5] == [0, 2, 0x33, 15]:
+            self.parseButtonConfig(b[5:])
+        elif b[1:5] == [0, 2, 0x33, 29]:
+            self.hardwareIdReceived(b[5:-1])
+        if self.onSysex != None:
+            self.onSysex(self, b)
+
+    def parseButtonConfig(self, b):
+        # msb, lsb of the first button, count, then 8 functions of 2 bytes
+        # for each button.
+        if len(b) < 3:
+            self.status.appendLog("Short button map reply, {} bytes\n".format(len(b)))
+            return
+        btnnum = (b[0] << 7) + b[1]
+        btncnt = b[2]
+
+        # 3 + 128 bytes.  Sysex from a MIDI port always ends in f7 (mido
+        # frames it), so one trailing f7 does not count.
+        size = len(b)
+        if size > 0 and b[-1] == 0xf7:
+            size -= 1
+
+        bi = 3;
+        if btnnum != 0x3fff and btncnt == 8 and size == 131 :
+            for i in range(0, btncnt):
+                flist = []
+                for fi in range(0, 8):
+                    func = (b[bi] << 7) + b[bi+1]
+                    if func == 0x3fff:
+                        func = -1
+                    flist.append(func)
+                    bi += 2
+                self.midiButtonDict[btnnum + i] = flist
+            self.buttonReader.replyReceived(btnnum)
+        elif btnnum != 0x3fff:
+            # 0x3fff is the reply past the last button, nothing to read.
+            self.status.appendLog("Bad button map reply: button {}, count {}, {} bytes\n".format(
+                btnnum, btncnt, len(b)))
+
+    def parseEffectConfig(self, b):
+        if len(b) < 1 or len(b) < 1 + 4 * b[0]:
+            self.status.appendLog("Short effect configuration reply, {} bytes\n".format(len(b)))
+            return
+        neffects = b[0]
+        effects1 = []
+        effects2 = []
+        for i in range(0, neffects):
+            effectid = b[1+i*2] * 128 + b[2+i*2]
+            effects1.append(effectid)
+            effectid = b[neffects*2+1+i*2] * 128 + b[neffects*2+2+i*2]
+            effects2.append(effectid)
+        changed = effects1 != self.effects1 or effects2 != self.effects2
+        self.effects1 = effects1
+        self.effects2 = effects2
+        self.effectsReceived(changed)
+
+    def midiReceived(self, msg):
+        if self.onMIDI != None:
+            self.onMIDI(self, msg)
+
+    def queueCommand(self, cmd):
+        self.cmdQueue.put(cmdqueue.USER, [0,2,0x33,4,cmd])
+
+    def queueReadConfig(self):
+        self.configRequested = True
+        self.cached = None
+        self.cmdQueue.put(cmdqueue.BULK, [0,2,0x33,9], ('read', 9))
+        self.buttonReader.start()
+
+    def restoreConfig(self):
+        # Gets the configuration when the device is first shown: from the
+        # cache, if the device is known and a few reads agree with it, else
+        # read in full.  The cache is keyed by the discovery id, or else by
+        # the hardware id, which has to be asked for first.
+        self.configRequested = True
+        if self.isReplay():
+            # Whatever configuration the capture holds comes by itself.
+            return
+        did = getDiscoveryID(self.outName)
+        if did != None:
+            self.useCachedConfig("id:" + did)
+            return
+        self.cmdQueue.put(cmdqueue.BULK, [0,2,0x33,28], ('read', 28))
+        self.idTimer = threading.Timer(HARDWARE_ID_TIMEOUT, self.hardwareIdLost)
+        self.idTimer.daemon = True
+        self.idTimer.start()
+
+    def hardwareIdReceived(self, b):
+        s = ""
+        for n in b:
+            s += format(n, 'X')
+        self.configLock.acquire()
+        self.hardwareId = s
+        waiting = self.idTimer != None
+        if waiting:
+            self.idTimer.cancel()
+            self.idTimer = None
+        elif self.cacheKey == None and self.configRequested:
+            # Answered after the full read was started, remember it for
+            # the next time.
+            self.cacheKey = "hw:" + s
+        self.configLock.release()
+        if waiting:
+            self.useCachedConfig("hw:" + s)
+        else:
+            self.configChanged()
+
+    def hardwareIdLost(self):
+        self.configLock.acquire()
+        lost = self.idTimer != None
+        self.idTimer = None
+        self.configLock.release()
+        if lost:
+            self.status.appendLog("No hardware id, reading the configuration\n")
+            self.queueReadConfig()
+
+    def useCachedConfig(self, key):
+        self.cacheKey = key
+        if self.buttonReader.isRunning():
+            # A read started meanwhile, e.g. to apply a profile, it refreshes
+            # the cache when done.
+            return
+        cached = configcache.loadConfig(key)
+        if cached == None:
+            self.queueReadConfig()
+            return
+        buttons, effects1, effects2 = cached
+        self.midiButtonDict = {btn: list(flist) for btn, flist in buttons.items()}
+        self.effects1 = list(effects1)
+        self.effects2 = list(effects2)
+        self.configVersion += 1
+
+        self.cached = cached
+        self.checkGroups = random.sample(ButtonMapReader.allGroups(), CONFIG_CHECK_GROUPS)
+        self.effectsSeen = False
+        self.status.appendLog("Configuration from cache, checking it\n")
+        self.cmdQueue.put(cmdqueue.BULK, [0,2,0x33,9], ('read', 9))
+        self.buttonReader.start(self.checkGroups)
+
+    def checkCachedConfig(self, cached):
+        # Called when the check reads ended, True if they match the cache.
+        buttons, effects1, effects2 = cached
+        if not self.effectsSeen or not self.buttonReader.hasRead(self.checkGroups):
+            return False
+        if self.effects1 != effects1 or self.effects2 != effects2:
+            return False
+        for group in self.checkGroups:
+            for btn in range(group, group + 8):
+                if self.midiButtonDict.get(btn) != buttons.get(btn):
+                    return False
+        return True
+
+    def effectsReceived(self, changed):
+        # Called for every 0x33,9 reply, after effects1/2 were updated.
+        self.effectsSeen = True
+        if changed:
+            self.configChanged()
+
+    def configChanged(self):
+        # The cache is written CONFIG_SAVE_DELAY later on a timer thread, so
+        # edits and replies in a row cost one write, off the receive thread.
+        if self.cacheKey == None or not self.mapKnown:
+            return
+        self.configLock.acquire()
+        if self.saveTimer == None:
+            self.saveTimer = threading.Timer(CONFIG_SAVE_DELAY, self.saveConfigCache)
+            self.saveTimer.daemon = True
+            self.saveTimer.start()
+        self.configLock.release()
+
+    def saveConfigCache(self):
+        # Writes pending changes now, if there are any.
+        self.configLock.acquire()
+        pending = self.saveTimer != None
+        if pending:
+            self.saveTimer.cancel()
+            self.saveTimer = None
+        self.configLock.release()
+        if not pending or self.cacheKey == None or not self.mapKnown:
+            return
+        # list() copies the items in one step, replies may add buttons.
+        buttons = list(self.midiButtonDict.items())
+        configcache.saveConfig(self.cacheKey, {btn: list(flist) for btn, flist in buttons},
+                               list(self.effects1), list(self.effects2))
+
+    def effectMessage(self):
+        # All 16 effect slots go in one message, the protocol has no way to
+        # write fewer.
+        b = [0, 2, 0x33, 10, 8]
+        for i in self.effects1:
+            b.append((i >> 7) & 0x7f)
+            b.append(i & 0x7f)
+        for i in self.effects2:
+            b.append((i >> 7) & 0x7f)
+            b.append(i & 0x7f)
+        return b
+
+    def buttonMessage(btn, flist):
+        # One button per message, the protocol has no multi button write.
+        msb = (btn >> 7) & 0x7f
+        lsb = btn & 0x7f
+        msg = [0,2,0x33,16,msb,lsb]
+        for f in flist:
+            msg.append((f >> 7) & 0x7f)
+            msg.append(f & 0x7f)
+        return msg
+
+    def queueEffectConfig(self):
+        self.cmdQueue.put(cmdqueue.CONFIG, self.effectMessage(), ('write', 10))
+        self.configChanged()
+
+    def queueButtonConfig(self, btn, flist):
+        self.cmdQueue.put(cmdqueue.CONFIG, LPDevice.buttonMessage(btn, flist), ('write', 16, btn))
+        self.configChanged()
+
+    def applyProfile(self, name, buttons, effects1, effects2, readMap=True):
+        # Brings the device to a saved profile ({button: functions} and the
+        # two effect lists, either may be empty), sending only what differs
+        # from the known configuration.  Unless readMap is False the button
+        # map is read first if it is not completely known, buttons still
+        # unknown after that are written as they are.
+        self.configLock.acquire()
+        if readMap and len(buttons) > 0 and not self.mapKnown:
+            self.pendingProfile = (name, buttons, effects1, effects2)
+            self.configLock.release()
+            self.status.appendLog("Reading the button map before applying {}\n".format(name))
+            if not self.buttonReader.isRunning():
+                self.buttonReader.start()
+            return
+        self.pendingProfile = None
+        self.configLock.release()
+
+        started = time.monotonic()
+        msgs = []
+        for btn in sorted(buttons.keys()):
+            flist = list(buttons[btn])
+            if len(flist) == 8 and self.midiButtonDict.get(btn) != flist:
+                self.midiButtonDict[btn] = flist
+                msgs.append((LPDevice.buttonMessage(btn, flist), ('write', 16, btn)))
+        if len(effects1) == 8 and len(effects2) == 8:
+            if list(effects1) != self.effects1 or list(effects2) != self.effects2:
+                self.effects1 = list(effects1)
+                self.effects2 = list(effects2)
+                msgs.append((self.effectMessage(), ('write', 10)))
+        if len(msgs) == 0:
+            self.status.appendLog("{}: nothing to change\n".format(name))
+            return
+        self.configVersion += 1
+
+        nbytes = sum(len(msg) + 2 for msg, key in msgs)
+        remaining = [len(msgs)]
+
+        def onSent():
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                self.status.appendLog("{}: {} messages, {} bytes, sent in {:.2f} s\n".format(
+                    name, len(msgs), nbytes, time.monotonic() - started))
+
+        for msg, key in msgs:
+            self.cmdQueue.put(cmdqueue.CONFIG, msg, key, onSent)
+        self.configChanged()
+
+    def buttonMapRead(self):
+        # Called by the button map reader when a read ends, a full one or
+        # the check of a cached configuration.
+        cached = self.cached
+        self.cached = None
+        if cached != None and self.buttonReader.isPartial():
+            if not self.checkCachedConfig(cached):
+                self.status.appendLog("Configuration changed since it was cached, reading it again\n")
+                # Only the buttons just read are known until the read is done.
+                checked = set()
+                for group in self.checkGroups:
+                    checked.update(range(group, group + 8))
+                self.midiButtonDict = {btn: flist for btn, flist in self.midiButtonDict.items()
+                                       if btn in checked}
+                self.configVersion += 1
+                self.queueReadConfig()
+                return
+            self.mapKnown = True
+            self.status.appendLog("Cached configuration matches the device, full read skipped\n")
+        elif self.buttonReader.isComplete():
+            self.mapKnown = True
+            self.configChanged()
+
+        self.configLock.acquire()
+        profile = self.pendingProfile
+        self.pendingProfile = None
+        self.configLock.release()
+        if profile != None:
+            name, buttons, effects1, effects2 = profile
+            self.applyProfile(name, buttons, effects1, effects2, False)
@@ -1,167 +1,175 @@
 # Configuration mapping of function names to codes.
 #
 
-class LPFunctions():
-    def __init__(self, parent=None):
-        self.nameDict = {
-            100: "Switch-Record",
-            101: "SwitchPlay+CKSR",
-            104: "SwitchPlay",
-            47: "Sync Rec/Dub",
-            27: "MIDI Sync Rec",
-            124: "Q MIDI Sync Rec",
-            0: "Rec/Dub",
-            60: "Play/Stop Now",
-            1: "Play/Stop",
-            56: "Replay/All Stop",
-            35: "Play Retrigger",
-            13: "Play Now",
-            15: "Play",
-            17: "All Play Now",
-            19: "All Play",
-            14: "Stop Now",
-            16: "Stop",
-            18: "All Stop Now",
-            20: "All Stop",
-            2: "All Tracks",
-            3: "Select Track 1",
-            4: "Select Track 2",
-            5: "Select Track 3",
-            6: "Select Track 4",
-            7: "Select Track 5",
-            8: "Select Track 6",
-            9: "Select Track 7",
-            10: "Select Track 8",
-            36: "Select Group (1)",
-            37: "Select Group (2)",
-            38: "Select Group (3)",
-            39: "Select Group (4)",
-            40: "Select Group (5)",
-            41: "Select Group (6)",
-            42: "Select Group (7)",
-            43: "Select Group (8)",
-            44: "Select Group (9)",
-            45: "Select Group(10)",
-            11: "Track Erase",
-            12: "Track Level",
-            21: "Set As Clock Src",
-            22: "Next Track",
-            23: "Prev Track",
-            24: "Double",
-            25: "Triple",
-            26: "Quadruple",
-            28: "Reverse Track",
-            29: "Half Speed Tr",
-            30: "Feedback 100%",
-            31: "Feedback +10%",
-            32: "Feedback -10%",
-            33: "Feedback +5%",
-            34: "Feedback -5%",
-            46: "Cue Track",
-            48: "Replace",
-            49: "Replace+Original",
-            78: "Q Replace",
-            79: "Q Replace+Orig",
-            50: "Assign To AUX 1",
-            55: "Assign To AUX 2",
-            62: "Assign To MAIN",
-            82: "MIDI Stop",
-            51: "MIDI Start",
-            52: "Fast Scramble",
-            53: "Medium Scramble",
-            54: "Slow Scramble",
-            57: "Bounce",
-            58: "Sync Bounce",
-            59: "MIDI Sync Bounce",
-            61: "MIDI Bypass",
-            63: "Use Preset (0)",
-            64: "Use Preset (1)",
-            65: "Use Preset (2)",
-            66: "Use Preset (3)",
-            67: "Use Preset (4)",
-            68: "Use Preset (5)",
-            69: "Use Preset (6)",
-            70: "Use Preset (7)",
-            71: "Use Preset (8)",
-            72: "Use Preset (9)",
-            73: "Use Preset (10)",
-            74: "Pan Center",
-            77: "Fade/Swell",
-            76: "Fade",
-            75: "Swell",
-            80: "Copy",
-            81: "Undo",
-            126: "Redo",
-            83: "Octave lower",
-            84: "Minor 2nd",
-            85: "Major 2nd",
-            86: "Minor 3rd",
-            87: "Major 3rd",
-            88: "4th",
-            89: "Diminished 5th",
-            90: "5th",
-            91: "Minor 6th",
-            92: "Major 6th",
-            93: "Minor 7th",
-            94: "Major 7th",
-            95: "Original note",
-            96: "Except Track",
-            97: "Track Level 0",
-            98: "Track Level -5",
-            99: "Track Level +5",
-            102: "Shrink to 50%%",
-            103: "Stretch to 200%%",
-            125: "Pitch Octave Up",
-            105: "Random Restart",
-            106: "Quant Value 1",
-            107: "Quant Value 2",
-            108: "Quant Value 3",
-            109: "Quant Value 4",
-            110: "Quant Value 5",
-            111: "Quant Value 6",
-            112: "Quant Value 7",
-            113: "Quant Value 8",
-            114: "Quant Value 9",
-            115: "Quant Value 10",
-            116: "Quant Value 11",
-            117: "Quant Value 12",
-            118: "Quant Value 13",
-            119: "Quant Value 14",
-            120: "Quant Value 15",
-            121: "Quant Value 16",
-            122: "Quant Value 32",
-            123: "Quant Value 64",
-            129: "Retrigger Rand",
-            130: "Retrigger Once",
-            131: "LP2 switch",
-            2007: "LP2 Q Replace 1/7",
-            2008: "LP2 Q Replace 1/8",
-            2009: "LP2 Q Replace 1/9",
-            2010: "LP2 Q Replace 1/10",
-            2011: "LP2 Q Replace 1/11",
-            2012: "LP2 Q Replace 1/12",
-            2013: "LP2 Q Replace 1/13",
-            2016: "LP2 Q Replace 1/16",
-            2024: "LP2 Q Replace 1/24",
-            2064: "LP2 Q Replace 1/64",
-            2100: "LP2 Replace",
-            2101: "LP2 Select Other",
-            2102: "LP2 1/4 Speed",
-            2103: "LP2 1/2 Speed",
-            -1: ""
-        }
+NAMES = {
+    100: "Switch-Record",
+    101: "SwitchPlay+CKSR",
+    104: "SwitchPlay",
+    47: "Sync Rec/Dub",
+    27: "MIDI Sync Rec",
+    124: "Q MIDI Sync Rec",
+    0: "Rec/Dub",
+    60: "Play/Stop Now",
+    1: "Play/Stop",
+    56: "Replay/All Stop",
+    35: "Play Retrigger",
+    13: "Play Now",
+    15: "Play",
+    17: "All Play Now",
+    19: "All Play",
+    14: "Stop Now",
+    16: "Stop",
+    18: "All Stop Now",
+    20: "All Stop",
+    2: "All Tracks",
+    3: "Select Track 1",
+    4: "Select Track 2",
+    5: "Select Track 3",
+    6: "Select Track 4",
+    7: "Select Track 5",
+    8: "Select Track 6",
+    9: "Select Track 7",
+    10: "Select Track 8",
+    36: "Select Group (1)",
+    37: "Select Group (2)",
+    38: "Select Group (3)",
+    39: "Select Group (4)",
+    40: "Select Group (5)",
+    41: "Select Group (6)",
+    42: "Select Group (7)",
+    43: "Select Group (8)",
+    44: "Select Group (9)",
+    45: "Select Group(10)",
+    11: "Track Erase",
+    12: "Track Level",
+    21: "Set As Clock Src",
+    22: "Next Track",
+    23: "Prev Track",
+    24: "Double",
+    25: "Triple",
+    26: "Quadruple",
+    28: "Reverse Track",
+    29: "Half Speed Tr",
+    30: "Feedback 100%",
+    31: "Feedback +10%",
+    32: "Feedback -10%",
+    33: "Feedback +5%",
+    34: "Feedback -5%",
+    46: "Cue Track",
+    48: "Replace",
+    49: "Replace+Original",
+    78: "Q Replace",
+    79: "Q Replace+Orig",
+    50: "Assign To AUX 1",
+    55: "Assign To AUX 2",
+    62: "Assign To MAIN",
+    82: "MIDI Stop",
+    51: "MIDI Start",
+    52: "Fast Scramble",
+    53: "Medium Scramble",
+    54: "Slow Scramble",
+    57: "Bounce",
+    58: "Sync Bounce",
+    59: "MIDI Sync Bounce",
+    61: "MIDI Bypass",
+    63: "Use Preset (0)",
+    64: "Use Preset (1)",
+    65: "Use Preset (2)",
+    66: "Use Preset (3)",
+    67: "Use Preset (4)",
+    68: "Use Preset (5)",
+    69: "Use Preset (6)",
+    70: "Use Preset (7)",
+    71: "Use Preset (8)",
+    72: "Use Preset (9)",
+    73: "Use Preset (10)",
+    74: "Pan Center",
+    77: "Fade/Swell",
+    76: "Fade",
+    75: "Swell",
+    80: "Copy",
+    81: "Undo",
+    126: "Redo",
+    83: "Octave lower",
+    84: "Minor 2nd",
+    85: "Major 2nd",
+    86: "Minor 3rd",
+    87: "Major 3rd",
+    88: "4th",
+    89: "Diminished 5th",
+    90: "5th",
+    91: "Minor 6th",
+    92: "Major 6th",
+    93: "Minor 7th",
+    94: "Major 7th",
+    95: "Original note",
+    96: "Except Track",
+    97: "Track Level 0",
+    98: "Track Level -5",
+    99: "Track Level +5",
+    102: "Shrink to 50%%",
+    103: "Stretch to 200%%",
+    125: "Pitch Octave Up",
+    105: "Random Restart",
+    106: "Quant Value 1",
+    107: "Quant Value 2",
+    108: "Quant Value 3",
+    109: "Quant Value 4",
+    110: "Quant Value 5",
+    111: "Quant Value 6",
+    112: "Quant Value 7",
+    113: "Quant Value 8",
+    114: "Quant Value 9",
+    115: "Quant Value 10",
+    116: "Quant Value 11",
+    117: "Quant Value 12",
+    118: "Quant Value 13",
+    119: "Quant Value 14",
+    120: "Quant Value 15",
+    121: "Quant Value 16",
+    122: "Quant Value 32",
+    123: "Quant Value 64",
+    129: "Retrigger Rand",
+    130: "Retrigger Once",
+    131: "LP2 switch",
+    2007: "LP2 Q Replace 1/7",
+    2008: "LP2 Q Replace 1/8",
+    2009: "LP2 Q Replace 1/9",
+    2010: "LP2 Q Replace 1/10",
+    2011: "LP2 Q Replace 1/11",
+    2012: "LP2 Q Replace 1/12",
+    2013: "LP2 Q Replace 1/13",
+    2016: "LP2 Q Replace 1/16",
+    2024: "LP2 Q Replace 1/24",
+    2064: "LP2 Q Replace 1/64",
+    2100: "LP2 Replace",
+    2101: "LP2 Select Other",
+    2102: "LP2 1/4 Speed",
+    2103: "LP2 1/2 Speed",
+    -1: ""
+}
+
+DISPLAY_ORDER_LP2 = [
+    129, 130, 131, 2007, 2008, 2009, 2010, 2011, 2012, 2013, 2016, 2024, 2064, 2100,
+    2101, 2102, 2103, 100, 101, 104, 47, 27, 124, 0, 60, 1, 56, 35, 13, 15,
+    17, 19, 14, 16, 18, 20, 3, 4, 5, 6, 11, 21, 22, 23, 24, 25, 26, 28, 29,
+    30, 31, 32, 33, 34, 48, 49, 78, 79, 82, 51, 52, 53, 54, 74, 77, 76, 75,
+    81, 126, 83, 84, 85, 86, 87, 88, 89, 90, 91, 92, 93, 94, 95, 97, 98, 99,
+    102, 103, 125, 105, 106, 107, 108, 109, 110, 111, 112, 113, 114, 115, 116,
+    117, 118, 119, 120, 121, 122, 123, 57, 58, 59, 96, 2
+]
 
-        self.displayOrderLP2 = [
-            129, 130, 131, 2007, 2008, 2009, 2010, 2011, 2012, 2013, 2016, 2024, 2064, 2100,
-            2101, 2102, 2103, 100, 101, 104, 47, 27, 124, 0, 60, 1, 56, 35, 13, 15,
-            17, 19, 14, 16, 18, 20, 3, 4, 5, 6, 11, 21, 22, 23, 24, 25, 26, 28, 29,
-            30, 31, 32, 33, 34, 48, 49, 78, 79, 82, 51, 52, 53, 54, 74, 77, 76, 75,
-            81, 126, 83, 84, 85, 86, 87, 88, 89, 90, 91, 92, 93, 94, 95, 97, 98, 99,
-            102, 103, 125, 105, 106, 107, 108, 109, 110, 111, 112, 113, 114, 115, 116,
-            117, 118, 119, 120, 121, 122, 123, 57, 58, 59, 96, 2
-        ]
+DISPLAY_ORDER_LP1 = sorted(NAMES.keys())
 
-        self.displayOrderLP1 = sorted(list(self.nameDict.keys()))
+# Combo box index of each code, built once for all instances.
+INDEX_LP2 = {code: i for i, code in enumerate(DISPLAY_ORDER_LP2)}
+INDEX_LP1 = {code: i for i, code in enumerate(DISPLAY_ORDER_LP1)}
+
+class LPFunctions():
+    def __init__(self, parent=None):
+        self.nameDict = NAMES
+        self.displayOrderLP2 = DISPLAY_ORDER_LP2
+        self.displayOrderLP1 = DISPLAY_ORDER_LP1
 
     def get(self, id):
         return self.nameDict.get(id)
@@ -174,3 +182,21 @@ class LPFunctions():
 
     def values(self):
         return self.nameDict.values()
+
+    # Codes the lists do not know, e.g. from newer firmware, have index -1
+    # (nothing selected), and index -1 has code None.
+    def indexLP2(self, code):
+        return INDEX_LP2.get(code, -1)
+
+    def indexLP1(self, code):
+        return INDEX_LP1.get(code, -1)
+
+    def codeLP2(self, index):
+        if index < 0 or index >= len(DISPLAY_ORDER_LP2):
+            return None
+        return DISPLAY_ORDER_LP2[index]
+
+    def codeLP1(self, index):
+        if index < 0 or index >= len(DISPLAY_ORDER_LP1):
+            return None
+        return DISPLAY_ORDER_LP1[index]
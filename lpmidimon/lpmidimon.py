@@ -5,49 +5,71 @@
 # On Windows: install Visual C++ from Microsoft
 # On All Systems: pip install mido python-rtmidi PyQt5
 
-import mido
-import mido.backends.rtmidi
 import sys
 import time
 import threading
-import queue
 import json
-import psutil
-import socket
 import re
 import signal
-import requests
 from pathlib import Path
 from PyQt5 import QtCore, QtGui, QtWidgets
-from PyQt5.QtWidgets import QApplication, QFileDialog, QDialog
-from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication, QFileDialog, QDialog, QMessageBox, QInputDialog
+from PyQt5.QtCore import QTimer, QStringListModel, pyqtSignal
 from PyQt5.QtGui import QTextCursor
 from PyQt5.QtCore import Qt
 from copy import copy
 import lp2ctrlui
-from lpstatus import LPStatus
+from lpstatus import LPStatus, LPStatusSnapshot
 from level_bar import LevelBar
 from pan_bar import PanBar
+from sparkline import Sparkline
 from lpfunctions import LPFunctions
+import cmdqueue
+from lpdevice import LPDevice, getDeviceIP
+from capture import CaptureWriter
+from discovery import DeviceDiscovery, pruneDeviceCache
+import upgradestate
+from fleetview import FleetView
 from licensedialog import Ui_LicenseDialog
 
+# Refresh period of the window in ms, shorter until the first status of a
+# device is on screen, but for FAST_REFRESH_TIME ms at most.
+REFRESH_INTERVAL = 250
+FAST_REFRESH_INTERVAL = 25
+FAST_REFRESH_TIME = 2000
+
 class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
+    # Emitted from the transport threads, the slots run on the GUI thread.
+    configReceived = pyqtSignal()
+    buttonPressed = pyqtSignal(int, int)
+
     def __init__(self, parent=None):
         super(LP2CtrlApp, self).__init__(parent)
         self.lpFunctions = LPFunctions()
         self.setupUi(self)
 
+        # All effect boxes show one model, all step boxes the other, so a
+        # configuration update only moves their current index.
+        self.lp2Model = QStringListModel(
+            [self.lpFunctions.get(k) for k in self.lpFunctions.keys()], self)
+        self.lp1Model = QStringListModel(
+            [self.lpFunctions.get(k) for k in self.lpFunctions.keysLP1()], self)
+
         self.searchReturnLock = threading.Lock()
         self.searchReturn = []
-        self.upgradeFileLock = threading.Lock()
-        self.upgradeFile = ""
-
-        self.upgradeFlag = False
+        self.searchDone = None
+        self.knownDevices = {}
 
         self.midiInDevice = ""
         self.midiOutDevice = ""
+        self.fleetMode = False
+        self.devices = {}
+        self.device = None
+        self.capture = None
+        self.fleetView = None
+        self.action_in_devices = []
+        self.action_out_devices = []
         self.loadConfig()
-        self.initMIDIDeviceMenus()
 
         self.psliders = []
         self.vsliders = []
@@ -55,36 +77,22 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
         self.positions = []
         self.statuses = []
         self.fsliders = []
+        self.vsparks = []
+        self.fsparks = []
         self.tracktitles = []
         self.effect1boxes = []
         self.effect2boxes = []
         self.stepboxes = []
-        self.effects1 = []
-        self.effects2 = []
 
-        self.currentStatus = LPStatus()
-        self.lp2_cmd = 0
-        self.lp_sysex_q = queue.Queue()
+        self.renderedStatus = LPStatusSnapshot()
+        self.renderedConfig = -1
+        self.repaintsAvoided = 0
         self.parsingEffectConfig = False
-        self.requestEffectButtons = True
-        self.sendEffectConfig = False
-
-        self.endStatusTask = False
-        self.statusTh = None
-
-        self.endIPReceiver = False
-        self.ipReceiverTh = None
-        self.recvSock = None
-
         self.parsingMIDIButtonConfig = 0
-        self.requestMIDIButton = 0
 
         self.midiclockcount = -1
         self.midiclockstarttime = -1.0
 
-        self.restartStatusThread()
-
-        self.midiButtonDict = {}
         self.midibtntypelist = [ "PgmChange", "CC", "Note" ]
         for i in self.midibtntypelist:
             self.midibtntype.addItem(i)
@@ -112,28 +120,36 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
             self.psliders[i-1].setObjectName("pan_" + str(i))
             self.gridLayout.addWidget(self.psliders[i-1], 4, i, Qt.AlignCenter)
 
-            self.vsliders.append(LevelBar(self.gridLayoutWidget))
+            # Level and feedback bars have their history next to them.
+            self.vsliders.append(LevelBar())
             self.vsliders[i-1].setObjectName("volume_" + str(i))
-            self.gridLayout.addWidget(self.vsliders[i-1], 5, i, Qt.AlignCenter)
+            self.vsparks.append(Sparkline(minimum=-100.0, maximum=0.0))
+            self.gridLayout.addWidget(self.barWithSparkline(self.vsliders[i-1], self.vsparks[i-1]),
+                                      5, i, Qt.AlignCenter)
 
-            self.fsliders.append(LevelBar(self.gridLayoutWidget))
+            self.fsliders.append(LevelBar())
             self.fsliders[i-1].setObjectName("feedback_" + str(i))
-            self.gridLayout.addWidget(self.fsliders[i-1], 6, i, Qt.AlignCenter)
+            self.fsparks.append(Sparkline())
+            self.gridLayout.addWidget(self.barWithSparkline(self.fsliders[i-1], self.fsparks[i-1]),
+                                      6, i, Qt.AlignCenter)
 
             self.effect1boxes.append(QtWidgets.QComboBox(self.gridLayoutWidget_2))
             self.gridLayout_2.addWidget(self.effect1boxes[i-1], i, 1, 1, 1)
+            self.effect1boxes[i-1].setModel(self.lp2Model)
+            self.effect1boxes[i-1].setCurrentIndex(-1)
             self.effect1boxes[i-1].currentIndexChanged.connect(self.effectChanged)
 
             self.effect2boxes.append(QtWidgets.QComboBox(self.gridLayoutWidget_2))
             self.gridLayout_2.addWidget(self.effect2boxes[i-1], i, 2, 1, 1)
+            self.effect2boxes[i-1].setModel(self.lp2Model)
+            self.effect2boxes[i-1].setCurrentIndex(-1)
             self.effect2boxes[i-1].currentIndexChanged.connect(self.effectChanged)
 
             self.stepboxes.append(QtWidgets.QComboBox(self.gridLayoutWidget_2))
             row = 1 + int((i-1) / 4)
             col = 1 + ((i-1) & 3)
             self.gridLayout_3.addWidget(self.stepboxes[i-1], row, col, 1, 1)
-            for k in self.lpFunctions.keysLP1():
-                self.stepboxes[i-1].addItem(self.lpFunctions.get(k))
+            self.stepboxes[i-1].setModel(self.lp1Model)
             self.stepboxes[i-1].currentIndexChanged.connect(self.stepChanged)
 
         bpm = QtWidgets.QLabel(self.gridLayoutWidget)
@@ -145,10 +161,22 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
         self.midiclock.setText("???")
 
         self.plainTextEdit.setReadOnly(True)
+        self.logMaxLines = 5000
+        self.plainTextEdit.setMaximumBlockCount(self.logMaxLines)
+        self.logDropped = 0
+
+        self.pollRateLabel = QtWidgets.QLabel(self)
+        self.statusbar.addPermanentWidget(self.pollRateLabel)
+
+        self.configReceived.connect(self.showConfig)
+        self.buttonPressed.connect(self.showButton)
 
         self.actionEdit_Effect_Buttons.triggered.connect(self.handleEffectButtons)
         self.actionSave_LP_configuration.triggered.connect(self.handleSaveLPConf)
         self.actionLoad_LP_configuration.triggered.connect(self.handleLoadLPConf)
+        self.actionExport_History = QtWidgets.QAction("Export status history...", self)
+        self.menu_File.addAction(self.actionExport_History)
+        self.actionExport_History.triggered.connect(self.handleExportHistory)
 
         self.action_Upgrade.triggered.connect(self.handleUpgrade)
         self.actionLicense.triggered.connect(self.handleLicense)
@@ -157,32 +185,124 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
         self.actionRe_boot.triggered.connect(self.handleReboot)
         self.actionSD_Directory.triggered.connect(self.handleDirectory)
 
+        self.menu_Debug.addSeparator()
+        self.actionCapture = self.menu_Debug.addAction("Capture traffic...")
+        self.actionCapture.setCheckable(True)
+        self.actionCapture.triggered.connect(self.handleCapture)
+        self.actionReplay = self.menu_Debug.addAction("Replay capture...")
+        self.actionReplay.triggered.connect(self.handleReplay)
+
+        self.menuFleet = self.menubar.addMenu("F&leet")
+        self.actionFleet_Mode = self.menuFleet.addAction("Monitor all devices")
+        self.actionFleet_Mode.setCheckable(True)
+        self.actionFleet_Mode.setChecked(self.fleetMode)
+        self.actionFleet_Mode.triggered.connect(self.handleFleetMode)
+        self.actionTile_Devices = self.menuFleet.addAction("Tile devices")
+        self.actionTile_Devices.triggered.connect(self.handleTileDevices)
+
+        # Port enumeration, discovery and polling start once the window is
+        # up, see startDevices.
+        self.device = self.getDevice(self.midiInDevice, self.midiOutDevice)
+        QTimer.singleShot(0, self.startDevices)
+
+        # Refresh quickly until the first status is on screen.
         self.timer = QTimer()
         self.timer.timeout.connect(self.handleTimer)
-        self.timer.start(250)
-
-    def stopStatusThread(self):
-        if self.statusTh != None:
-            self.endStatusTask = True
-            self.statusTh.join()
-            self.endStatusTask = False
-            self.statusTh = None
-
-    def restartStatusThread(self):
-        self.stopStatusThread()
-        self.statusTh = threading.Thread(target=self.statusThread)
-        self.statusTh.start()
-
-    def startIPReceiver(self):
-        self.ipReceiverTh = threading.Thread(target=self.ipReceiverThread)
-        self.ipReceiverTh.start()
-
-    def stopIPReceiver(self):
-        if self.ipReceiverTh != None:
-            self.endIPReceiver = True
-            self.ipReceiverTh.join()
-            self.endIPReceiver = False
-            self.ipReceiverTh = None
+        self.fastRefreshTimer = QTimer()
+        self.fastRefreshTimer.setSingleShot(True)
+        self.fastRefreshTimer.timeout.connect(self.endFastRefresh)
+        self.timer.start(REFRESH_INTERVAL)
+        self.startFastRefresh()
+
+    def getDevice(self, inName, outName):
+        d = self.devices.get(outName)
+        if d != None and d.inName != inName:
+            d.stop()
+            d = None
+        if d == None:
+            d = LPDevice(inName, outName, self.processSysex, self.processMIDI)
+            self.devices[outName] = d
+        return d
+
+    def selectDevice(self):
+        # Shows midiInDevice/midiOutDevice in the main window.  Outside of
+        # fleet mode the previously shown device is stopped, in fleet mode
+        # it keeps being polled in the background.
+        self.showDevice(self.getDevice(self.midiInDevice, self.midiOutDevice))
+
+    def showDevice(self, d):
+        old = self.device
+        if old != None and old != d:
+            old.setCapture(None)
+            if not self.fleetMode or old.isReplay():
+                old.stop()
+                if self.devices.get(old.outName) == old:
+                    del self.devices[old.outName]
+
+        self.device = d
+        d.setCapture(self.capture)
+        d.start()
+        if not d.configRequested:
+            d.restoreConfig()
+
+        self.renderedStatus = LPStatusSnapshot()
+        self.renderedConfig = d.configVersion
+        self.showConfig()
+        self.startFastRefresh()
+
+    def startFastRefresh(self):
+        self.timer.setInterval(FAST_REFRESH_INTERVAL)
+        self.fastRefreshTimer.start(FAST_REFRESH_TIME)
+
+    def endFastRefresh(self):
+        self.fastRefreshTimer.stop()
+        if self.timer.interval() != REFRESH_INTERVAL:
+            self.timer.setInterval(REFRESH_INTERVAL)
+
+    def startDevices(self):
+        # The saved device is polled first, it is the one the user waits for.
+        self.selectDevice()
+        self.initMIDIDeviceMenus()
+
+    def startFleet(self):
+        for a in self.action_out_devices:
+            if getDeviceIP(a.data()):
+                self.getDevice(a.data(), a.data()).start()
+
+    def stopAllDevices(self):
+        for d in self.devices.values():
+            d.stop()
+
+    def handleFleetMode(self, chk):
+        self.fleetMode = chk
+        if chk:
+            self.startFleet()
+        else:
+            for name, d in list(self.devices.items()):
+                if d != self.device:
+                    d.stop()
+                    del self.devices[name]
+        self.saveConfig()
+
+    def handleTileDevices(self):
+        if self.fleetView == None:
+            self.fleetView = FleetView(self.selectDeviceByName)
+        self.fleetView.setDevices(list(self.devices.values()))
+        self.fleetView.show()
+        self.fleetView.raise_()
+
+    def selectDeviceByName(self, name):
+        d = self.devices.get(name)
+        if d == None:
+            return
+        self.midiInDevice = d.inName
+        self.midiOutDevice = d.outName
+        for a in self.action_in_devices:
+            a.setChecked(a.data() == self.midiInDevice)
+        for a in self.action_out_devices:
+            a.setChecked(a.data() == self.midiOutDevice)
+        self.selectDevice()
+        self.saveConfig()
 
     def processINDevice(self, chk):
         if not chk:
@@ -198,7 +318,7 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
             for a in self.action_out_devices:
                 a.setChecked(a.data() == self.midiOutDevice)
 
-        self.restartStatusThread()
+        self.selectDevice()
         self.saveConfig()
 
     def processOUTDevice(self, chk):
@@ -215,43 +335,75 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
             for a in self.action_in_devices:
                 a.setChecked(a.data() == self.midiInDevice)
 
-        self.restartStatusThread()
+        self.selectDevice()
         self.saveConfig()
 
 
-    def searchForDeviceThread(self, baddr):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        b = bytes("<query>id</query>\0", "utf-8")
-        sock.sendto(b, (baddr, 5667))
+    def deviceFound(self, name):
+        # Called on the discovery thread.
+        self.searchReturnLock.acquire()
+        self.searchReturn.append(name)
+        self.searchReturnLock.release()
 
-        while True:
-            try:
-                sock.settimeout(2)
-                (brcv, address) = sock.recvfrom(1024)
-                if brcv[0] == 0xf0:
-                    continue
-                m = re.search('<id>(.*)</id>', brcv.decode("utf-8"))
-                mitem = "{} {}".format(address[0], m.group(1))
-                self.searchReturnLock.acquire()
-                self.searchReturn.append(mitem)
-                self.searchReturnLock.release()
-            except socket.timeout:
-                sock.close()
+    def searchDoneCallback(self, names):
+        # Called on the discovery thread.
+        self.searchReturnLock.acquire()
+        self.searchDone = names
+        self.searchReturnLock.release()
+
+    def searchForDevices(self):
+        # Known devices are asked directly as well, in case they are not on
+        # a broadcast domain of this host.
+        known = [getDeviceIP(n) for n in self.knownDevices if getDeviceIP(n)]
+        DeviceDiscovery(self.deviceFound, self.searchDoneCallback, known).start()
+
+    def addDeviceActions(self, n):
+        # Adds device n to both device menus, unless it is already there.
+        for a in self.action_out_devices:
+            if a.data() == n:
                 return
 
-    def searchForDevice(self, baddr):
-        th = threading.Thread(target=self.searchForDeviceThread, args=(baddr, ))
-        th.daemon = True
-        th.start()
+        self.action_in_devices.append(QtWidgets.QAction(self))
+        d = self.action_in_devices[-1]
+        d.setCheckable(True)
+        d.setChecked(n == self.midiInDevice)
+        d.setText(n)
+        d.setData(n)
+        d.triggered.connect(self.processINDevice)
+        self.menuMIDI_IN_device.addAction(self.action_in_devices[-1])
+
+        self.action_out_devices.append(QtWidgets.QAction(self))
+        d = self.action_out_devices[-1]
+        d.setCheckable(True)
+        d.setChecked(n == self.midiOutDevice)
+        d.setText(n)
+        d.setData(n)
+        d.triggered.connect(self.processOUTDevice)
+        self.menuMIDI_OUT_device.addAction(self.action_out_devices[-1])
+
+        if self.fleetMode:
+            self.getDevice(n, n).start()
+
+    def removeDeviceActions(self, n):
+        for actions, menu in ((self.action_in_devices, self.menuMIDI_IN_device),
+                              (self.action_out_devices, self.menuMIDI_OUT_device)):
+            for a in list(actions):
+                if a.data() == n:
+                    menu.removeAction(a)
+                    actions.remove(a)
+
+        d = self.devices.get(n)
+        if d != None and d != self.device:
+            d.stop()
+            del self.devices[n]
 
     def initMIDIDeviceMenus(self):
+        import mido
+        import mido.backends.rtmidi
+
         self.innames = set(mido.get_input_names())
         self.outnames = set(mido.get_output_names())
 
-        self.action_in_devices = []
-        self.action_out_devices = []
-
         for n in self.innames:
             self.action_in_devices.append(QtWidgets.QAction(self))
             d = self.action_in_devices[-1]
@@ -272,38 +424,37 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
             d.triggered.connect(self.processOUTDevice)
             self.menuMIDI_OUT_device.addAction(self.action_out_devices[-1])
 
-        # Look for IP Looperlative devices
-        for name, addrs in psutil.net_if_addrs().items():
-            for addr in addrs:
-                if addr.family == socket.AF_INET:
-                    if addr.broadcast:
-                        self.searchForDevice(addr.broadcast)
-
-    def processSysex(self, b):
-        if b[1:5] == [0, 2, 0x33, 2]:
-            s = LPStatus()
-            s.parseMIDIStatus(b)
-            self.currentStatus.setStatus(s)
-        elif b[1:5] == [0, 2, 0x33, 3] and b[5] != 0xf7:
-            self.currentStatus.appendLog(''.join(map(chr, b[5:-1])))
+        # IP devices seen recently are listed right away, discovery then
+        # confirms them and adds new ones.
+        for n in sorted(self.knownDevices):
+            self.addDeviceActions(n)
+        self.searchForDevices()
+
+    def processSysex(self, device, b):
+        # The device already parsed configuration replies, only the
+        # device on screen is of interest here.
+        if device != self.device:
+            pass
         elif b[1:5] == [0, 2, 0x33, 9]:
-            self.parseEffectConfig(b[5:])
+            self.configReceived.emit()
         elif b[1:5] == [0, 2, 0x33, 15]:
-            self.parseButtonConfig(b[5:])
+            # Show the current button again if it was in the reply.
+            btnnum = (b[5] << 7) + b[6]
+            currentbtn = self.midibtntype.currentIndex() * 128 + self.midibtnnum.currentIndex()
+            if btnnum <= currentbtn < btnnum + 8:
+                self.configReceived.emit()
         elif b[1:5] == [0, 2, 0x33, 24]:
             # user pressed a button b[5]=button type, b[6]=button number
-            self.midibtntype.setCurrentIndex(int(b[5]))
-            self.midibtnnum.setCurrentIndex(int(b[6]))
+            self.buttonPressed.emit(int(b[5]), int(b[6]))
         elif b[1:5] == [0, 2, 0x33, 29]:
             self.processLicenseID(b[5:-1])
             pass
         else:
             pass
 
-    def processMIDI(self, msg):
-        b = msg.bytes()
-        if msg.type == 'sysex':
-            self.processSysex(b)
+    def processMIDI(self, device, msg):
+        if device != self.device:
+            pass
         elif msg.type == 'clock':
             self.midiclockcount += 1
 
@@ -320,227 +471,17 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
                 except:
                     pass
 
-    def doIPUpgrade(self, fileName, lpip):
-        print("Upgrade {} with {}".format(lpip, fileName))
-        with open(fileName, mode="rb") as upgradeFile:
-            upgradeData = upgradeFile.read()
-            upgradereq = bytes("<command>upgrade {}</command>".format(len(upgradeData)), "utf-8")
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                sock.sendto(upgradereq, lpip)
-                sock.settimeout(2)
-                try:
-                    (brcv, address) = sock.recvfrom(2048)
-                except:
-                    print("Upgrade response timeout")
-                    return
-
-                reqtype = int.from_bytes(brcv[0:2], "big")
-                m = re.search('(.*)\0(.*)\0', brcv[2:].decode("utf-8"))
-                if not m:
-                    print("Bad response to upgrade")
-                    return
-
-                blockNum = 1
-                filePos = 0
-                nTrys = 0
-
-                tftpip = (lpip[0], 4069)
-
-                while filePos < len(upgradeData):
-                    nTrys += 1
-                    block = bytes([0, 3, int(blockNum / 256), int(blockNum % 256)])
-                    block += upgradeData[filePos: filePos + 512]
-                    sock.sendto(block, tftpip)
-                    sock.settimeout(1)
-                    try:
-                        (brcv, address) = sock.recvfrom(2048)
-                    except:
-                        if nTrys > 10:
-                            print("Upgrade too many tries")
-                            return
-                        continue
-                    ack = int(brcv[1])
-                    ackBlock = int.from_bytes(brcv[2:4], "big")
-                    if ackBlock == blockNum:
-                        blockNum += 1
-                        blockNum &= 0xffff
-                        nTrys = 0
-                        filePos += 512
-                    elif nTrys > 10:
-                        print("Too many attempts")
-                        return
-
-    def ipReceiverThread(self):
-        sock = self.recvSock
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
-        while not self.endIPReceiver:
-            try:
-                sock.settimeout(1)
-                (brcv, address) = sock.recvfrom(2048)
-                if brcv[0] == 0 and len(brcv) == 232:
-                    s = LPStatus()
-                    s.parseIPStatus(brcv)
-                    self.currentStatus.setStatus(s)
-                elif brcv[0] == 0xf0:
-                    self.processSysex(list(brcv))
-                else:
-                    m = re.search('<log>(.*)</log>', brcv.decode("utf-8"), re.DOTALL)
-                    if m:
-                        self.currentStatus.appendLog(m.group(1))
-
-            except socket.timeout:
-                pass
-            except OSError as msg:
-                print(msg)
-
-    def pollIPStatus(self, ipaddr):
-        time.sleep(0.05)
-
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        lpip = (ipaddr, 5667)
-
-        statusreq = bytes("<query>status compact</query>\0", "utf-8")
-        logreq = bytes("<query>log</query>\0", "utf-8")
-        sock.sendto(statusreq, lpip)
-        self.recvSock = sock.dup()
-        self.startIPReceiver()
-
-        while not self.endStatusTask:
-            sock.sendto(statusreq, lpip)
-            time.sleep(0.1)
-            sock.sendto(logreq, lpip)
-            time.sleep(0.1)
-
-            if self.lp2_cmd != 0:
-                cmdreq = bytes("<userinput>{}</userinput>\0".format(chr(self.lp2_cmd)), "utf-8")
-                print(cmdreq)
-                sock.sendto(cmdreq, lpip)
-                self.lp2_cmd = 0
-            elif not self.lp_sysex_q.empty():
-                msg = bytes([0xf0] + self.lp_sysex_q.get() + [0xf7])
-                sock.sendto(msg, lpip)
-            elif self.requestMIDIButton < 384:
-                msb = (self.requestMIDIButton >> 7) & 0x7f
-                lsb = self.requestMIDIButton & 0x7f
-                msg = bytes([0xf0] + [0,2,0x33,14,msb,lsb,8] + [0xf7])
-                sock.sendto(msg, lpip)
-                self.requestMIDIButton += 8
-
-            time.sleep(0.1)
-
-            self.upgradeFileLock.acquire()
-            fileName = self.upgradeFile
-            self.upgradeFile = ""
-            self.upgradeFileLock.release()
-
-            if len(fileName) > 0:
-                self.doIPUpgrade(fileName, lpip)
-
-        sock.close()
-        self.stopIPReceiver()
-
-    def statusThread(self):
-        ip = re.search('^(\d+\.\d+\.\d+\.\d+) ', self.midiOutDevice)
-        if ip:
-            self.pollIPStatus(ip.group(1))
-            return
-
-        ip = re.search('^(\d+\.\d+\.\d+\.\d+) ', self.midiInDevice)
-        if ip:
-            self.pollIPStatus(ip.group(1))
-            return
-
-        try:
-            outport = mido.open_output(self.midiOutDevice)
-        except:
-            print("Couldn't open {}".format(self.midiOutDevice))
-            return
-
-        try:
-            inport = mido.open_input(self.midiInDevice, callback=self.processMIDI)
-        except:
-            print("Couldn't open {}".format(self.midiInDevice))
-            outport.close()
-            return
-
-        try:
-            statusRequest = mido.Message('sysex', data=[0,2,0x33,2])
-            logRequest = mido.Message('sysex', data=[0,2,0x33,3])
-
-            while not self.endStatusTask:
-                if self.upgradeFlag:
-                    total_lines = float(len(self.upgradeMessages))
-                    target_percent = 5.0
-                    count = 0.0
-                    for i in self.upgradeMessages:
-                        outport.send(i)
-                        time.sleep(0.07)
-                        count += 1.0
-                        percent = (count / total_lines) * 100.0
-                        if percent >= target_percent:
-                            self.currentStatus.appendLog(str(int(percent)) + '% complete\n')
-                            target_percent += 5.0
-                    self.upgradeMessages = None
-                    self.upgradeFlag = False
-                    self.currentStatus.appendLog("Completed\n");
-                elif self.lp2_cmd != 0:
-                    cmdRequest = mido.Message('sysex', data=[0,2,0x33,4,self.lp2_cmd])
-                    outport.send(cmdRequest)
-                    self.lp2_cmd = 0
-                elif not self.lp_sysex_q.empty():
-                    msg = self.lp_sysex_q.get()
-                    btnReq = mido.Message('sysex', data=msg)
-                    outport.send(btnReq)
-                elif self.requestEffectButtons:
-                    self.requestEffectButtons = False
-                    btnReq = mido.Message('sysex', data=[0,2,0x33,9])
-                    outport.send(btnReq)
-                elif self.requestMIDIButton < 384:
-                    msb = (self.requestMIDIButton >> 7) & 0x7f
-                    lsb = self.requestMIDIButton & 0x7f
-                    btnReq = mido.Message('sysex', data=[0,2,0x33,14,msb,lsb,8])
-                    outport.send(btnReq)
-                    self.requestMIDIButton += 8
-                    time.sleep(0.05)
-                elif self.sendEffectConfig:
-                    self.sendEffectConfig = False
-                    b = [0, 2, 0x33, 10, 8]
-                    for i in self.effects1:
-                        b.append((i >> 7) & 0x7f)
-                        b.append(i & 0x7f)
-                    for i in self.effects2:
-                        b.append((i >> 7) & 0x7f)
-                        b.append(i & 0x7f)
-                    saveEffectsReq = mido.Message('sysex', data=b)
-                    outport.send(saveEffectsReq)
-                    time.sleep(0.3)
-                else:
-                    outport.send(logRequest)
-                    time.sleep(0.2)
-                    outport.send(statusRequest)
-                    time.sleep(0.2)
-        except Exception as err:
-            print(type(err))
-            print(err.args)
-            print(err)
-        finally:
-            outport.close()
-            inport.close()
-
     def handleStatus(self):
-        self.lp2_cmd = ord('s')
+        self.device.queueCommand(ord('s'))
 
     def handleMIDIStatus(self):
-        self.lp2_cmd = ord('m')
+        self.device.queueCommand(ord('m'))
 
     def handleReboot(self):
-        self.lp2_cmd = ord('b')
+        self.device.queueCommand(ord('b'))
 
     def handleDirectory(self):
-        self.lp2_cmd = ord('d')
+        self.device.queueCommand(ord('d'))
 
     def handleLicenseOkButton(self):
         email = self.license_ui.emailentry.text()
@@ -554,6 +495,7 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
                 'hwid': self.license_hardware_id,
             }
             posturl = 'https://upgrade.looperlative.com/cgi-bin/getlicense'
+            import requests
             response = requests.post(posturl, postdata)
             if 'Status' in response.text:
                 print(response.text)
@@ -562,12 +504,12 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
                 msg = [0,2,0x33,30]
                 for c in lstr:
                     msg.append(ord(c))
-                self.lp_sysex_q.put(msg)
+                self.device.cmdQueue.put(cmdqueue.USER, msg)
                 # print(lstr)
 
     def handleLicense(self):
         msg = [0,2,0x33,28]
-        self.lp_sysex_q.put(msg)
+        self.device.cmdQueue.put(cmdqueue.USER, msg)
 
         self.license_dlg = QDialog(self)
         self.license_ui = Ui_LicenseDialog()
@@ -577,27 +519,103 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
         self.license_dlg.show()
 
     def handleUpgrade(self):
-        if re.search('^(\d+\.\d+\.\d+\.\d+) ', self.midiOutDevice):
+        if not self.device.isRunning():
+            return
+        if self.device.isIP():
             fileName, _ = QFileDialog.getOpenFileName(self, "Open upgrade file", "",
                                                       "Firmware files (*.bin);;RPi Upgrade files (*.signed)")
             if len(fileName) > 0:
-                self.upgradeFileLock.acquire()
-                self.upgradeFile = fileName
-                self.upgradeFileLock.release()
+                try:
+                    self.device.transport.upgrade(upgradestate.loadImage(fileName))
+                except OSError:
+                    self.device.status.appendLog("Error reading upgrade file\n")
         else:
             fileName, _ = QFileDialog.getOpenFileName(self, "Open upgrade file", "",
                                                       "MIDI Sysex files (*.syx)")
             if len(fileName) > 0:
+                from miditransport import syxMessages
                 try:
-                    self.upgradeMessages = mido.read_syx_file(fileName)
-                    self.upgradeFlag = True
+                    image = upgradestate.loadImage(fileName)
+                    total = len(syxMessages(image))
                 except:
-                    self.upgradeMessages = None
-                    currentStatus.appendLog("Error reading MIDI Sysex file\n")
+                    self.device.status.appendLog("Error reading MIDI Sysex file\n")
+                    return
+
+                # Sysex upgrades are not acknowledged, only the user knows
+                # whether the device is still waiting for the rest.
+                start = upgradestate.resumePosition(self.device.name, image)
+                if start > 0:
+                    answer = QMessageBox.question(
+                        self, "Resume upgrade",
+                        "An upgrade with this file stopped at message {} of {}.\n"
+                        "Resume it? Choose No to start over, e.g. if the device "
+                        "was restarted since.".format(start + 1, total),
+                        QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
+                    if answer == QMessageBox.Cancel:
+                        return
+                    if answer == QMessageBox.No:
+                        start = 0
+                self.device.transport.upgrade(image, start)
+
+    def handleCapture(self, chk):
+        # Records the traffic of the device on screen, whichever it is.
+        if self.capture != None:
+            self.device.setCapture(None)
+            self.capture.close()
+            self.statusbar.showMessage("Capture: {} records, {} bytes".format(
+                self.capture.records, self.capture.bytes))
+            self.capture = None
+        if chk:
+            fileName, _ = QFileDialog.getSaveFileName(self, "Capture to file", "",
+                                                      "Capture files (*.lpcap)")
+            if len(fileName) == 0:
+                self.actionCapture.setChecked(False)
+                return
+            try:
+                self.capture = CaptureWriter(fileName)
+            except OSError as err:
+                self.device.status.appendLog("Capture: {}\n".format(err))
+                self.actionCapture.setChecked(False)
+                return
+            self.device.setCapture(self.capture)
+
+    def handleReplay(self):
+        fileName, _ = QFileDialog.getOpenFileName(self, "Replay capture", "",
+                                                  "Capture files (*.lpcap)")
+        if len(fileName) == 0:
+            return
+        answer = QMessageBox.question(
+            self, "Replay capture",
+            "Replay with the captured timing? Choose No to replay as fast as possible.",
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
+        if answer == QMessageBox.Cancel:
+            return
+        # Not saved as the device in use, the next start polls the real one.
+        name = "replay:" + fileName
+        old = self.devices.get(name)
+        if old != None:
+            old.stop()
+        d = LPDevice(name, name, self.processSysex, self.processMIDI)
+        d.replaySpeed = 1.0 if answer == QMessageBox.Yes else 0
+        self.devices[name] = d
+        self.showDevice(d)
 
     def handleEffectButtons(self):
-        self.requestEffectButtons = True
-        self.requestMIDIButton = 0
+        self.device.queueReadConfig()
+
+    def handleExportHistory(self):
+        minutes, ok = QInputDialog.getInt(self, "Export status history",
+                                          "Minutes to export:", 5, 1, 24 * 60)
+        if not ok:
+            return
+        fileName, _ = QFileDialog.getSaveFileName(self, "Export to file", "",
+                                                  "CSV files (*.csv)")
+        if len(fileName) > 0:
+            if not fileName.endswith(".csv"):
+                fileName = fileName + ".csv"
+            with open(fileName, 'w', newline='') as fp:
+                n = self.device.history.export(fp, minutes * 60.0)
+            self.statusbar.showMessage("{} status samples exported".format(n))
 
     def handleSaveLPConf(self):
         fileName, _ = QFileDialog.getSaveFileName(self, "Save to file", "",
@@ -613,23 +631,67 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
         if len(fileName) > 0:
             self.loadLPConfig(fileName)
 
+    def updateTrackWidgets(self, widgets, new, old, setter):
+        # Returns the number of widgets not repainted, because their value
+        # is already on screen or setter (which returns True if the widget
+        # repaints) found nothing to show.
+        avoided = 0
+        for i, (w, v) in enumerate(zip(widgets, new)):
+            if (i < len(old) and old[i] == v) or not setter(w, v):
+                avoided += 1
+        return avoided
+
+    def setLabelText(self, w, text):
+        # Returns True if the label repaints, QLabel does not for the text
+        # it already shows.
+        if w.text() == text:
+            return False
+        w.setText(text)
+        return True
+
+    def barWithSparkline(self, bar, spark):
+        w = QtWidgets.QWidget(self.gridLayoutWidget)
+        layout = QtWidgets.QHBoxLayout(w)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+        layout.addWidget(bar)
+        layout.addWidget(spark)
+        return w
+
+    def renderSparklines(self, tracks):
+        h = self.device.history
+        for i in range(0, min(tracks, len(self.vsparks))):
+            self.vsparks[i].setValues(h.tail("levels", i, self.vsparks[i].samples()))
+            self.fsparks[i].setValues(h.tail("feedbacks", i, self.fsparks[i].samples()))
+
+    def renderStatus(self, s, old):
+        if s.tracks != old.tracks:
+            for i in range(0,s.tracks):
+                self.tracktitles[i].setHidden(False)
+
+        avoided = 0
+        avoided += self.updateTrackWidgets(self.lengths, s.lengths, old.lengths,
+                                           lambda w, v: self.setLabelText(w, format(v, '.2f')))
+        avoided += self.updateTrackWidgets(self.positions, s.positions, old.positions,
+                                           lambda w, v: self.setLabelText(w, format(v, '.2f')))
+        avoided += self.updateTrackWidgets(self.statuses, s.statuses, old.statuses,
+                                           lambda w, v: self.setLabelText(w, LPStatus.getStatusString(v)))
+        avoided += self.updateTrackWidgets(self.psliders, s.pans, old.pans,
+                                           lambda w, v: w.setPan(v))
+        avoided += self.updateTrackWidgets(self.vsliders, s.levels, old.levels,
+                                           lambda w, v: w.setLevel(100 + v))
+        avoided += self.updateTrackWidgets(self.fsliders, s.feedbacks, old.feedbacks,
+                                           lambda w, v: w.setLevel(v))
+        self.repaintsAvoided += avoided
+        self.renderSparklines(s.tracks)
+
     def handleTimer(self):
-        s = self.currentStatus.getSnapshot()
-
-        for i in range(0,s.tracks):
-            self.tracktitles[i].setHidden(False)
-        for i,j in zip(self.lengths, s.lengths):
-            i.setText(str(format(j, '.2f')))
-        for i,j in zip(self.positions, s.positions):
-            i.setText(str(format(j, '.2f')))
-        for i,j in zip(self.statuses, s.statuses):
-            i.setText(LPStatus.getStatusString(j))
-        for i,j in zip(self.psliders, s.pans):
-            i.setPan(j)
-        for i,j in zip(self.vsliders, s.levels):
-            i.setLevel(100 + j)
-        for i,j in zip(self.fsliders, s.feedbacks):
-            i.setLevel(j)
+        s = self.device.status.getSnapshot()
+        if s.version != self.renderedStatus.version:
+            self.renderStatus(s, self.renderedStatus)
+            self.renderedStatus = s
+            if self.fastRefreshTimer.isActive():
+                self.endFastRefresh()
 
 #        print("Num tracks {}".format(s.tracks))
 #        for i in range(s.tracks,8):
@@ -641,13 +703,27 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
 #            self.vsliders[i].hide()
 #            self.fsliders[i].hide()
 
-        ltext = self.currentStatus.getLog()
+        if self.device.configVersion != self.renderedConfig:
+            self.renderedConfig = self.device.configVersion
+            self.showConfig()
+
+        ltext = self.device.status.getLog()
         if len(ltext) > 0:
             logW = self.plainTextEdit
             logW.moveCursor(QTextCursor.End)
             logW.insertPlainText(ltext)
             logW.moveCursor(QTextCursor.End)
 
+        dropped = self.device.status.getLogDropped()
+        if dropped != self.logDropped:
+            self.logDropped = dropped
+            self.statusbar.showMessage("Log overflow: {} characters dropped".format(dropped))
+
+        self.pollRateLabel.setText("Poll {:.1f}/{:.1f} Hz".format(
+            self.device.pollScheduler.getMeasuredRate(), self.device.pollScheduler.getTargetRate()))
+        self.pollRateLabel.setToolTip("{}\nRepaints avoided: {}".format(
+            self.device.cmdQueue.getStatsString(), self.repaintsAvoided))
+
         if self.midiclockcount >= 0:
             now = time.time()
             diff = now - self.midiclockstarttime
@@ -658,38 +734,44 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
         self.searchReturnLock.acquire()
         searchlist = self.searchReturn.copy()
         self.searchReturn = []
+        searchDone = self.searchDone
+        self.searchDone = None
         self.searchReturnLock.release()
 
         for n in searchlist:
-            self.action_in_devices.append(QtWidgets.QAction(self))
-            d = self.action_in_devices[-1]
-            d.setCheckable(True)
-            d.setChecked(n == self.midiInDevice)
-            d.setText(n)
-            d.setData(n)
-            d.triggered.connect(self.processINDevice)
-            self.menuMIDI_IN_device.addAction(self.action_in_devices[-1])
+            self.addDeviceActions(n)
+
+        if searchDone != None:
+            # Devices that answered are seen now, the others stay listed
+            # until they were not seen for DEVICE_CACHE_TTL, except for the
+            # one in use.
+            for n in searchDone:
+                self.knownDevices[n] = time.time()
+            known = pruneDeviceCache(self.knownDevices)
+            for n, seen in self.knownDevices.items():
+                if n in known:
+                    pass
+                elif n == self.midiOutDevice:
+                    known[n] = seen
+                else:
+                    self.removeDeviceActions(n)
+            self.knownDevices = known
+            self.saveConfig()
 
-            self.action_out_devices.append(QtWidgets.QAction(self))
-            d = self.action_out_devices[-1]
-            d.setCheckable(True)
-            d.setChecked(n == self.midiOutDevice)
-            d.setText(n)
-            d.setData(n)
-            d.triggered.connect(self.processOUTDevice)
-            self.menuMIDI_OUT_device.addAction(self.action_out_devices[-1])
+        if self.fleetView != None and (len(searchlist) > 0 or searchDone != None):
+            self.fleetView.setDevices(list(self.devices.values()))
 
 
     def closeEvent(self, event):
-        self.endStatusTask = True
-        if self.statusTh != None:
-            self.statusTh.join()
+        self.stopAllDevices()
+        if self.fleetView != None:
+            self.fleetView.close()
         event.accept()
 
     def saveLPConfig(self, fileName):
-        config = {'MIDIButtons' : self.midiButtonDict,
-                  'LP2Effects1' : self.effects1,
-                  'LP2Effects2' : self.effects2}
+        config = {'MIDIButtons' : self.device.midiButtonDict,
+                  'LP2Effects1' : self.device.effects1,
+                  'LP2Effects2' : self.device.effects2}
 
         with open(fileName, 'w') as fp:
             json.dump(config, fp)
@@ -698,16 +780,20 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
         try:
             with open(fileName) as fp:
                 config = json.load(fp)
-                if config.get('MIDIButtons'):
-                    self.setDeviceMIDIButtons(config['MIDIButtons'])
-                if config.get('LP2Effects1') and config.get('LP2Effects2'):
-                    self.setEffects(config['LP2Effects1'], config['LP2Effects2'])
         except FileNotFoundError:
-            pass
+            return
+        buttons = {}
+        for k, flist in config.get('MIDIButtons', {}).items():
+            buttons[int(k)] = flist
+        self.device.applyProfile(Path(fileName).name, buttons,
+                                 config.get('LP2Effects1') or [],
+                                 config.get('LP2Effects2') or [])
 
     def saveConfig(self):
         config = {'midiInDevice' : self.midiInDevice,
-                  'midiOutDevice' : self.midiOutDevice}
+                  'midiOutDevice' : self.midiOutDevice,
+                  'fleetMode' : self.fleetMode,
+                  'knownDevices' : self.knownDevices}
 
         cfile_name = str(Path.home()) + '/.lp2ctrl.json'
         with open(cfile_name, 'w') as fp:
@@ -722,162 +808,62 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
                     self.midiInDevice = config['midiInDevice']
                 if config['midiOutDevice']:
                     self.midiOutDevice = config['midiOutDevice']
+                self.fleetMode = config.get('fleetMode', False)
+                self.knownDevices = pruneDeviceCache(config.get('knownDevices', {}))
         except FileNotFoundError:
             pass
 
-    def parseButtonConfig(self, b):
-        self.parsingMIDIButtonConfig += 1
-        bti = self.midibtntype.currentIndex()
-        btn = self.midibtnnum.currentIndex()
-        currentbtn = bti * 128 + btn
+    def showConfig(self):
+        self.showEffects()
+        self.midibtntypeChanged(0)
 
-        btnnum = (b[0] << 7) + b[1]
-        btncnt = b[2]
-
-        bi = 3;
-        if btnnum != 0x3fff and btncnt == 8 and len(b) == 131 :
-            for i in range(0, btncnt):
-                flist = []
-                for fi in range(0, 8):
-                    func = (b[bi] << 7) + b[bi+1]
-                    if func == 0x3fff:
-                        func = -1
-                    flist.append(func)
-                    bi += 2
-                self.midiButtonDict[btnnum] = flist
-                if btnnum == currentbtn:
-                    for si in range(0, 8):
-                        idx = self.lpFunctions.keysLP1().index(flist[si])
-                        self.stepboxes[si].setCurrentIndex(idx)
-                btnnum += 1
-            else:
-                print("btnnum {}, btncnt {}, len(b) {}".format(btnnum, btncnt, len(b)))
-        self.parsingMIDIButtonConfig -= 1
+    def showButton(self, bti, btn):
+        self.midibtntype.setCurrentIndex(bti)
+        self.midibtnnum.setCurrentIndex(btn)
 
-    def parseEffectConfig(self, b):
+    def showEffects(self):
         self.parsingEffectConfig = True
-        neffects = b[0]
-        self.effects1 = []
-        self.effects2 = []
-        for i in range(0, neffects):
-            effectid = b[1+i*2] * 128 + b[2+i*2]
-            self.effects1.append(effectid)
-            effectid = b[neffects*2+1+i*2] * 128 + b[neffects*2+2+i*2]
-            self.effects2.append(effectid)
-
+        effects1 = self.device.effects1
+        effects2 = self.device.effects2
         for i in range(0, 8):
-            self.effect1boxes[i].clear()
-            index = 0
-            for id in self.lpFunctions.keys():
-                v = self.lpFunctions.get(id)
-                self.effect1boxes[i].addItem(v)
-                if id == self.effects1[i]:
-                    self.effect1boxes[i].setCurrentIndex(index)
-                index += 1
-
-            self.effect2boxes[i].clear()
-            index = 0
-            for id in self.lpFunctions.keys():
-                v = self.lpFunctions.get(id)
-                self.effect2boxes[i].addItem(v)
-                if id == self.effects2[i]:
-                    self.effect2boxes[i].setCurrentIndex(index)
-                index += 1
+            if len(effects1) != 8 or len(effects2) != 8:
+                self.effect1boxes[i].setCurrentIndex(-1)
+                self.effect2boxes[i].setCurrentIndex(-1)
+                continue
+            self.effect1boxes[i].setCurrentIndex(self.lpFunctions.indexLP2(effects1[i]))
+            self.effect2boxes[i].setCurrentIndex(self.lpFunctions.indexLP2(effects2[i]))
         self.parsingEffectConfig = False
 
     def effectChanged(self, idx):
-        if not self.parsingEffectConfig:
-            ids = self.lpFunctions.keys()
+        d = self.device
+        if not self.parsingEffectConfig and len(d.effects1) == 8 and len(d.effects2) == 8:
+            # Slots showing an unknown code keep it.
             for i in range(0, 8):
-                self.effects1[i] = ids[self.effect1boxes[i].currentIndex()]
-                self.effects2[i] = ids[self.effect2boxes[i].currentIndex()]
-            self.sendEffectConfig = True
-
-    def setEffects(self, neweffects1, neweffects2):
-        if len(neweffects1) != 8 or len(neweffects2) != 8:
-            return
-
-        self.effects1 = neweffects1
-        self.effects2 = neweffects2
-        self.parsingEffectConfig = True
-        for i in range(0, 8):
-            self.effect1boxes[i].clear()
-            index = 0
-            for id in self.lpFunctions.keys():
-                v = self.lpFunctions.get(id)
-                self.effect1boxes[i].addItem(v)
-                if id == self.effects1[i]:
-                    self.effect1boxes[i].setCurrentIndex(index)
-                index += 1
-
-            self.effect2boxes[i].clear()
-            index = 0
-            for id in self.lpFunctions.keys():
-                v = self.lpFunctions.get(id)
-                self.effect2boxes[i].addItem(v)
-                if id == self.effects2[i]:
-                    self.effect2boxes[i].setCurrentIndex(index)
-                index += 1
-        self.parsingEffectConfig = False
-        self.sendEffectConfig = True
+                v = self.lpFunctions.codeLP2(self.effect1boxes[i].currentIndex())
+                if v != None:
+                    d.effects1[i] = v
+                v = self.lpFunctions.codeLP2(self.effect2boxes[i].currentIndex())
+                if v != None:
+                    d.effects2[i] = v
+            d.queueEffectConfig()
 
     def stepChanged(self, idx):
         if self.parsingMIDIButtonConfig == 0:
             bti = self.midibtntype.currentIndex()
             btn = self.midibtnnum.currentIndex()
             currentbtn = bti * 128 + btn
-            flist = self.midiButtonDict.get(currentbtn, [-1,-1,-1,-1,-1,-1,-1,-1])
+            flist = self.device.midiButtonDict.get(currentbtn, [-1,-1,-1,-1,-1,-1,-1,-1])
 
             altered = False
             for i in range(0, 8):
-                vi = self.stepboxes[i].currentIndex()
-                v = self.lpFunctions.keysLP1()[vi]
-                if v != flist[i]:
+                v = self.lpFunctions.codeLP1(self.stepboxes[i].currentIndex())
+                if v != None and v != flist[i]:
                     altered = True
                     flist[i] = v
 
             if altered:
-                self.midiButtonDict[currentbtn] = flist
-
-                msb = (currentbtn >> 7) & 0x7f
-                lsb = currentbtn & 0x7f
-                msg = [0,2,0x33,16,msb,lsb]
-                for f in flist:
-                    msg.append((f >> 7) & 0x7f)
-                    msg.append(f & 0x7f)
-                self.lp_sysex_q.put(msg)
-
-    def setDeviceMIDIButtons(self, newbtns):
-        for k in newbtns.keys():
-            btn = int(k)
-            flist = self.midiButtonDict.get(btn, [-1,-1,-1,-1,-1,-1,-1,-1])
-
-            listsEqual = True
-            for i in range(0, 8):
-                if newbtns[k][i] != flist[i]:
-                    listsEqual = False
-                    break
-
-            if not listsEqual:
-                flist = newbtns[k]
-                self.midiButtonDict[btn] = flist
-                msb = (btn >> 7) & 0x7f
-                lsb = btn & 0x7f
-                msg = [0,2,0x33,16,msb,lsb]
-                for f in flist:
-                    msg.append((f >> 7) & 0x7f)
-                    msg.append(f & 0x7f)
-                self.lp_sysex_q.put(msg)
-
-                i = self.midibtntype.currentIndex()
-                n = self.midibtnnum.currentIndex()
-                displaybtn = i * 128 + n
-                if displaybtn == btn:
-                    self.parsingMIDIButtonConfig += 1
-                    for si in range(0, 8):
-                        idx = self.lpFunctions.keysLP1().index(flist[si])
-                        self.stepboxes[si].setCurrentIndex(idx)
-                    self.parsingMIDIButtonConfig -= 1
+                self.device.midiButtonDict[currentbtn] = flist
+                self.device.queueButtonConfig(currentbtn, flist)
 
     def midibtntypeChanged(self, idx):
         self.parsingMIDIButtonConfig += 1
@@ -885,10 +871,9 @@ class LP2CtrlApp(QtWidgets.QMainWindow, lp2ctrlui.Ui_MainWindow):
         btn = self.midibtnnum.currentIndex()
         currentbtn = bti * 128 + btn
 
-        flist = self.midiButtonDict.get(currentbtn, [-1,-1,-1,-1,-1,-1,-1,-1])
+        flist = self.device.midiButtonDict.get(currentbtn, [-1,-1,-1,-1,-1,-1,-1,-1])
         for si in range(0, 8):
-            idx = self.lpFunctions.keysLP1().index(flist[si])
-            self.stepboxes[si].setCurrentIndex(idx)
+            self.stepboxes[si].setCurrentIndex(self.lpFunctions.indexLP1(flist[si]))
         self.parsingMIDIButtonConfig -= 1
 
     def midibtnnumChanged(self, idx):
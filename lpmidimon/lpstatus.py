@@ -2,107 +2,193 @@
 # Copyright 2021 - Looperlative Audio Products, LLC
 #
 import threading
-from copy import deepcopy
+import struct
+from logbuffer import LogBuffer
+
+# Compact IP status packet: sample rate and track count followed by seven
+# big endian 32 bit arrays (status, length, position, level, pan, feedback,
+# selected flag), one entry per track.
+IP_STATUS_HEADER = struct.Struct(">II")
+IP_STATUS_FIELDS = 7
+
+_ipStatusStructs = {}
+
+# MIDI status sysex (0x33, 2): f0 00 02 33 02 <tracks> <selected> followed
+# by one 14 byte record per track: status, level (negated), pan, feedback,
+# then length and position in samples, 5 7 bit bytes each, LSB first.
+# Decoding works for any track count the device reports.
+MIDI_SAMPLE_RATE = 48000.0
+MIDI_STATUS_TRACKS = 5
+MIDI_STATUS_SELECTED = 6
+MIDI_STATUS_FIRST_TRACK = 7
+MIDI_STATUS_TRACK_SIZE = 14
+
+def ipStatusStruct(tracks):
+    s = _ipStatusStructs.get(tracks)
+    if s is None:
+        s = struct.Struct(">II" + "I" * (IP_STATUS_FIELDS * tracks))
+        _ipStatusStructs[tracks] = s
+    return s
+
+class LPStatusRecord:
+    # What a parser decodes from one status packet, handed to
+    # LPStatus.setStatus.  One is allocated per packet, so it carries the
+    # fields and nothing else.
+    __slots__ = ("tracks", "selected_track", "levels", "pans",
+                 "feedbacks", "lengths", "positions", "statuses")
 
-class LPStatus:
     def __init__(self):
-        self.tracks = 0;
-        self.selected_track = 0;
+        self.tracks = 0
+        self.selected_track = 0
         self.levels = []
         self.pans = []
         self.feedbacks = []
         self.lengths = []
         self.positions = []
         self.statuses = []
-        self.log = ""
-        self.lock = threading.Lock()
-
-    def __deepcopy__(self, memo):
-        newone = type(self)()
-
-        self.lock.acquire()
-        newone.__dict__.update(self.__dict__)
-        newone.levels = deepcopy(self.levels, memo)
-        newone.pans = deepcopy(self.pans, memo)
-        newone.feedbacks = deepcopy(self.feedbacks, memo)
-        newone.lengths = deepcopy(self.lengths, memo)
-        newone.positions = deepcopy(self.positions, memo)
-        newone.statuses = deepcopy(self.statuses, memo)
-        self.lock.release()
 
-        newone.lock = threading.Lock()
-        return newone
+    def parseMIDIStatus(self, b):
+        # Returns False if the sysex is too short for the reported track count.
+        if len(b) <= MIDI_STATUS_SELECTED:
+            return False
+        tracks = b[MIDI_STATUS_TRACKS]
+        end = MIDI_STATUS_FIRST_TRACK + tracks * MIDI_STATUS_TRACK_SIZE
+        if len(b) < end:
+            return False
+
+        self.tracks = tracks
+        self.selected_track = b[MIDI_STATUS_SELECTED]
+        # One pass over the track records, the single byte fields that are
+        # taken as is come out of slices.
+        first = MIDI_STATUS_FIRST_TRACK
+        size = MIDI_STATUS_TRACK_SIZE
+        self.statuses = b[first:end:size]
+        self.pans = b[first+2:end:size]
+        self.feedbacks = b[first+3:end:size]
+        scale = 1.0 / MIDI_SAMPLE_RATE
+        levels = []
+        lengths = []
+        positions = []
+        for i in range(first, end, size):
+            levels.append(-b[i+1])
+            lengths.append((b[i+4] | b[i+5] << 7 | b[i+6] << 14 | b[i+7] << 21 | b[i+8] << 28) * scale)
+            positions.append((b[i+9] | b[i+10] << 7 | b[i+11] << 14 | b[i+12] << 21 | b[i+13] << 28) * scale)
+        self.levels = levels
+        self.lengths = lengths
+        self.positions = positions
+        return True
 
-    def setStatus(self, nv):
-        self.lock.acquire()
-        self.tracks = nv.tracks
-        self.selected_track = nv.selected_track
-        self.levels = nv.levels
-        self.pans = nv.pans
-        self.feedbacks = nv.feedbacks
-        self.lengths = nv.lengths
-        self.positions = nv.positions
-        self.statuses = nv.statuses
-        self.lock.release()
-
-    def __convert_7bit_packed_to_int(b):
-        v = 0
-        shift = 0
-        for i in b:
-            v += (i << shift)
-            shift += 7
-        return v
-
-    def __parseMIDIStatusTrack(self, b):
-        self.statuses.append(b[0])
-        self.levels.append(-b[1])
-        self.pans.append(b[2])
-        self.feedbacks.append(b[3])
-        self.lengths.append(float(LPStatus.__convert_7bit_packed_to_int(b[4:9])) / 48000.0)
-        self.positions.append(float(LPStatus.__convert_7bit_packed_to_int(b[9:])) / 48000.0)
+    def parseIPStatus(self, b):
+        # Returns False for truncated or malformed packets.
+        mv = memoryview(b)
+        if len(mv) < IP_STATUS_HEADER.size:
+            return False
+        srate, tracks = IP_STATUS_HEADER.unpack_from(mv)
+        if srate == 0 or len(mv) < IP_STATUS_HEADER.size + IP_STATUS_FIELDS * 4 * tracks:
+            return False
+
+        v = ipStatusStruct(tracks).unpack_from(mv)
+        fsrate = float(srate)
+        t = tracks
+        self.tracks = t
+        # Tuples, so that the snapshot takes them over without a copy.
+        self.statuses = v[2:2+t]
+        self.lengths = tuple([x / fsrate for x in v[2+t:2+2*t]])
+        self.positions = tuple([x / fsrate for x in v[2+2*t:2+3*t]])
+        self.levels = v[2+3*t:2+4*t]
+        self.pans = v[2+4*t:2+5*t]
+        self.feedbacks = v[2+5*t:2+6*t]
+        for i, selected in enumerate(v[2+6*t:2+7*t]):
+            if selected == 1:
+                self.selected_track = i + 1
+        return True
+
+class LPStatusSnapshot:
+    # Read only status published by LPStatus.setStatus.  Snapshots are shared
+    # between threads as is, so they are never modified after creation.
+    __slots__ = ("version", "tracks", "selected_track", "levels", "pans",
+                 "feedbacks", "lengths", "positions", "statuses")
+
+    def __init__(self, version=0, nv=None):
+        setf = object.__setattr__
+        setf(self, "version", version)
+        if nv is None:
+            setf(self, "tracks", 0)
+            setf(self, "selected_track", 0)
+            for f in ("levels", "pans", "feedbacks", "lengths", "positions", "statuses"):
+                setf(self, f, ())
+        else:
+            setf(self, "tracks", nv.tracks)
+            setf(self, "selected_track", nv.selected_track)
+            setf(self, "levels", tuple(nv.levels))
+            setf(self, "pans", tuple(nv.pans))
+            setf(self, "feedbacks", tuple(nv.feedbacks))
+            setf(self, "lengths", tuple(nv.lengths))
+            setf(self, "positions", tuple(nv.positions))
+            setf(self, "statuses", tuple(nv.statuses))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("LPStatusSnapshot is read only")
+
+    def sameAs(self, other):
+        # True if the status is the same, whatever the versions.
+        return (self.positions == other.positions and self.levels == other.levels
+                and self.feedbacks == other.feedbacks and self.statuses == other.statuses
+                and self.lengths == other.lengths and self.pans == other.pans
+                and self.selected_track == other.selected_track and self.tracks == other.tracks)
 
+    def printStatusTrack(self, t):
+        ts = "Track " + str(t) + " "
+        ti = t - 1
+        print(ts + "Status: " + LPStatus.getStatusString(self.statuses[ti])
+              + ", Level: " + str(self.levels[ti])
+              + ", Pan: " + str(self.pans[ti])
+              + ", Feedback: " + str(self.feedbacks[ti])
+              + ", Length: " + format(self.lengths[ti], '.2f')
+              + ", Position: " + format(self.positions[ti], '.2f') )
 
-    def parseMIDIStatus(self, b):
-        self.tracks = b[5]
-        self.selected_track = b[6]
+    def printStatus(self):
+        print("Selected Track: " + str(self.selected_track))
+        for t in range(1, self.tracks + 1):
+            self.printStatusTrack(t)
 
-        self.__parseMIDIStatusTrack(b[7:21])
-        self.__parseMIDIStatusTrack(b[21:35])
-        self.__parseMIDIStatusTrack(b[35:49])
-        self.__parseMIDIStatusTrack(b[49:63])
+    def asDict(self):
+        # Plain types only, e.g. for json.dumps.
+        tracks = []
+        for ti in range(0, self.tracks):
+            tracks.append({'status': LPStatus.getStatusString(self.statuses[ti]),
+                           'level': self.levels[ti],
+                           'pan': self.pans[ti],
+                           'feedback': self.feedbacks[ti],
+                           'length': round(self.lengths[ti], 3),
+                           'position': round(self.positions[ti], 3)})
+        return {'version': self.version,
+                'selected_track': self.selected_track,
+                'tracks': tracks}
 
-        if (self.tracks == 8):
-            self.__parseMIDIStatusTrack(b[63:77])
-            self.__parseMIDIStatusTrack(b[77:91])
-            self.__parseMIDIStatusTrack(b[91:105])
-            self.__parseMIDIStatusTrack(b[105:119])
+class LPStatus:
+    # Parsers fill in a scratch LPStatusRecord, which is then published to
+    # the shared LPStatus with setStatus.  Readers use getSnapshot and never
+    # take a lock.
+    def __init__(self):
+        self.log = LogBuffer()
+        self.publishLock = threading.Lock()
+        self.snapshot = LPStatusSnapshot()
 
-    def parseIPStatus(self, b):
-        srate = int.from_bytes(b[0:4], "big")
-        self.tracks = int.from_bytes(b[4:8], "big")
-
-        bi = 8
-        for i in range(self.tracks):
-            self.statuses.append(int.from_bytes(b[bi:bi+4], "big"))
-            bi += 4
-        for i in range(self.tracks):
-            self.lengths.append(float(int.from_bytes(b[bi:bi+4], "big")) / float(srate))
-            bi += 4
-        for i in range(self.tracks):
-            self.positions.append(float(int.from_bytes(b[bi:bi+4], "big")) / float(srate))
-            bi += 4
-        for i in range(self.tracks):
-            self.levels.append(int.from_bytes(b[bi:bi+4], "big"))
-            bi += 4
-        for i in range(self.tracks):
-            self.pans.append(int.from_bytes(b[bi:bi+4], "big"))
-            bi += 4
-        for i in range(self.tracks):
-            self.feedbacks.append(int.from_bytes(b[bi:bi+4], "big"))
-            bi += 4
-        for i in range(self.tracks):
-            if (int.from_bytes(b[bi:bi+4], "big") == 1):
-                self.selected_track = i + 1
+    def setStatus(self, nv):
+        # Publishes nv as a new version if it differs from the current
+        # snapshot, returns False if it did not.  Writers are serialized so
+        # that versions are published in order.
+        self.publishLock.acquire()
+        try:
+            old = self.snapshot
+            snapshot = LPStatusSnapshot(old.version + 1, nv)
+            if snapshot.sameAs(old):
+                return False
+            self.snapshot = snapshot
+            return True
+        finally:
+            self.publishLock.release()
 
     def getStatusString(status):
         if status == 0:
@@ -120,38 +206,23 @@ class LPStatus:
         else:
             return 'unknown'
 
-    def printStatusTrack(self, t):
-        ts = "Track " + str(t) + " "
-        ti = t - 1
-        print(ts + "Status: " + LPStatus.getStatusString(self.statuses[ti])
-              + ", Level: " + str(self.levels[ti])
-              + ", Pan: " + str(self.pans[ti])
-              + ", Feedback: " + str(self.feedbacks[ti])
-              + ", Length: " + format(self.lengths[ti], '.2f')
-              + ", Position: " + format(self.positions[ti], '.2f') )
-
-    def printStatusLocked(self):
-        self.lock.acquire()
-        print("Selected Track: " + str(self.selected_track))
-        for t in range(1, self.tracks + 1):
-            self.printStatusTrack(t)
-        self.lock.release()
-
     def printStatus(self):
-        s = deepcopy(self)
-        s.printStatusLocked()
+        self.snapshot.printStatus()
 
     def getSnapshot(self):
-        return deepcopy(self)
+        return self.snapshot
+
+    def getVersion(self):
+        return self.snapshot.version
+
+    def changedSince(self, version):
+        return self.snapshot.version != version
 
     def appendLog(self, text):
-        self.lock.acquire()
-        self.log += text
-        self.lock.release()
+        self.log.append(text)
 
     def getLog(self):
-        self.lock.acquire()
-        ltext = self.log
-        self.log = ""
-        self.lock.release()
-        return ltext
+        return self.log.drain()
+
+    def getLogDropped(self):
+        return self.log.getDropped()
@@ -0,0 +1,270 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import re
+import threading
+import time
+
+import mido
+import capture
+import cmdqueue
+import upgradestate
+from lpstatus import LPStatusRecord
+from sysexpacer import SysexPacer
+
+# Saved resume position of a .syx upgrade is updated at most this often
+# while sending, and always when the upgrade stops.
+UPGRADE_SAVE_INTERVAL = 0.5
+
+def parseSyx(data):
+    # Sysex messages in the contents of a .syx file, binary or hex text, as
+    # mido.read_syx_file reads them.
+    if len(data) > 0 and data[0] != 0xf0:
+        data = bytearray.fromhex(re.sub(r'\s', ' ', data.decode('latin1')))
+    return [msg for msg in mido.parse_all(data) if msg.type == 'sysex']
+
+def syxMessages(image):
+    # Sysex messages of an UpgradeImage, parsed once from the bytes it
+    # holds, so the file is not read again.
+    return image.encoded('syx', lambda: parseSyx(image.data))
+
+def syxEncoded(image):
+    # (message, size on the wire) of every upgrade message, computed once.
+    return image.encoded('syx-sized',
+                         lambda: [(m, len(m.bin())) for m in syxMessages(image)])
+
+class LPMIDITransport:
+    # Talks to one Looperlative device over a pair of MIDI ports: sends
+    # queued messages, polls status and log and streams .syx upgrades.
+    # Same callbacks as LPIPTransport, called on the MIDI input thread,
+    # plus onMIDI(msg) for all non sysex messages (e.g. clock).  If the
+    # transport ends on an error, 'error' says why.  If 'capture'
+    # is set to a capture.CaptureWriter, all MIDI messages sent and received
+    # are recorded to it.
+    #
+    # The ports are opened with ports.open_output(outName) and
+    # ports.open_input(inName, callback=...), mido itself unless another
+    # port factory is passed, e.g. a simulated device.
+    def __init__(self, inName, outName, cmdQueue, pollScheduler,
+                 onStatus, onLog, onSysex, onMIDI=None, ports=None):
+        self.inName = inName
+        self.outName = outName
+        self.cmdQueue = cmdQueue
+        self.pollScheduler = pollScheduler
+        self.onStatus = onStatus
+        self.onLog = onLog
+        self.onSysex = onSysex
+        self.onMIDI = onMIDI
+        self.ports = ports if ports != None else mido
+
+        self.endStatusTask = False
+        self.statusTh = None
+        self.upgradeImage = None
+        self.upgradeStart = 0
+        self.upgradeFlag = False
+        self.upgradeAck = threading.Event()
+        self.upgradeAckTime = 0.0
+        self.upgradeError = False
+        self.capture = None
+        self.error = None
+        # Bytes per second the link carries when known, e.g.
+        # sysexpacer.MIDI_WIRE_RATE for a 5 pin DIN interface.  None for USB
+        # MIDI or unknown, upgrade pacing then finds the rate on its own.
+        self.wireRate = None
+
+    def start(self):
+        self.endStatusTask = False
+        self.error = None
+        self.statusTh = threading.Thread(target=self.statusThread)
+        self.statusTh.start()
+
+    def stop(self):
+        if self.statusTh != None:
+            self.endStatusTask = True
+            self.pollScheduler.wake()
+            self.statusTh.join()
+            self.endStatusTask = False
+            self.statusTh = None
+
+    def upgrade(self, image, start=0):
+        # Sends the messages of image, starting at index 'start' to resume
+        # an interrupted upgrade (see upgradestate.resumePosition).
+        self.upgradeImage = image
+        self.upgradeStart = start
+        self.upgradeFlag = True
+        self.pollScheduler.wake()
+
+    def send(self, outport, msg):
+        if self.capture != None:
+            self.capture.record(capture.OUT, capture.KIND_MIDI, msg.bin())
+        outport.send(msg)
+
+    def processMIDI(self, msg):
+        if self.capture != None:
+            self.capture.record(capture.IN, capture.KIND_MIDI, msg.bin())
+        if msg.type == 'sysex':
+            b = msg.bytes()
+            if b[1:5] == [0, 2, 0x33, 2]:
+                s = LPStatusRecord()
+                if s.parseMIDIStatus(b):
+                    self.onStatus(s)
+            elif b[1:5] == [0, 2, 0x33, 3]:
+                text = ''.join(map(chr, b[5:-1]))
+                if len(text) > 0:
+                    self.onLog(text)
+                if self.upgradeFlag:
+                    self.upgradeAckTime = time.monotonic()
+                    if 'error' in text.lower():
+                        self.upgradeError = True
+                    self.upgradeAck.set()
+                self.pollScheduler.replyReceived()
+            else:
+                self.onSysex(b)
+        elif self.onMIDI != None:
+            self.onMIDI(msg)
+
+    def sendQueued(self, outport, started):
+        # Sends queued messages, most urgent first, until the queue is empty
+        # or bulk traffic has to make room for the status poll of the cycle
+        # that began at 'started'.
+        while not self.endStatusTask:
+            item = self.cmdQueue.get()
+            if item is None:
+                return
+            cls, msg = item
+            self.send(outport, mido.Message('sysex', data=msg))
+            pace = cmdqueue.SEND_PACING.get(msg[3])
+            if pace:
+                time.sleep(pace)
+            if cls == cmdqueue.BULK and self.pollScheduler.pollDue(started):
+                return
+
+    def probeUpgrade(self, outport, pacer, now):
+        # During an upgrade a log request now and then serves as the
+        # acknowledgement the upgrade messages lack, see SysexPacer.
+        if pacer.probeSent != None:
+            if self.upgradeAck.is_set():
+                pacer.probeAnswered(self.upgradeAckTime)
+            elif pacer.probeExpired(now):
+                if pacer.probeLost():
+                    # The device fell behind, let it catch up.
+                    self.upgradeAck.wait(pacer.probeTimeout)
+                elif not pacer.probing:
+                    self.onLog("No replies during the upgrade, pacing stays at {:.0f} bytes/s\n".format(
+                        pacer.rate))
+        if self.upgradeError:
+            self.upgradeError = False
+            pacer.errorSeen()
+
+        if pacer.probeDue(now):
+            self.upgradeAck.clear()
+            self.send(outport, self.logRequest)
+            pacer.sent(len(self.logRequest.bin()), now)
+            pacer.probeSentAt(now)
+
+    def sendUpgrade(self, outport):
+        # The device does not acknowledge upgrade messages, so the resume
+        # position saved here is the number of messages handed to the port,
+        # and a message it dropped cannot be resent.  The pacing keeps the
+        # device from falling behind instead, see SysexPacer.
+        image = self.upgradeImage
+        entries = syxEncoded(image)
+        total = len(entries)
+        count = self.upgradeStart
+        if count > 0:
+            self.onLog("Resuming upgrade at message {} of {}\n".format(count + 1, total))
+        target_percent = (count * 100 // max(total, 1)) // 5 * 5 + 5.0
+
+        pacer = SysexPacer(SysexPacer.legacyRate([n for m, n in entries]), self.wireRate)
+        self.upgradeError = False
+        started = time.monotonic()
+        saved = started
+        nbytes = 0
+        try:
+            while count < total and not self.endStatusTask:
+                self.probeUpgrade(outport, pacer, time.monotonic())
+                delay = pacer.wait()
+                if delay > 0:
+                    time.sleep(delay)
+
+                msg, size = entries[count]
+                self.send(outport, msg)
+                pacer.sent(size)
+                nbytes += size
+                count += 1
+                percent = (count / total) * 100.0
+                if percent >= target_percent:
+                    elapsed = time.monotonic() - started
+                    self.onLog("{}% complete, {:.0f} bytes/s, pacing {:.0f} bytes/s\n".format(
+                        int(percent), nbytes / elapsed if elapsed > 0 else 0.0, pacer.rate))
+                    target_percent += 5.0
+                if time.monotonic() - saved > UPGRADE_SAVE_INTERVAL:
+                    upgradestate.saveState(self.outName, image, count, total)
+                    saved = time.monotonic()
+        finally:
+            self.upgradeImage = None
+            self.upgradeFlag = False
+            elapsed = time.monotonic() - started
+            if count >= total:
+                upgradestate.clearState(self.outName)
+                self.onLog("Completed, {} bytes in {:.1f} s ({:.0f} bytes/s, {} back offs)\n".format(
+                    nbytes, elapsed, nbytes / elapsed if elapsed > 0 else 0.0, pacer.backoffs))
+            else:
+                upgradestate.saveState(self.outName, image, count, total)
+                self.onLog("Upgrade stopped at message {} of {}, it can be resumed\n".format(
+                    count + 1, total))
+
+    def fail(self, text):
+        self.error = text
+        self.onLog(text + "\n")
+
+    def statusThread(self):
+        try:
+            outport = self.ports.open_output(self.outName)
+        except Exception as err:
+            self.fail("Couldn't open {}: {}".format(self.outName, err))
+            return
+
+        try:
+            inport = self.ports.open_input(self.inName, callback=self.processMIDI)
+        except Exception as err:
+            self.fail("Couldn't open {}: {}".format(self.inName, err))
+            outport.close()
+            return
+
+        try:
+            statusRequest = mido.Message('sysex', data=[0,2,0x33,2])
+            logRequest = mido.Message('sysex', data=[0,2,0x33,3])
+            self.logRequest = logRequest
+
+            # Status first, before any queued bulk traffic.  The first cycle
+            # does not ask again unless a poll period went by meanwhile.
+            self.pollScheduler.requestSent()
+            self.send(outport, statusRequest)
+            answered = None
+            if self.pollScheduler.waitReply():
+                answered = time.monotonic()
+
+            while not self.endStatusTask:
+                if self.upgradeFlag:
+                    self.sendUpgrade(outport)
+                else:
+                    started = time.monotonic()
+                    self.sendQueued(outport, started)
+
+                    self.pollScheduler.requestSent()
+                    self.send(outport, logRequest)
+                    self.pollScheduler.waitReply()
+                    if answered == None or self.pollScheduler.pollDue(answered):
+                        self.pollScheduler.requestSent()
+                        self.send(outport, statusRequest)
+                        self.pollScheduler.waitReply()
+                    answered = None
+
+                    if self.cmdQueue.empty():
+                        self.pollScheduler.waitNextCycle(started)
+        except Exception as err:
+            self.fail("MIDI transport stopped, {}: {}".format(type(err).__name__, err))
+        finally:
+            outport.close()
+            inport.close()
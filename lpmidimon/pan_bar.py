@@ -4,6 +4,46 @@
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import Qt
 
+# Pre-rendered markers keyed on (width, height, steps), shared by all
+# PanBars of the same size.  Entry i is the marker for pan step i - steps/2.
+_pixmapCache = {}
+
+def renderPanPixmaps(w, h, steps):
+    key = (w, h, steps)
+    pixmaps = _pixmapCache.get(key)
+    if pixmaps is not None:
+        return pixmaps
+
+    if len(_pixmapCache) > 16:
+        _pixmapCache.clear()
+
+    black = QtGui.QBrush(QtGui.QColor('black'), Qt.SolidPattern)
+    red = QtGui.QBrush(QtGui.QColor('red'), Qt.SolidPattern)
+
+    # x and y with origin at upper left.
+    y = 5
+    hh = h - 2 * y
+    ww = w - 2 * 5
+
+    pixmaps = []
+    half = steps // 2
+    for steppan in range(-half, half + 1):
+        pm = QtGui.QPixmap(max(w, 1), max(h, 1))
+        painter = QtGui.QPainter(pm)
+        painter.fillRect(QtCore.QRect(0, 0, int(w), int(h)), black)
+
+        x = 5 + ww / 2
+        x += steppan * (hh / 20.0)
+
+        r = QtCore.QRect(int(x - 2), int(y), 4, int(hh))
+        painter.fillRect(r, red)
+
+        painter.end()
+        pixmaps.append(pm)
+
+    _pixmapCache[key] = pixmaps
+    return pixmaps
+
 class PanBar(QtWidgets.QWidget):
 
     def __init__(self, *args, **kwargs):
@@ -15,45 +55,40 @@ class PanBar(QtWidgets.QWidget):
         )
         self.steps = 20
         self.pan = 0
+        self.steppan = 0
         self.pan_valid = False
+        self.pixmaps = None
 
     def setPan(self, new_pan):
+        # Returns True if the widget repaints.
         self.pan = new_pan
+
+        stepsize = 100.0 / self.steps
+        steppan = int((new_pan + (stepsize / 2.0)) / stepsize)
+        half = self.steps // 2
+        if steppan < -half:
+            steppan = -half
+        elif steppan > half:
+            steppan = half
+
+        # Nothing to repaint unless the marker actually moves a step.
+        if self.pan_valid and steppan == self.steppan:
+            return False
+
+        self.steppan = steppan
         self.pan_valid = True
         self.update()
+        return True
+
+    def resizeEvent(self, e):
+        self.pixmaps = renderPanPixmaps(self.width(), self.height(), self.steps)
 
     def paintEvent(self, e):
         if self.pan_valid:
+            if self.pixmaps is None:
+                self.pixmaps = renderPanPixmaps(self.width(), self.height(), self.steps)
             painter = QtGui.QPainter(self)
-            h = painter.device().height()
-            w = painter.device().width()
-
-            brush = QtGui.QBrush()
-            brush.setColor(QtGui.QColor('black'))
-            brush.setStyle(Qt.SolidPattern)
-            rect = QtCore.QRect(0, 0, int(w), int(h))
-            painter.fillRect(rect, brush)
-
-            stepsize = 100.0 / self.steps
-            steppan = int((self.pan + (stepsize / 2.0)) / stepsize)
-            if steppan < -10:
-                steppan = -10
-            elif steppan > 10:
-                steppan = 10
-
-            # x and y with origin at upper left.
-            x = 5
-            y = 5
-            hh = h - 2 * y
-            ww = w - 2 * x
-
-            x += ww / 2
-            x += steppan * (hh / 20.0)
-
-            brush.setColor(QtGui.QColor('red'))
-            r = QtCore.QRect(int(x - 2), int(y), 4, int(hh))
-            painter.fillRect(r, brush)
-
+            painter.drawPixmap(0, 0, self.pixmaps[self.steppan + self.steps // 2])
             painter.end()
 
     def sizeHint(self):
@@ -0,0 +1,83 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import threading
+import time
+
+# Track statuses as reported by the device (see LPStatus.getStatusString).
+ACTIVE_STATUSES = (1, 2, 5)     # recording, overdubbing, replacing
+IDLE_STATUSES = (0, 3)          # empty, stopped
+
+class PollScheduler:
+    # Paces status and log polling.  Within a poll cycle the next request is
+    # sent as soon as the reply to the previous one arrives, or after
+    # replyTimeout.  The period between cycles follows track activity: fast
+    # while any track is recording, overdubbing or replacing, slow while all
+    # tracks are stopped or empty.
+    def __init__(self, fastInterval=0.1, normalInterval=0.25, slowInterval=1.0,
+                 replyTimeout=0.25):
+        self.fastInterval = fastInterval
+        self.normalInterval = normalInterval
+        self.slowInterval = slowInterval
+        self.replyTimeout = replyTimeout
+        self.interval = normalInterval
+
+        self.replyEvent = threading.Event()
+        self.wakeEvent = threading.Event()
+
+        self.lastStatusTime = 0.0
+        # Average of the intervals between statuses, 0 before the second.
+        # Averaging the rates instead would let one short interval dominate.
+        self.averageInterval = 0.0
+
+    def getTargetRate(self):
+        return 1.0 / self.interval
+
+    def getMeasuredRate(self):
+        if self.lastStatusTime and time.monotonic() - self.lastStatusTime > 2.0 * self.slowInterval:
+            return 0.0
+        if self.averageInterval <= 0:
+            return 0.0
+        return 1.0 / self.averageInterval
+
+    def requestSent(self):
+        self.replyEvent.clear()
+
+    def waitReply(self):
+        return self.replyEvent.wait(self.replyTimeout)
+
+    def replyReceived(self):
+        self.replyEvent.set()
+
+    def statusReceived(self, statuses):
+        now = time.monotonic()
+        if self.lastStatusTime:
+            dt = now - self.lastStatusTime
+            if self.averageInterval == 0:
+                self.averageInterval = dt
+            else:
+                self.averageInterval += 0.2 * (dt - self.averageInterval)
+        self.lastStatusTime = now
+
+        if any(s in ACTIVE_STATUSES for s in statuses):
+            self.interval = self.fastInterval
+        elif all(s in IDLE_STATUSES for s in statuses):
+            self.interval = self.slowInterval
+        else:
+            self.interval = self.normalInterval
+
+        self.replyEvent.set()
+
+    def pollDue(self, started):
+        return time.monotonic() - started >= self.interval
+
+    def waitNextCycle(self, started):
+        # Sleeps out the rest of the poll period that began at 'started'
+        # unless woken early, e.g. by a user command.
+        remaining = self.interval - (time.monotonic() - started)
+        if remaining > 0:
+            self.wakeEvent.wait(remaining)
+        self.wakeEvent.clear()
+
+    def wake(self):
+        self.wakeEvent.set()
@@ -0,0 +1,107 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import threading
+import time
+
+import capture
+from iptransport import LPIPTransport
+
+class LPReplayTransport:
+    # Plays back what a device sent in a capture file (see capture.py), so
+    # parsers and UI can be exercised without hardware.  Inbound MIDI and
+    # status socket datagrams are handed to an LPMIDITransport or
+    # LPIPTransport that is never started, through the same methods the
+    # ports and sockets call.  Outbound records and upgrade traffic are
+    # skipped, and queued messages are dropped.
+    #
+    # speed 1.0 keeps the captured timing, 2.0 is twice as fast and so on,
+    # 0 replays as fast as possible.  Same callbacks and 'error' as
+    # LPMIDITransport, called on the replay thread.
+    def __init__(self, fileName, cmdQueue, pollScheduler, onStatus, onLog, onSysex,
+                 onMIDI=None, speed=1.0):
+        self.fileName = fileName
+        self.cmdQueue = cmdQueue
+        self.pollScheduler = pollScheduler
+        self.onStatus = onStatus
+        self.onLog = onLog
+        self.onSysex = onSysex
+        self.onMIDI = onMIDI
+        self.speed = speed
+        self.capture = None
+        self.error = None
+
+        self.ip = LPIPTransport("0.0.0.0", cmdQueue, pollScheduler, onStatus, onLog, onSysex)
+        self.ip.replyEvent = threading.Event()
+        self.midi = None
+        self.stopEvent = threading.Event()
+        self.finished = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopEvent.clear()
+        self.finished.clear()
+        self.thread = threading.Thread(target=self.run, name="lp-replay")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread != None:
+            self.stopEvent.set()
+            self.thread.join()
+            self.thread = None
+
+    def upgrade(self, image, start=0):
+        self.onLog("No upgrades during a replay\n")
+
+    def feed(self, kind, data):
+        if kind == capture.KIND_UDP:
+            self.ip.datagramReceived(data, self.ip.lpip)
+        elif kind == capture.KIND_MIDI:
+            if self.midi == None:
+                import mido
+                from miditransport import LPMIDITransport
+                self.mido = mido
+                self.midi = LPMIDITransport("", "", self.cmdQueue, self.pollScheduler,
+                                            self.onStatus, self.onLog, self.onSysex, self.onMIDI)
+            self.midi.processMIDI(self.mido.Message.from_bytes(data))
+
+    def isFinished(self):
+        return self.finished.is_set()
+
+    def run(self):
+        try:
+            self.replay()
+        finally:
+            self.finished.set()
+
+    def replay(self):
+        started = time.monotonic()
+        count = 0
+        base = None
+        try:
+            for t, direction, kind, data in capture.readCapture(self.fileName):
+                while self.cmdQueue.get() != None:
+                    pass
+                if direction == capture.SESSION:
+                    base = None
+                    continue
+                if direction != capture.IN:
+                    continue
+                if self.speed > 0:
+                    # Captured time t is due at replay time 'base' + t / speed.
+                    if base == None:
+                        base = time.monotonic() - t / self.speed
+                    delay = base + t / self.speed - time.monotonic()
+                    if delay > 0 and self.stopEvent.wait(delay):
+                        return
+                elif self.stopEvent.is_set():
+                    return
+                self.feed(kind, data)
+                count += 1
+        except (OSError, ValueError) as err:
+            self.error = "Replay of {} failed: {}".format(self.fileName, err)
+            self.onLog(self.error + "\n")
+            return
+        self.onLog("Replay of {} done: {} records in {:.2f} s\n".format(
+            self.fileName, count, time.monotonic() - started))
@@ -0,0 +1,51 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5.QtCore import Qt
+
+class Sparkline(QtWidgets.QWidget):
+    # Line of the recent values of one status field, newest at the right,
+    # one pixel per sample.  Values are clamped to minimum..maximum.
+    def __init__(self, *args, minimum=0.0, maximum=100.0, **kwargs):
+        super(Sparkline, self).__init__(*args, **kwargs)
+
+        self.setSizePolicy(
+            QtWidgets.QSizePolicy.Fixed,
+            QtWidgets.QSizePolicy.MinimumExpanding
+        )
+        self.minimum = minimum
+        self.maximum = maximum
+        self.values = ()
+        self.pen = QtGui.QPen(QtGui.QColor('red'))
+
+    def samples(self):
+        # How many values the widget can show.
+        return max(self.width() - 2, 1)
+
+    def setValues(self, values):
+        if len(values) == 0 and len(self.values) == 0:
+            return
+        self.values = values
+        self.update()
+
+    def paintEvent(self, e):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtGui.QBrush(QtGui.QColor('black'), Qt.SolidPattern))
+        n = len(self.values)
+        if n > 1:
+            h = self.height() - 4
+            span = float(self.maximum - self.minimum)
+            x = self.width() - 1 - n
+            points = []
+            for v in self.values:
+                v = max(self.minimum, min(self.maximum, v))
+                y = 2 + h - (v - self.minimum) / span * h
+                points.append(QtCore.QPointF(x, y))
+                x += 1
+            painter.setPen(self.pen)
+            painter.drawPolyline(QtGui.QPolygonF(points))
+        painter.end()
+
+    def sizeHint(self):
+        return QtCore.QSize(40,100)
@@ -0,0 +1,108 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import csv
+import threading
+import time
+from array import array
+
+# Per track status fields kept in the history.
+HISTORY_FIELDS = ("levels", "feedbacks", "positions")
+
+# 27 minutes at the fastest poll rate (10 Hz), over an hour at the normal one.
+HISTORY_SAMPLES = 16384
+
+class StatusHistory:
+    # Fixed size ring of the last 'capacity' status updates: one time stamp
+    # array and, per track and field, one float array, all written at the
+    # same index.  Appending costs the same however long the session ran,
+    # and readers only copy the samples they ask for.
+    def __init__(self, capacity=HISTORY_SAMPLES, fields=HISTORY_FIELDS):
+        self.capacity = capacity
+        self.fields = fields
+        self.times = array('d', bytes(8 * capacity))
+        self.tracks = []
+        self.next = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, s, t=None):
+        # s is an LPStatus or LPStatusSnapshot, t a time.monotonic() time.
+        if t == None:
+            t = time.monotonic()
+        self.lock.acquire()
+        i = self.next
+        self.times[i] = t
+        while len(self.tracks) < s.tracks:
+            self.tracks.append({f: array('f', bytes(4 * self.capacity)) for f in self.fields})
+        for f in self.fields:
+            values = getattr(s, f)
+            for ti, track in enumerate(self.tracks):
+                if ti < len(values):
+                    track[f][i] = values[ti]
+                else:
+                    track[f][i] = 0.0
+        self.next = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.lock.release()
+
+    def ordered(self, a, n):
+        # The last n entries of ring array a, oldest first.  Called with
+        # the lock held.
+        start = (self.next - n) % self.capacity
+        if n == 0:
+            return a[0:0]
+        if start + n <= self.capacity:
+            return a[start:start + n]
+        return a[start:] + a[:self.next]
+
+    def countSince(self, t):
+        # Number of samples taken at or after t, by bisection over the time
+        # stamps (they only go up).  Called with the lock held.
+        lo = 0
+        hi = self.count
+        first = self.next - self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[(first + mid) % self.capacity] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return self.count - lo
+
+    def tail(self, field, track, n):
+        # The last n values of field for track (0 based), oldest first.
+        self.lock.acquire()
+        try:
+            if track >= len(self.tracks):
+                return array('f')
+            return self.ordered(self.tracks[track][field], min(n, self.count))
+        finally:
+            self.lock.release()
+
+    def export(self, fp, seconds, now=None):
+        # Writes the samples of the last 'seconds' to fp as CSV, one row per
+        # sample, and returns how many were written.
+        if now == None:
+            now = time.monotonic()
+        self.lock.acquire()
+        n = self.countSince(now - seconds)
+        times = self.ordered(self.times, n)
+        columns = []
+        header = ["time"]
+        for ti, track in enumerate(self.tracks):
+            for f in self.fields:
+                header.append("track{}_{}".format(ti + 1, f[:-1]))
+                columns.append(self.ordered(track[f], n))
+        self.lock.release()
+
+        # Monotonic time stamps are shown as wall clock time.
+        offset = time.time() - time.monotonic()
+        w = csv.writer(fp)
+        w.writerow(header)
+        for i in range(0, n):
+            row = [format(times[i] + offset, '.3f')]
+            for c in columns:
+                row.append(format(c[i], '.6g'))
+            w.writerow(row)
+        return n
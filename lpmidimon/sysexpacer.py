@@ -0,0 +1,116 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import time
+
+# 5 pin MIDI runs at 31250 baud, 10 bits per byte.
+MIDI_WIRE_RATE = 3125.0
+
+# Legacy pacing: one upgrade message every 70 ms, whatever its size.
+LEGACY_MESSAGE_INTERVAL = 0.07
+
+class SysexPacer:
+    # Paces a sysex stream by a bytes per second budget.  The device does
+    # not acknowledge upgrade messages, but it answers a log request only
+    # after the messages queued in front of it, so the reply latency of a
+    # probe tells how far the device is behind.  The rate goes up while
+    # probes come back quickly and down when they come back late, are lost
+    # or the device logs an error.  'maxRate' bounds the rate if the link
+    # is known to be slower than the device, e.g. MIDI_WIRE_RATE for 5 pin
+    # DIN, None for no bound (USB MIDI has no wire limit, the probes find
+    # the rate).  The start is never bounded below 'startRate'.  If the
+    # first 'probeTries' probes all go unanswered the device does not reply
+    # during upgrades, and the rate stays where it is.
+    def __init__(self, startRate, maxRate=None, minRate=200.0,
+                 targetLatency=0.15, probeInterval=0.5, probeTimeout=1.0, probeTries=3):
+        if maxRate != None:
+            maxRate = max(maxRate, startRate)
+        self.rate = max(minRate, startRate)
+        self.maxRate = maxRate
+        self.minRate = minRate
+        self.targetLatency = targetLatency
+        self.probeInterval = probeInterval
+        self.probeTimeout = probeTimeout
+        self.probeTries = probeTries
+        self.nextSend = None
+        self.probing = True
+        self.probeSent = None
+        self.lastProbe = None
+        self.unanswered = 0
+        self.acks = 0
+        self.losses = 0
+        self.backoffs = 0
+
+    def legacyRate(sizes):
+        # Average bytes per second of the fixed 70 ms pacing for these
+        # message sizes.
+        if len(sizes) == 0:
+            return MIDI_WIRE_RATE
+        return sum(sizes) / (len(sizes) * LEGACY_MESSAGE_INTERVAL)
+
+    def wait(self, now=None):
+        # Seconds to wait before the next message may be sent.
+        if now == None:
+            now = time.monotonic()
+        if self.nextSend == None:
+            return 0.0
+        return max(0.0, self.nextSend - now)
+
+    def sent(self, nbytes, now=None):
+        if now == None:
+            now = time.monotonic()
+        if self.nextSend == None or self.nextSend < now:
+            self.nextSend = now
+        self.nextSend += nbytes / self.rate
+
+    def probeDue(self, now):
+        if not self.probing or self.probeSent != None:
+            return False
+        return self.lastProbe == None or now - self.lastProbe >= self.probeInterval
+
+    def probeSentAt(self, now):
+        self.probeSent = now
+        self.lastProbe = now
+
+    def probeExpired(self, now):
+        return self.probeSent != None and now - self.probeSent > self.probeTimeout
+
+    def probeAnswered(self, now):
+        self.ackReceived(now - self.probeSent)
+        self.probeSent = None
+
+    def probeLost(self):
+        # Returns True if the device fell behind, False if it just does not
+        # answer probes (probing then stops after probeTries).
+        self.probeSent = None
+        if self.acks == 0:
+            self.unanswered += 1
+            if self.unanswered >= self.probeTries:
+                self.probing = False
+            return False
+        self.ackLost()
+        return True
+
+    def ackReceived(self, latency):
+        self.acks += 1
+        if latency <= self.targetLatency:
+            self.rate *= 1.1
+            if self.maxRate != None:
+                self.rate = min(self.maxRate, self.rate)
+        elif latency > 2.0 * self.targetLatency:
+            # Slow down, and hold off until the device worked off what it
+            # is behind by.
+            self.backOff(0.7)
+            if self.nextSend != None:
+                self.nextSend += latency - self.targetLatency
+
+    def ackLost(self):
+        self.losses += 1
+        self.backOff(0.5)
+
+    def errorSeen(self):
+        self.backOff(0.5)
+
+    def backOff(self, factor):
+        self.backoffs += 1
+        self.rate = max(self.minRate, self.rate * factor)
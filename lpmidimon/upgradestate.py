@@ -0,0 +1,118 @@
+#
+# Copyright 2021 - Looperlative Audio Products, LLC
+#
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# A saved .syx position is offered for resuming for this long.
+UPGRADE_RESUME_TTL = 24 * 3600
+
+_images = {}
+_imagesLock = threading.Lock()
+_stateLock = threading.Lock()
+
+def stateFileName():
+    return str(Path.home()) + '/.lp2ctrl-upgrade.json'
+
+class UpgradeImage:
+    # Contents of an upgrade file and whatever was derived from them (the
+    # parsed sysex messages, the TFTP datagrams for a block size, ...), so
+    # that a retry does not read, parse or encode the file again.
+    def __init__(self, fileName, data, stamp):
+        self.fileName = fileName
+        self.data = data
+        self.stamp = stamp
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.encodings = {}
+        # Reentrant, an encoding may be built from another one.
+        self.lock = threading.RLock()
+
+    def encoded(self, key, build):
+        # Returns build() the first time key is asked for, the same object
+        # after that.
+        self.lock.acquire()
+        try:
+            v = self.encodings.get(key)
+            if v is None:
+                v = build()
+                self.encodings[key] = v
+            return v
+        finally:
+            self.lock.release()
+
+def loadImage(fileName):
+    # Returns the UpgradeImage of fileName, read again only if the file
+    # changed since.
+    st = os.stat(fileName)
+    stamp = (st.st_mtime_ns, st.st_size)
+    _imagesLock.acquire()
+    try:
+        image = _images.get(fileName)
+        if image is None or image.stamp != stamp:
+            with open(fileName, mode="rb") as fp:
+                image = UpgradeImage(fileName, fp.read(), stamp)
+            _images.clear()
+            _images[fileName] = image
+        return image
+    finally:
+        _imagesLock.release()
+
+def _readStates():
+    try:
+        with open(stateFileName()) as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _writeStates(states):
+    with open(stateFileName(), 'w') as fp:
+        json.dump(states, fp)
+
+def loadState(device):
+    # Returns the saved upgrade state of device, or None.  The state is a
+    # dict with digest, file, position (messages sent) and total.
+    _stateLock.acquire()
+    try:
+        state = _readStates().get(device)
+    finally:
+        _stateLock.release()
+    if state is None or time.time() - state.get('time', 0) > UPGRADE_RESUME_TTL:
+        return None
+    return state
+
+def resumePosition(device, image):
+    # Position an interrupted upgrade of device with image stopped at, or 0.
+    state = loadState(device)
+    if state is None or state.get('digest') != image.digest:
+        return 0
+    position = state.get('position', 0)
+    if position <= 0 or position >= state.get('total', 0):
+        return 0
+    return position
+
+def saveState(device, image, position, total):
+    _stateLock.acquire()
+    try:
+        states = _readStates()
+        states[device] = {'digest': image.digest,
+                          'file': image.fileName,
+                          'position': position,
+                          'total': total,
+                          'time': time.time()}
+        _writeStates(states)
+    finally:
+        _stateLock.release()
+
+def clearState(device):
+    _stateLock.acquire()
+    try:
+        states = _readStates()
+        if device in states:
+            del states[device]
+            _writeStates(states)
+    finally:
+        _stateLock.release()